@@ -27,7 +27,7 @@ setup(name='salt',
     author_email='',
     url='',
     license='',
-    packages=find_packages('src'),
+    packages=find_packages('src', exclude=['benchmarks']),
     package_dir = {'': 'src'},include_package_data=True,
     zip_safe=False,
     install_requires=install_requires,
@@ -0,0 +1,22 @@
+'''
+
+benchmarks
+~~~~~~~~~~
+
+Benchmarks of targeting over reproducible synthetic fleets. They time
+parse, match and check for a corpus of queries, which uses every prefix of
+minion_targeting, and measure memory of the fleet indexes.
+
+From the src directory:
+
+.. code:: bash
+
+    python -m benchmarks --size 10000 --output baseline.json
+    python -m benchmarks --size 10000 --baseline baseline.json
+
+The second run exits with status 1 when some timing regressed by more
+than the tolerance.
+
+This package is not installed with salt.
+
+'''
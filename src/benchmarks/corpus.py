@@ -0,0 +1,68 @@
+'''
+
+benchmarks.corpus
+~~~~~~~~~~~~~~~~~
+
+Queries timed by the benchmarks. They use every prefix registered into
+minion_targeting, alone and within compound queries.
+
+'''
+
+from benchmarks.fleet import minion_id
+
+__all__ = [
+    'NODEGROUPS',
+    'QUERIES',
+    'prefixes',
+]
+
+#: nodegroups used by N@ queries
+NODEGROUPS = {
+    'webservers': 'web-* and G@os_family:Debian',
+    'prod_db': 'db-* and I@env:prod',
+}
+
+#: names and texts of queries
+QUERIES = [
+    ('glob_literal', minion_id(42)),
+    ('glob_prefix', 'web-*'),
+    ('glob_suffix', '*.par1.example.com'),
+    ('list', 'L@{0},{1},db-0000*'.format(minion_id(7), minion_id(1001))),
+    ('pcre', r'E@(web|db)-00001[0-9]+\..*'),
+    ('grain', 'G@os:Ubuntu'),
+    ('grain_nested', 'G@salt:version:2017.*'),
+    ('grain_list', 'G@roles:cache'),
+    ('grain_pcre', r'P@osrelease:1[46]\..*'),
+    ('pillar', 'I@env:prod'),
+    ('pillar_nested', 'I@users:alice:groups:sudo'),
+    ('subnet', 'S@10.1.0.0/16'),
+    ('subnet_address', 'S@10.2.0.12'),
+    ('exsel', 'X@test.ping'),
+    ('local_store', 'D@channel:beta'),
+    ('range', 'R@%web'),
+    ('range_intersection', 'R@%par1,&%db'),
+    ('nodegroup', 'N@webservers'),
+    ('compound_and', 'G@os:Ubuntu and I@env:prod and not S@10.1.0.0/16'),
+    ('compound_or', 'web-* or (db-* and G@virtual:kvm) or I@role:lb'),
+    ('compound_not', 'not (G@os:Windows or I@env:dev) and R@%ams2'),
+    ('compound_nodegroup', 'N@prod_db or (N@webservers and not X@test.ping)'),
+    ('compound_redundant',
+     'G@os:Ubuntu or (G@os:Ubuntu and I@env:prod) or '
+     '(cache-* and not cache-*)'),
+]
+
+
+def prefixes(query, queries=QUERIES):
+    """
+    Returns the prefixes of query which are used by queries, None stands
+    for the default rule.
+    """
+    used = set()
+    for name, text in queries:
+        for word in text.replace('(', ' ').replace(')', ' ').split():
+            prefix, sep, value = word.partition('@')
+            if sep and prefix in query.registry:
+                used.add(prefix)
+            elif word not in ('and', 'or', 'not'):
+                used.add(None)
+    return used
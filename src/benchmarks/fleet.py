@@ -0,0 +1,151 @@
+'''
+
+benchmarks.fleet
+~~~~~~~~~~~~~~~~
+
+Synthetic fleets. The same seed always generates the same minions.
+
+'''
+
+import random
+
+__all__ = [
+    'Minion',
+    'make_clusters',
+    'make_minions',
+]
+
+ROLES = ['web', 'db', 'cache', 'queue', 'lb', 'worker']
+DATACENTERS = ['par1', 'ams2', 'nyc3', 'sfo1']
+SYSTEMS = [
+    ('Ubuntu', 'Debian', ['14.04', '16.04', '18.04']),
+    ('Debian', 'Debian', ['8.11', '9.5']),
+    ('CentOS', 'RedHat', ['6.10', '7.5']),
+    ('Windows', 'Windows', ['2012ServerR2', '2016Server']),
+]
+VIRTUALS = ['kvm', 'VMware', 'physical', 'xen']
+USERS = ['alice', 'bob', 'carol', 'dave', 'eve']
+GROUPS = ['sudo', 'adm', 'www-data', 'docker']
+FEATURES = ['search', 'billing', 'export', 'beta']
+
+#: rates of minions which miss some of their data
+MISSING_GRAINS = 0.02
+MISSING_PILLAR = 0.03
+MISSING_FUNCTIONS = 0.05
+MISSING_FQDN = 0.01
+
+
+class Minion(object):
+    """
+    Subject with everything rules look for.
+    """
+
+    def __init__(self, id, grains, pillar, ipv4, fqdn, functions, data):
+        self.id = id
+        self.grains = grains
+        self.pillar = pillar
+        self.ipv4 = ipv4
+        self.fqdn = fqdn
+        self.functions = functions
+        self.data = data
+
+    def __repr__(self):
+        return 'Minion({0!r})'.format(self.id)
+
+
+def ping():
+    return True
+
+
+def minion_id(i):
+    """
+    Returns the id of the i-th minion, which does not depend on the seed.
+    """
+    role = ROLES[i % len(ROLES)]
+    dc = DATACENTERS[(i // len(ROLES)) % len(DATACENTERS)]
+    return '{0}-{1:06d}.{2}.example.com'.format(role, i, dc)
+
+
+def make_minion(i, rng):
+    id = minion_id(i)
+    role, dc = id.split('-')[0], id.split('.')[1]
+    dc_num = DATACENTERS.index(dc) + 1
+    os, os_family, releases = rng.choice(SYSTEMS)
+    addrs = ['127.0.0.1',
+             '10.{0}.{1}.{2}'.format(dc_num, (i >> 8) & 255, i & 255)]
+    if rng.random() < 0.3:
+        addrs.append('172.16.{0}.{1}'.format(rng.randint(0, 255),
+                                             rng.randint(1, 254)))
+    fqdns = [id]
+    if rng.random() < 0.2:
+        fqdns.append('{0}.backup.example.com'.format(id.split('.')[0]))
+
+    grains = {
+        'id': id,
+        'os': os,
+        'os_family': os_family,
+        'osrelease': rng.choice(releases),
+        'kernel': 'Windows' if os == 'Windows' else 'Linux',
+        'cpus': rng.choice([1, 2, 4, 8, 16, 32]),
+        'mem_total': rng.choice([1024, 2048, 4096, 8192, 16384, 65536]),
+        'virtual': rng.choice(VIRTUALS),
+        'datacenter': dc,
+        'roles': [role] + rng.sample(ROLES, rng.randint(0, 2)),
+        'fqdns': fqdns,
+        'ip_interfaces': {
+            'lo': addrs[:1],
+            'eth0': addrs[1:2],
+            'eth1': addrs[2:],
+        },
+        'salt': {
+            'version': rng.choice(['2016.11.9', '2017.7.8', '2018.3.3']),
+            'master': 'salt.{0}.example.com'.format(dc),
+        },
+        'disks': [{'name': name, 'size': rng.choice([20, 100, 500])}
+                  for name in ['sda', 'sdb'][:rng.randint(1, 2)]],
+    }
+    pillar = {
+        'role': role,
+        'env': rng.choice(['prod', 'prod', 'staging', 'dev']),
+        'users': dict((user, {'uid': 1000 + n,
+                              'groups': rng.sample(GROUPS, rng.randint(0, 2))})
+                      for n, user in enumerate(USERS)
+                      if rng.random() < 0.5),
+        'app': {
+            'version': '{0}.{1}'.format(rng.randint(1, 3), rng.randint(0, 9)),
+            'features': rng.sample(FEATURES, rng.randint(0, 3)),
+        },
+    }
+    functions = {'test.ping': ping}
+    if rng.random() < MISSING_GRAINS:
+        grains = None
+    if rng.random() < MISSING_PILLAR:
+        pillar = None
+    if rng.random() < MISSING_FUNCTIONS:
+        functions = None
+    fqdn = None if rng.random() < MISSING_FQDN else id
+    data = {'channel': rng.choice(['stable', 'beta']),
+            'deployed': rng.choice(['yes', 'no'])}
+    return Minion(id, grains, pillar, addrs, fqdn, functions, data)
+
+
+def make_minions(count, seed=0):
+    """
+    Returns count minions, generated from seed.
+    """
+    rng = random.Random(seed)
+    return [make_minion(i, rng) for i in range(count)]
+
+
+def make_clusters(minions):
+    """
+    Returns range clusters of minions, by role and by datacenter, for
+    salt.utils.yahoo_range.LocalProvider.
+    """
+    clusters = {}
+    for minion in minions:
+        role, dc = minion.id.split('-')[0], minion.id.split('.')[1]
+        for name in (role, dc):
+            hosts = clusters.setdefault(name, {'CLUSTER': []})['CLUSTER']
+            hosts.append(minion.id)
+    return clusters
@@ -0,0 +1,206 @@
+'''
+
+benchmarks.runner
+~~~~~~~~~~~~~~~~~
+
+Runs the benchmarks, and compares their results with a baseline.
+
+Results are plain data, dumped as JSON:
+
+- ``meta`` tells how they were obtained
+- ``timings`` maps names to the best and median seconds of their runs
+- ``memory`` maps names to peak bytes allocated, when tracemalloc exists
+
+Cold timings use a rule freshly parsed, with empty caches and statistics,
+warm ones reuse it.
+
+'''
+
+from __future__ import print_function
+
+from timeit import default_timer
+import argparse
+import json
+import platform
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from benchmarks.corpus import NODEGROUPS, QUERIES, prefixes
+from benchmarks.fleet import make_clusters, make_minions
+from salt.targeting import Fleet, FleetSnapshot, minion_targeting
+from salt.utils.yahoo_range import LocalProvider
+
+__all__ = [
+    'compare',
+    'main',
+    'run',
+]
+
+#: timings below this many seconds are too noisy to be compared
+FLOOR = 1e-3
+
+
+def timed(func, repeat):
+    """
+    Returns the best and the median seconds of repeat calls of func.
+    """
+    times = []
+    for i in range(repeat):
+        started = default_timer()
+        func()
+        times.append(default_timer() - started)
+    times.sort()
+    return {'best': times[0], 'median': times[len(times) // 2],
+            'runs': repeat}
+
+
+def peak_memory(func):
+    """
+    Returns the result of func, and the peak bytes it allocated.
+    """
+    if tracemalloc is None:
+        return func(), None
+    tracemalloc.start()
+    try:
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def run(size=10000, seed=0, repeat=3, sample=1000, names=None, log=None):
+    """
+    Runs the benchmarks over size minions, and returns their results.
+
+    names restricts the queries of the corpus which are timed, log is
+    called with a line of progress per query.
+    """
+    query = minion_targeting
+    missing = set(query.registry) - prefixes(query)
+    if missing:
+        raise ValueError('corpus misses prefixes {0}'.format(
+            sorted(missing)))
+
+    timings, memory = {}, {}
+    # memory is traced apart, tracing slows allocations down
+    timings['fleet.generate'] = timed(lambda: make_minions(size, seed), 1)
+    minions, memory['fleet.generate'] = peak_memory(
+        lambda: make_minions(size, seed))
+    timings['fleet.index'] = timed(lambda: Fleet(minions), 1)
+    fleet, memory['fleet.index'] = peak_memory(lambda: Fleet(minions))
+    timings['fleet.snapshot'] = timed(lambda: FleetSnapshot(minions), 1)
+    snapshot, memory['fleet.snapshot'] = peak_memory(
+        lambda: FleetSnapshot(minions))
+
+    opts = {'macros': NODEGROUPS,
+            'provider': LocalProvider(make_clusters(minions))}
+    subset = minions[:sample]
+    for name, text in QUERIES:
+        if names and name not in names:
+            continue
+
+        def parse_cold():
+            query.cache.clear()
+            return query.parse(text, **opts)
+
+        timings['parse.cold.' + name] = timed(parse_cold, repeat)
+        timings['parse.warm.' + name] = timed(
+            lambda: query.parse(text, **opts), repeat)
+
+        rule = parse_cold()
+        timings['check.cold.' + name] = timed(lambda: rule.check(minions), 1)
+        timings['check.warm.' + name] = timed(lambda: rule.check(minions),
+                                              repeat)
+        timings['check.fleet.' + name] = timed(lambda: rule.check(fleet),
+                                               repeat)
+        timings['check.snapshot.' + name] = timed(
+            lambda: rule.check_fleet(snapshot), repeat)
+        timings['match.' + name] = timed(
+            lambda: [rule.match(minion) for minion in subset], repeat)
+        if log is not None:
+            log('{0}: {1:.4f}s'.format(
+                name, timings['check.warm.' + name]['best']))
+
+    return {
+        'meta': {
+            'size': size,
+            'seed': seed,
+            'repeat': repeat,
+            'sample': len(subset),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+        },
+        'timings': timings,
+        'memory': dict((key, value) for key, value in memory.items()
+                       if value is not None),
+    }
+
+
+def compare(results, baseline, tolerance=0.25, floor=FLOOR):
+    """
+    Returns the regressions of results over baseline, as (name, before,
+    after) tuples of the best timings and peak memory which grew by more
+    than tolerance.
+    """
+    regressions = []
+    for name, timing in sorted(results['timings'].items()):
+        before = baseline.get('timings', {}).get(name)
+        if before is None or max(before['best'], timing['best']) < floor:
+            continue
+        if timing['best'] > before['best'] * (1 + tolerance):
+            regressions.append((name, before['best'], timing['best']))
+    for name, peak in sorted(results.get('memory', {}).items()):
+        before = baseline.get('memory', {}).get(name)
+        if before is not None and peak > before * (1 + tolerance):
+            regressions.append(('memory.' + name, before, peak))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='benchmarks',
+        description='Times targeting over a synthetic fleet.')
+    parser.add_argument('--size', type=int, default=10000,
+                        help='count of minions (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each timing (default: %(default)s)')
+    parser.add_argument('--sample', type=int, default=1000,
+                        help='minions matched one by one')
+    parser.add_argument('--query', action='append', dest='names',
+                        help='name of a query of the corpus to time')
+    parser.add_argument('--output', help='file where results are written')
+    parser.add_argument('--baseline', help='results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='slowdown ratio accepted (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    def log(line):
+        print(line, file=sys.stderr)
+
+    results = run(args.size, args.seed, args.repeat, args.sample,
+                  args.names, log)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline.get('meta', {}).get('size') != args.size:
+            log('baseline was run over {0} minions'.format(
+                baseline.get('meta', {}).get('size')))
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            log('REGRESSION {0}: {1:.6g} -> {2:.6g}'.format(name, before,
+                                                          after))
+        if regressions:
+            return 1
+    return 0
@@ -148,6 +148,17 @@ else:
     def url_unquote_native(v, encoding='utf-8', errors='replace'):
         return native_(url_unquote_text(v, encoding, errors))
 
+if PY3:
+    from collections import namedtuple as _namedtuple
+    from inspect import getfullargspec as _getfullargspec
+    ArgSpec = _namedtuple('ArgSpec', 'args varargs keywords defaults')
+
+    def getargspec(func):
+        spec = _getfullargspec(func)
+        return ArgSpec(spec.args, spec.varargs, spec.varkw, spec.defaults)
+else:
+    from inspect import getargspec
+
 if PY3:
     zip = zip
 else:
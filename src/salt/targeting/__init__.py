@@ -9,9 +9,17 @@ salt.targeting
 import logging
 log = logging.getLogger(__name__)
 
+from .explain import *
+from .fleet import *
+from .loader import *
+from .metrics import *
+from .optimizer import *
+from .parallel import *
 from .parser import *
 from .query import *
 from .rules import *
+from .snapshot import *
+from .stats import *
 from .subjects import *
 
 #: defines minion targeting
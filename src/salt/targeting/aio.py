@@ -0,0 +1,205 @@
+'''
+
+salt.targeting.aio
+~~~~~~~~~~~~~~~~~~
+
+Coroutine versions of Query.parse, Rule.check and Rule.match, for masters
+running an asyncio event loop. This module requires Python 3, it is
+imported by these methods only.
+
+Rules themselves stay synchronous. Before evaluating, the blocking work
+of a rule tree is done concurrently into the executor of the loop:
+
+- the hosts of every YahooRangeRule leaf are fetched
+- the minion data cache of CheckableMinion subjects is loaded
+
+Results are then shared with the rules through an evaluation memo.
+Exsel functions run arbitrary code, so they are only called for the
+subjects which reach their leaf: coroutines drive the same walks of
+composite rules as their synchronous evaluation, see
+salt.targeting.rules.drive. Exsel functions are called concurrently,
+honouring their exsel_timeout, and subtrees without ExselRule leaves
+are evaluated synchronously.
+
+.. code:: python
+
+    rule = await minion_targeting.aparse('R@%web and X@test.ping')
+    minions = await rule.acheck(minions)
+
+'''
+
+import asyncio
+from functools import partial
+from timeit import default_timer
+
+from salt.targeting import metrics
+from salt.targeting.rules import AllRule, AnyRule, NotRule
+from salt.targeting.rules import ExselRule, YahooRangeRule
+from salt.targeting.rules import evaluation, keep, mark_doubt
+from salt.targeting.snapshot import FleetSnapshot
+from salt.targeting.stats import measured, measured_select
+from salt.targeting.subjects import CheckableMinion
+from salt.utils.pool import TIMEOUT
+
+__all__ = [
+    'acheck',
+    'amatch',
+    'aparse',
+]
+
+
+def leaves(rule):
+    """
+    Yields the leaves of rule.
+    """
+    if isinstance(rule, (AllRule, AnyRule)):
+        for child in rule.rules:
+            yield from leaves(child)
+    elif isinstance(rule, NotRule):
+        yield from leaves(rule.rule)
+    else:
+        yield rule
+
+
+def has_exsel(rule):
+    return any(isinstance(leaf, ExselRule) for leaf in leaves(rule))
+
+
+async def run(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args))
+
+
+async def call(rule, obj):
+    """
+    Calls the exsel function of obj, with the timeout of rule.
+    """
+    if rule.timeout is None:
+        return await run(rule.call, obj)
+    try:
+        return await asyncio.wait_for(run(rule.call, obj), rule.timeout)
+    except asyncio.TimeoutError:
+        return TIMEOUT
+
+
+async def prefetch(rule, objs):
+    """
+    Returns the memo of the blocking results needed to evaluate rule
+    over objs, which are all computed concurrently. Exsel functions are
+    left to exsel.
+    """
+    memo = {}
+
+    async def load(minion):
+        await run(getattr, minion, 'cache')
+
+    async def fetch(leaf):
+        memo[leaf.key()] = await run(leaf.fetch)
+
+    tasks = []
+    for obj in objs:
+        if isinstance(obj, CheckableMinion) and 'cache' not in obj.__dict__:
+            tasks.append(load(obj))
+    for leaf in set(leaves(rule)):
+        if isinstance(leaf, YahooRangeRule):
+            tasks.append(fetch(leaf))
+    await asyncio.gather(*tasks)
+    return memo
+
+
+async def exsel(leaf, objs, memo):
+    """
+    Calls the exsel function of leaf concurrently for objs, unless memo
+    has their results already.
+    """
+    async def fetch(obj, key):
+        memo[key] = await call(leaf, obj)
+
+    tasks = []
+    for obj in objs:
+        key = leaf.key(obj)
+        if obj.functions is not None and key not in memo:
+            keep(memo, obj)
+            tasks.append(fetch(obj, key))
+    await asyncio.gather(*tasks)
+
+
+async def drive(steps, evaluate, memo):
+    """
+    Coroutine version of salt.targeting.rules.drive, which awaits
+    evaluate(child, arg, memo) for every child of the walk.
+    """
+    with evaluation(memo):
+        rule, arg = next(steps)
+    while rule is not None:
+        result = await evaluate(rule, arg, memo)
+        with evaluation(memo):
+            rule, arg = steps.send(result)
+    return arg
+
+
+async def aselect(rule, objs, memo):
+    """
+    Coroutine version of measured_select(rule, objs), which evaluates
+    ExselRule leaves over the subjects left by the previous rules only.
+    """
+    if not has_exsel(rule):
+        with evaluation(memo):
+            return measured_select(rule, objs)
+    if isinstance(rule, ExselRule):
+        await exsel(rule, objs, memo)
+        with evaluation(memo):
+            return measured_select(rule, objs)
+    started = default_timer()
+    matched, unknown = await drive(rule.select_walk(objs), aselect, memo)
+    measured(rule, len(objs), matched, unknown, default_timer() - started)
+    return matched, unknown
+
+
+async def amatch_rule(rule, obj, memo):
+    """
+    Coroutine version of rule.match(obj), which short-circuits like it.
+    """
+    if not has_exsel(rule):
+        with evaluation(memo):
+            return rule.match(obj)
+    if isinstance(rule, ExselRule):
+        await exsel(rule, [obj], memo)
+        with evaluation(memo):
+            return rule.match(obj)
+    return await drive(rule.match_walk(obj), amatch_rule, memo)
+
+
+async def acheck(rule, objs):
+    """
+    Coroutine version of rule.check(objs).
+    """
+    if isinstance(objs, FleetSnapshot):
+        # exsel cannot be decided over snapshots, nothing is called
+        memo = await prefetch(rule, ())
+        with evaluation(memo):
+            return rule.check_fleet(objs)
+    started = default_timer()
+    if not hasattr(objs, '__len__'):
+        objs = list(objs)
+    memo = await prefetch(rule, objs)
+    matched, unknown = await aselect(rule, objs, memo)
+    results = matched | set(mark_doubt(obj) for obj in unknown)
+    metrics.checked(started, len(results), len(unknown))
+    return results
+
+
+async def amatch(rule, obj):
+    """
+    Coroutine version of rule.match(obj).
+    """
+    memo = await prefetch(rule, [obj])
+    return await amatch_rule(rule, obj, memo)
+
+
+async def aparse(query, text, **opts):
+    """
+    Coroutine version of query.parse(text, **opts). Long queries are
+    parsed into the executor of the loop.
+    """
+    return await run(partial(query.parse, text, **opts))
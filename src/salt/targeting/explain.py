@@ -0,0 +1,168 @@
+'''
+
+salt.targeting.explain
+~~~~~~~~~~~~~~~~~~~~~~
+
+Plans of rules, as returned by Query.explain. They tell in which order
+children are evaluated, which index each leaf uses, and how much it cost
+per subject so far:
+
+.. code:: python
+
+    >>> print(minion_targeting.explain('web* and G@os:Ubuntu', fleet))
+    and
+      1. web* index=ids cost=0.41us selectivity=0.250
+      2. G@os:Ubuntu index=paths cost=? selectivity=?
+
+With analyze, the rule is checked over the subjects, and each node also
+tells how many subjects it evaluated, kept and could not decide, and the
+time it spent doing so.
+
+'''
+
+from salt.targeting.fleet import Fleet
+from salt.targeting.rules import AllRule, AnyRule, NotRule, evaluation
+from salt.targeting.rules import GlobRule, PCRERule, GrainRule, PillarRule
+from salt.targeting.rules import GrainPCRERule, SubnetIPRule
+from salt.targeting.rules import YahooRangeRule
+from salt.targeting.snapshot import FleetSnapshot
+from salt.targeting.stats import measured_bitmap, measured_select, tracing
+from salt.utils.bitmap import count
+
+__all__ = [
+    'Plan',
+]
+
+#: indexes of Fleet used by leaves, others scan subjects
+FLEET_INDEXES = [
+    (GlobRule, 'ids'),
+    ((GrainRule, PillarRule), 'paths'),
+    (SubnetIPRule, 'ipv4'),
+    (YahooRangeRule, 'range'),
+]
+
+#: indexes of FleetSnapshot used by leaves, others cannot be decided
+SNAPSHOT_INDEXES = [
+    ((GlobRule, PCRERule), 'ids'),
+    ((GrainRule, PillarRule, GrainPCRERule), 'columns'),
+    (SubnetIPRule, 'ipv4'),
+    (YahooRangeRule, 'fqdns'),
+]
+
+
+def index_of(rule, objs):
+    """
+    Returns the name of the index used by rule over objs.
+    """
+    if isinstance(objs, FleetSnapshot):
+        indexes, default = SNAPSHOT_INDEXES, 'undecided'
+    elif objs is None or isinstance(objs, Fleet):
+        indexes, default = FLEET_INDEXES, 'scan'
+    else:
+        return 'range' if isinstance(rule, YahooRangeRule) else 'scan'
+    for cls, index in indexes:
+        if isinstance(rule, cls):
+            return index
+    return default
+
+
+class Plan(object):
+    """
+    Node of the plan of a rule.
+
+    cost is the mean seconds spent per subject by rule, and selectivity
+    the fraction of subjects it kept. They are None until rule has been
+    evaluated as the child of another rule. trace is set by analyze.
+    """
+
+    def __init__(self, rule, label, order=None, index=None, children=()):
+        self.rule = rule
+        self.label = label
+        self.order = order
+        self.index = index
+        self.children = list(children)
+        self.trace = None
+        self.estimate()
+
+    def estimate(self):
+        stats = self.rule.stats
+        self.cost = stats.cost if stats.samples else None
+        self.selectivity = stats.selectivity if stats.samples else None
+
+    @classmethod
+    def build(cls, query, rule, objs=None, order=None):
+        """
+        Returns the plan of rule over objs, rendered by query.
+        """
+        if isinstance(rule, AllRule):
+            children = [cls.build(query, child, objs, i)
+                        for i, child in enumerate(rule.ordered(), 1)]
+            return cls(rule, 'and', order, children=children)
+        if isinstance(rule, AnyRule):
+            matcher, rules = rule.merged
+            children = []
+            if matcher:
+                # merged leaves are evaluated at once, by a single matcher
+                merged = sorted(set(rule.rules) - set(rules))
+                children = [cls(child, query.querify(child), 1, 'merged')
+                            for child in merged]
+            start = 2 if matcher else 1
+            children.extend(cls.build(query, child, objs, i)
+                            for i, child in enumerate(rule.ordered(rules),
+                                                      start))
+            return cls(rule, 'or', order, children=children)
+        if isinstance(rule, NotRule):
+            children = [cls.build(query, rule.rule, objs, 1)]
+            return cls(rule, 'not', order, children=children)
+        return cls(rule, query.querify(rule), order, index_of(rule, objs))
+
+    def analyze(self, objs):
+        """
+        Checks the rule over objs, and traces every node of the plan.
+        """
+        with evaluation():
+            with tracing() as traces:
+                if isinstance(objs, FleetSnapshot):
+                    measured_bitmap(self.rule, objs, count(objs.everything))
+                else:
+                    if not isinstance(objs, Fleet):
+                        objs = list(objs)
+                    measured_select(self.rule, objs)
+        for node in self.walk():
+            node.trace = traces.get(id(node.rule))
+            node.estimate()
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+    def lines(self, depth=0):
+        parts = [self.label]
+        if self.order is not None:
+            parts.insert(0, '{0}.'.format(self.order))
+        if self.index is not None:
+            parts.append('index={0}'.format(self.index))
+        if not self.children:
+            parts.append('cost={0}'.format(
+                '?' if self.cost is None
+                else '{0:.2f}us'.format(self.cost * 1e6)))
+            parts.append('selectivity={0}'.format(
+                '?' if self.selectivity is None
+                else '{0:.3f}'.format(self.selectivity)))
+        trace = self.trace
+        if trace is not None:
+            parts.append('in={0} out={1} doubtful={2} time={3:.3f}ms'.format(
+                trace.objs_in, trace.objs_out, trace.doubtful,
+                trace.elapsed * 1e3))
+        yield '  ' * depth + ' '.join(parts)
+        for child in self.children:
+            for line in child.lines(depth + 1):
+                yield line
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+    def __repr__(self):
+        return '<Plan {0}>'.format(self.label)
@@ -0,0 +1,519 @@
+'''
+
+salt.targeting.fleet
+~~~~~~~~~~~~~~~~~~~~
+
+A fleet is a collection of subjects which carries indexes over their
+data, so that rules resolve candidates without scanning every subject.
+
+.. code:: python
+
+    fleet = Fleet(minions)
+    rule.check(fleet)
+
+'''
+
+from bisect import bisect_left, bisect_right
+import copy
+import socket
+
+from salt._compat import string_types
+from salt.utils.matching import Mapping, glob_compile, is_literal
+from salt.utils.matching import literal_prefix, literal_suffix
+from salt.utils.matching import cidr_range, ip_to_int
+from salt.utils.bitmap import from_positions, to_positions, full
+import logging
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Fleet',
+    'FleetIndex',
+    'IdIndex',
+    'IPv4Index',
+    'RadixTrie',
+]
+
+#: above this count of delimiters, expr are not resolved by the index
+MAX_PARTS = 8
+
+
+def compositions(parts):
+    """
+    Yields all the ways to group consecutive parts.
+    """
+    count = len(parts)
+    for mask in range(2 ** (count - 1)):
+        groups, current = [], [parts[0]]
+        for i in range(1, count):
+            if mask & (1 << (i - 1)):
+                groups.append(current)
+                current = [parts[i]]
+            else:
+                current.append(parts[i])
+        groups.append(current)
+        yield groups
+
+
+def splits(expr, delim):
+    """
+    Yields all (path, pattern) couples that dig may explore for expr.
+    pattern is None when the whole expr is consumed by keys.
+    """
+    for groups in compositions(expr.split(delim)):
+        keys = tuple(delim.join(group) for group in groups)
+        yield keys, None
+        if len(keys) > 1:
+            yield keys[:-1], keys[-1]
+
+
+def token(value):
+    if isinstance(value, string_types):
+        return value
+    return str(value)
+
+
+class FleetIndex(object):
+    """
+    Inverted index of subject data.
+
+    It maps each flattened key path and each scalar value found under it
+    to the ids of the subjects which have it. Lists are walked like dig
+    does, so their elements are indexed under the path of the list.
+    """
+
+    def __init__(self, subjects=(), attrs=('grains', 'pillar')):
+        self.attrs = attrs
+        self.values = dict((attr, {}) for attr in attrs)
+        self.missing = dict((attr, set()) for attr in attrs)
+        self.sorted = {}
+        for subject in subjects:
+            self.add(subject)
+
+    def add(self, subject):
+        for attr in self.attrs:
+            data = getattr(subject, attr, None)
+            if data is None:
+                self.missing[attr].add(subject.id)
+            else:
+                for path, value in self.walk(data, ()):
+                    tokens = self.values[attr].setdefault(path, {})
+                    if value not in tokens:
+                        tokens[value] = set()
+                        self.sorted.pop((attr, path), None)
+                    tokens[value].add(subject.id)
+
+    def discard(self, subject):
+        """
+        Removes subject, which must hold the data it was added with.
+        """
+        for attr in self.attrs:
+            data = getattr(subject, attr, None)
+            if data is None:
+                self.missing[attr].discard(subject.id)
+                continue
+            values = self.values[attr]
+            for path, value in self.walk(data, ()):
+                ids = values.get(path, {}).get(value)
+                if ids is None:
+                    continue
+                ids.discard(subject.id)
+                if not ids:
+                    del values[path][value]
+                    self.sorted.pop((attr, path), None)
+                    if not values[path]:
+                        del values[path]
+
+    def walk(self, data, path):
+        """
+        Yields all the (path, token) couples of data.
+        """
+        if isinstance(data, list):
+            for element in data:
+                for couple in self.walk(element, path):
+                    yield couple
+        if isinstance(data, Mapping):
+            for key, value in data.items():
+                for couple in self.walk(value, path + (key,)):
+                    yield couple
+        elif path:
+            yield path, token(data)
+
+    def tokens(self, attr, path):
+        """
+        Returns the sorted values of path.
+        """
+        key = attr, path
+        if key not in self.sorted:
+            self.sorted[key] = sorted(self.values[attr].get(path, ()))
+        return self.sorted[key]
+
+    def lookup(self, attr, expr, delim):
+        """
+        Resolves the glob expr, or returns None if it has too many parts.
+
+        Returns the ids of the subjects which match, and the ids of the ones
+        which must be verified against their data, because they have a key
+        equal to a whole part of expr.
+        """
+        if expr.count(delim) >= MAX_PARTS:
+            return None
+        values = self.values[attr]
+        matched, unsure = set(), set()
+        for path, pattern in splits(expr, delim):
+            tokens = values.get(path)
+            if not tokens:
+                continue
+            if pattern is None:
+                for ids in tokens.values():
+                    unsure.update(ids)
+            elif is_literal(pattern):
+                matched.update(tokens.get(pattern, ()))
+            else:
+                match = glob_compile(pattern).match
+                prefix = literal_prefix(pattern)
+                ordered = self.tokens(attr, path)
+                for i in range(bisect_left(ordered, prefix), len(ordered)):
+                    if not ordered[i].startswith(prefix):
+                        break
+                    if match(ordered[i]):
+                        matched.update(tokens[ordered[i]])
+        return matched - unsure, unsure
+
+
+class IPv4Index(object):
+    """
+    Sorted array of all subject IPv4 addresses, as integers.
+
+    A network is resolved by bisecting its lowest and highest addresses.
+    """
+
+    def __init__(self, subjects=()):
+        self.addrs = []
+        self.owners = []
+        self.missing = set()
+        pairs = []
+        for subject in subjects:
+            pairs.extend(self.parse(subject))
+        pairs.sort()
+        for addr, id in pairs:
+            self.addrs.append(addr)
+            self.owners.append(id)
+
+    def add(self, subject):
+        for addr, id in self.parse(subject):
+            i = bisect_right(self.addrs, addr)
+            self.addrs.insert(i, addr)
+            self.owners.insert(i, id)
+
+    def discard(self, subject):
+        """
+        Removes subject, which must hold the addresses it was added with.
+        """
+        self.missing.discard(subject.id)
+        for addr, id in self.pairs(subject):
+            i = bisect_left(self.addrs, addr)
+            while i < len(self.addrs) and self.addrs[i] == addr:
+                if self.owners[i] == id:
+                    del self.addrs[i]
+                    del self.owners[i]
+                else:
+                    i += 1
+
+    def parse(self, subject):
+        if getattr(subject, 'ipv4', None) is None:
+            self.missing.add(subject.id)
+        return self.pairs(subject)
+
+    def pairs(self, subject):
+        ipv4 = getattr(subject, 'ipv4', None)
+        if ipv4 is None:
+            return []
+        if isinstance(ipv4, string_types):
+            ipv4 = [ipv4]
+        pairs = []
+        for ipaddr in ipv4:
+            try:
+                pairs.append((ip_to_int(ipaddr), subject.id))
+            except (socket.error, TypeError):
+                log.debug('{0} is not an IPv4 of {1}'.format(
+                    repr(ipaddr), subject.id))
+        return pairs
+
+    def lookup(self, expr):
+        """
+        Returns the ids of the subjects which have an address into expr,
+        or None if expr is not an address nor a network.
+        """
+        try:
+            low, high = cidr_range(expr)
+        except ValueError:
+            return None
+        start = bisect_left(self.addrs, low)
+        stop = bisect_right(self.addrs, high, start)
+        return set(self.owners[start:stop])
+
+
+class Node(object):
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = None
+
+
+class RadixTrie(object):
+    """
+    Path compressed trie, which maps keys to sets of values.
+
+    Each edge is labelled by a string, and children of a node are keyed by
+    the first character of their label.
+    """
+
+    def __init__(self):
+        self.root = Node()
+
+    def add(self, key, value):
+        node, i = self.root, 0
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None:
+                leaf = Node()
+                node.children[key[i]] = key[i:], leaf
+                node, i = leaf, len(key)
+                break
+            label, child = edge
+            common = 0
+            limit = min(len(label), len(key) - i)
+            while common < limit and label[common] == key[i + common]:
+                common += 1
+            if common < len(label):
+                # split the edge
+                middle = Node()
+                middle.children[label[common]] = label[common:], child
+                node.children[key[i]] = label[:common], middle
+                child = middle
+            node, i = child, i + common
+        if node.values is None:
+            node.values = set()
+        node.values.add(value)
+
+    def discard(self, key, value):
+        node = self.find(key)
+        if node is not None and node.values:
+            node.values.discard(value)
+
+    def find(self, key, prefix=False):
+        """
+        Returns the node of key. If prefix is set, key may end into the
+        label of the returned node.
+        """
+        node, i = self.root, 0
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None:
+                return None
+            label, child = edge
+            if key.startswith(label, i):
+                node, i = child, i + len(label)
+            elif prefix and label.startswith(key[i:]):
+                return child
+            else:
+                return None
+        return node
+
+    def get(self, key):
+        node = self.find(key)
+        return set(node.values or ()) if node else set()
+
+    def prefixed(self, prefix):
+        """
+        Returns the values of all the keys starting with prefix.
+        """
+        found = set()
+        node = self.find(prefix, prefix=True)
+        pending = [node] if node else []
+        while pending:
+            node = pending.pop()
+            if node.values:
+                found.update(node.values)
+            pending.extend(child for label, child in node.children.values())
+        return found
+
+
+class IdIndex(object):
+    """
+    Indexes subject ids by prefix, and by suffix thanks to their reversed
+    strings, so that globs like web-* or *.example.com only verify the
+    subjects sharing their literal parts.
+    """
+
+    def __init__(self, subjects=()):
+        self.ids = set()
+        self.prefixes = RadixTrie()
+        self.suffixes = RadixTrie()
+        for subject in subjects:
+            self.add(subject)
+
+    def add(self, subject):
+        id = subject.id
+        self.ids.add(id)
+        self.prefixes.add(id, id)
+        self.suffixes.add(id[::-1], id)
+
+    def discard(self, subject):
+        id = subject.id
+        self.ids.discard(id)
+        self.prefixes.discard(id, id)
+        self.suffixes.discard(id[::-1], id)
+
+    def lookup(self, expr):
+        """
+        Returns the ids which may match the glob expr, or None if expr has
+        no literal prefix nor suffix.
+        """
+        if is_literal(expr):
+            return set([expr]) & self.ids
+        prefix, suffix = literal_prefix(expr), literal_suffix(expr)
+        if not prefix and not suffix:
+            return None
+        candidates = None
+        if prefix:
+            candidates = self.prefixes.prefixed(prefix)
+        if suffix and (candidates is None or len(candidates) > 1):
+            found = self.suffixes.prefixed(suffix[::-1])
+            candidates = found if candidates is None else candidates & found
+        return candidates
+
+
+class Fleet(object):
+    """
+    Collection of subjects, keyed by id. It carries a FleetIndex over their
+    grains and pillar, an IdIndex over their ids and an IPv4Index over
+    their addresses.
+
+    Each subject also has a position, which is its bit into bitmaps.
+    Narrowed fleets share the positions of the fleet they come from.
+    Positions of removed subjects are kept, and given back if they are
+    added again.
+    """
+
+    def __init__(self, subjects=(), index=None, ips=None, names=None):
+        self.members = dict((obj.id, obj) for obj in subjects)
+        if index is None:
+            index = FleetIndex(self.members.values())
+        if ips is None:
+            ips = IPv4Index(self.members.values())
+        if names is None:
+            names = IdIndex(self.members.values())
+        self.index = index
+        self.ips = ips
+        self.names = names
+        self.order = list(self.members)
+        self.positions = dict((id, i) for i, id in enumerate(self.order))
+        self._everything = full(len(self.order))
+
+    def narrow(self, subjects):
+        """
+        Returns a fleet of subjects, which shares the same indexes.
+        """
+        fleet = copy.copy(self)
+        fleet.members = dict((obj.id, obj) for obj in subjects)
+        fleet._everything = None
+        return fleet
+
+    @property
+    def everything(self):
+        """
+        Bitmap of all the members.
+        """
+        if self._everything is None:
+            self._everything = self.bitmap(self.members)
+        return self._everything
+
+    def add(self, obj):
+        """
+        Adds or replaces obj, and patches the indexes in place.
+        """
+        if obj.id in self.members:
+            self.discard(obj.id)
+        self.members[obj.id] = obj
+        self.index.add(obj)
+        self.ips.add(obj)
+        self.names.add(obj)
+        if obj.id not in self.positions:
+            self.positions[obj.id] = len(self.order)
+            self.order.append(obj.id)
+        self._everything = None
+
+    def discard(self, id):
+        """
+        Removes the member id, and patches the indexes in place.
+        """
+        obj = self.members.pop(id, None)
+        if obj is not None:
+            self.index.discard(obj)
+            self.ips.discard(obj)
+            self.names.discard(obj)
+            self._everything = None
+
+    def pick(self, ids):
+        """
+        Yields members which id is in ids.
+        """
+        members = self.members
+        if len(ids) < len(members):
+            for id in ids:
+                if id in members:
+                    yield members[id]
+        else:
+            for id, obj in members.items():
+                if id in ids:
+                    yield obj
+
+    def bitmap(self, ids):
+        """
+        Returns the bitmap of the members which id is in ids.
+        """
+        members, positions = self.members, self.positions
+        return from_positions(positions[id] for id in ids if id in members)
+
+    def subjects(self, bitmap):
+        """
+        Returns the members set into bitmap.
+        """
+        members, order = self.members, self.order
+        return set(members[order[position]]
+                   for position in to_positions(bitmap))
+
+    def difference_update(self, objs):
+        for obj in objs:
+            self.members.pop(obj.id, None)
+
+    def get(self, id, default=None):
+        return self.members.get(id, default)
+
+    def __contains__(self, obj):
+        return self.members.get(obj.id) is obj
+
+    def __iter__(self):
+        return iter(self.members.values())
+
+    def __len__(self):
+        return len(self.members)
+
+    def __bool__(self):
+        return bool(self.members)
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<{0} of {1} subjects>'.format(self.__class__.__name__,
+                                             len(self.members))
+
+
+def narrow(objs, subjects):
+    """
+    Narrows objs to subjects, keeping the fleet index if any.
+    """
+    if isinstance(objs, Fleet):
+        return objs.narrow(subjects)
+    return set(subjects)
@@ -0,0 +1,264 @@
+'''
+
+salt.targeting.loader
+~~~~~~~~~~~~~~~~~~~~~
+
+Loads the whole minion data cache at once.
+
+The master keeps the last grains and pillar of each minion into
+``cachedir/minions/<id>/data.p``. Instead of deserializing these files one
+by one while rules are checked, the loader enumerates them and
+deserializes them into a pool of workers:
+
+.. code:: python
+
+    loader = MinionDataLoader(opts, workers=16)
+    report = loader.load()
+    report.errors       # {minion_id: exception}
+    report.subjects     # list of CheckableMinion
+    report.snapshot()   # FleetSnapshot
+
+A MinionCache keeps a Fleet up to date with the cache directory. Each
+refresh only deserializes and reindexes the minions which files changed:
+
+.. code:: python
+
+    cache = MinionCache(opts)
+    cache.refresh()
+    rule.check(cache.fleet)
+
+'''
+
+from functools import partial
+import os
+import time
+from multiprocessing.pool import Pool, ThreadPool
+
+from salt.targeting.fleet import Fleet
+from salt.targeting.snapshot import FleetSnapshot
+
+import logging
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'LoadReport',
+    'MinionCache',
+    'MinionDataLoader',
+]
+
+#: name of the cache file of each minion
+DATA_FILENAME = 'data.p'
+
+
+def minions_dir(opts):
+    return os.path.join(opts['cachedir'], 'minions')
+
+
+def minion_data_path(opts, id):
+    return os.path.join(minions_dir(opts), id, DATA_FILENAME)
+
+
+def default_deserializer(opts):
+    """
+    Returns a function which deserializes an open file, with the salt
+    payload serializer.
+    """
+    import salt.payload
+    return salt.payload.Serial(opts).load
+
+
+def load_minion_data(opts, id, deserializer=None):
+    """
+    Deserializes the cached data of minion id.
+    """
+    if deserializer is None:
+        deserializer = default_deserializer(opts)
+    with open(minion_data_path(opts, id), 'rb') as fh:
+        return deserializer(fh)
+
+
+def load_entry(opts, deserializer, id):
+    """
+    Loads the data of minion id. Errors are returned, so that a single
+    broken file does not abort the whole load.
+    """
+    try:
+        return id, load_minion_data(opts, id, deserializer), None
+    except Exception as e:
+        return id, None, e
+
+
+#: state of process workers, set by init_worker
+worker = {}
+
+
+def init_worker(opts, deserializer):
+    if deserializer is None:
+        deserializer = default_deserializer(opts)
+    worker['opts'] = opts
+    worker['deserializer'] = deserializer
+
+
+def work(id):
+    return load_entry(worker['opts'], worker['deserializer'], id)
+
+
+class LoadReport(object):
+    """
+    Results of a bulk load.
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.data = {}
+        self.errors = {}
+        self.removed = []
+        self.elapsed = None
+
+    @property
+    def subjects(self):
+        """
+        Returns the loaded minions, ready to be checked.
+        """
+        # subjects loads their data with this module
+        from salt.targeting.subjects import CheckableMinion
+        return [CheckableMinion(id, self.opts, cache=data)
+                for id, data in sorted(self.data.items())]
+
+    def fleet(self):
+        return Fleet(self.subjects)
+
+    def snapshot(self):
+        return FleetSnapshot(self.subjects)
+
+    def __repr__(self):
+        return '<{0} of {1} minions, {2} errors>'.format(
+            self.__class__.__name__, len(self.data), len(self.errors))
+
+
+class MinionDataLoader(object):
+    """
+    Deserializes all the cached minion data with a pool of workers.
+
+    Threads are used by default, because reading files releases the GIL.
+    Set processes when deserialization is CPU bound; the deserializer
+    must then be picklable, or None for the default one.
+    """
+
+    def __init__(self, opts, workers=None, deserializer=None,
+                 processes=False, chunksize=16):
+        self.opts = opts
+        self.workers = workers or opts.get('minion_data_workers') or 8
+        self.deserializer = deserializer
+        self.processes = processes
+        self.chunksize = chunksize
+
+    def minion_ids(self):
+        """
+        Returns the ids of the minions which have cached data.
+        """
+        path = minions_dir(self.opts)
+        try:
+            names = os.listdir(path)
+        except OSError as e:
+            log.warning('cannot list minions cache {0}: {1}'.format(path, e))
+            return []
+        return sorted(name for name in names
+                      if os.path.isfile(minion_data_path(self.opts, name)))
+
+    def load(self, ids=None):
+        """
+        Loads the data of ids, or of every cached minion.
+        """
+        if ids is None:
+            ids = self.minion_ids()
+        report = LoadReport(self.opts)
+        started = time.time()
+        if self.processes:
+            pool = Pool(self.workers, init_worker,
+                        (self.opts, self.deserializer))
+            func = work
+        else:
+            pool = ThreadPool(self.workers)
+            func = partial(load_entry, self.opts,
+                           self.deserializer or
+                           default_deserializer(self.opts))
+        try:
+            for id, data, error in pool.imap_unordered(func, ids,
+                                                       self.chunksize):
+                if error is None:
+                    report.data[id] = data
+                else:
+                    report.errors[id] = error
+        finally:
+            pool.close()
+            pool.join()
+        report.elapsed = time.time() - started
+        for id, error in sorted(report.errors.items()):
+            log.warning('cannot load data of {0}: {1}'.format(id, error))
+        log.debug('loaded {0} in {1:.3f}s'.format(report, report.elapsed))
+        return report
+
+
+class MinionCache(object):
+    """
+    Fleet of CheckableMinion, kept in sync with the minion data cache.
+
+    The stat (mtime, size and inode) of every data.p file is remembered.
+    refresh() stats the files again, reloads the changed and added ones,
+    and patches the fleet indexes in place, so that the deserialization
+    and indexing costs scale with churn, not with the fleet size.
+    """
+
+    def __init__(self, opts, loader=None):
+        self.opts = opts
+        self.loader = loader or MinionDataLoader(opts)
+        self.fleet = Fleet()
+        self.stats = {}
+
+    def scan(self):
+        """
+        Returns the stat of the data file of every cached minion.
+        """
+        stats = {}
+        path = minions_dir(self.opts)
+        try:
+            names = os.listdir(path)
+        except OSError as e:
+            log.warning('cannot list minions cache {0}: {1}'.format(path, e))
+            return stats
+        for name in names:
+            try:
+                st = os.stat(minion_data_path(self.opts, name))
+            except OSError:
+                continue
+            stats[name] = st.st_mtime, st.st_size, st.st_ino
+        return stats
+
+    def refresh(self):
+        """
+        Synchronizes the fleet with the cache directory.
+
+        Returns the LoadReport of the reloaded minions, which removed
+        attribute lists the ids of the dropped ones.
+        """
+        stats = self.scan()
+        removed = sorted(set(self.stats) - set(stats))
+        changed = sorted(id for id, stat in stats.items()
+                         if self.stats.get(id) != stat)
+        report = self.loader.load(changed) if changed else \
+            LoadReport(self.opts)
+        report.removed = removed
+
+        for id in removed:
+            self.fleet.discard(id)
+            del self.stats[id]
+        for minion in report.subjects:
+            self.fleet.add(minion)
+        # failed files are retried by the next refresh, and their minions
+        # keep their previous data meanwhile
+        for id in report.data:
+            self.stats[id] = stats[id]
+        log.debug('refreshed {0}: {1} reloaded, {2} removed'.format(
+            self.fleet, len(report.data), len(removed)))
+        return report
@@ -0,0 +1,176 @@
+'''
+
+salt.targeting.metrics
+~~~~~~~~~~~~~~~~~~~~~~
+
+Counters and histograms of targeting, for masters which monitor it.
+
+Metrics are disabled by default, recording them then costs a global
+lookup. They are enabled by installing a registry:
+
+.. code:: python
+
+    registry = metrics.enable()
+    minion_targeting.parse('G@os:Ubuntu').check(minions)
+    registry.snapshot()['histograms']['check.seconds']['count']
+
+Hooks of the registry are called with every recorded name and value, so
+that they can be forwarded to another monitoring system.
+
+Recorded metrics are:
+
+- ``parse.seconds``, ``parse.cache.hits`` and ``parse.cache.misses``
+- ``check.seconds``, ``check.targeted`` and ``check.doubtful``
+- ``rules.<class>.evaluations``, ``rules.<class>.subjects`` and
+  ``rules.<class>.doubtful``, per class of evaluated rules
+- ``missing.<attr>``, when exact matching misses the attr of a minion
+- ``exsel.timeouts``, and ``exsel.undefined`` when minions miss the
+  function
+
+'''
+
+from bisect import bisect_left
+from timeit import default_timer
+import threading
+
+__all__ = [
+    'Histogram',
+    'Registry',
+]
+
+#: registry of the process, None while metrics are disabled
+registry = None
+
+#: upper bounds of histogram buckets, in seconds
+BOUNDS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+class Histogram(object):
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'buckets': list(zip(self.bounds + (None,), self.buckets)),
+        }
+
+
+class Registry(object):
+    """
+    Holds counters and histograms by name.
+    """
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.counters = {}
+        self.histograms = {}
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def hook(self, callback):
+        """
+        Calls callback(name, value) for every recorded metric.
+        """
+        self.hooks.append(callback)
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for callback in self.hooks:
+            callback(name, value)
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.bounds)
+            histogram.add(value)
+        for callback in self.hooks:
+            callback(name, value)
+
+    def snapshot(self):
+        """
+        Returns the current values of all metrics, as plain data.
+        """
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict((name, histogram.snapshot())
+                                   for name, histogram
+                                   in self.histograms.items()),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+def enable(new=None):
+    """
+    Installs new, or a new Registry, and returns it.
+    """
+    global registry
+    registry = new if new is not None else Registry()
+    return registry
+
+
+def disable():
+    global registry
+    registry = None
+
+
+def incr(name, value=1):
+    if registry is not None:
+        registry.incr(name, value)
+
+
+def observe(name, value):
+    if registry is not None:
+        registry.observe(name, value)
+
+
+def checked(started, targeted, doubtful):
+    """
+    Records a check which started at started, by default_timer, and
+    targeted subjects, doubtful of them being undecided.
+    """
+    current = registry
+    if current is None:
+        return
+    current.observe('check.seconds', default_timer() - started)
+    current.incr('check.targeted', targeted)
+    current.incr('check.doubtful', doubtful)
+
+
+def evaluated(rule, subjects, doubtful):
+    """
+    Records the evaluation of rule over subjects, doubtful of them being
+    undecided.
+    """
+    current = registry
+    if current is None:
+        return
+    prefix = 'rules.' + rule.__class__.__name__
+    current.incr(prefix + '.evaluations')
+    current.incr(prefix + '.subjects', subjects)
+    if doubtful:
+        current.incr(prefix + '.doubtful', doubtful)
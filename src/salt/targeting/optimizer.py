@@ -0,0 +1,173 @@
+'''
+
+salt.targeting.optimizer
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Simplifies parsed rules before they are evaluated. Generated queries, like
+nodegroups and top files, often repeat the same terms:
+
+.. code:: python
+
+    rule = minion_targeting.parse('web* or (web* and G@os:Ubuntu)',
+                                  optimize=True)
+    assert rule == GlobRule('web*')
+
+Rules are rewritten in a few passes:
+
+- negations are pushed down to the leaves, with De Morgan's laws
+- identical terms are merged, and absorbed terms are removed, eg.
+  ``a or (a and b)`` becomes ``a``
+- contradictions become FalseRule, and tautologies become TrueRule, eg.
+  ``a and not a`` matches nothing, even when a cannot be decided
+- negated siblings are grouped again under a single NotRule, so that
+  globs keep being merged by AnyRule
+- equal subtrees are replaced by a single instance
+
+Equal subtrees are then evaluated once per subject, see
+salt.targeting.rules.memoized and memoized_select.
+
+'''
+
+import weakref
+
+from salt.targeting.rules import AllRule, AnyRule, NotRule
+from salt.targeting.rules import TrueRule, FalseRule
+
+__all__ = [
+    'Optimizer',
+    'optimize',
+]
+
+
+def dual(cls):
+    return AnyRule if cls is AllRule else AllRule
+
+
+def normalize(rule, negated=False):
+    """
+    Returns the negation normal form of rule, or of not rule when negated.
+    """
+    if isinstance(rule, NotRule):
+        return normalize(rule.rule, not negated)
+    if isinstance(rule, (AllRule, AnyRule)):
+        cls = dual(rule.__class__) if negated else rule.__class__
+        return cls(*[normalize(child, negated) for child in rule.rules])
+    if negated:
+        return -rule
+    return rule
+
+
+def simplify(rule):
+    """
+    Simplifies a rule in negation normal form.
+    """
+    if not isinstance(rule, (AllRule, AnyRule)):
+        return rule
+    cls = rule.__class__
+    if cls is AllRule:
+        unit, zero = TrueRule(), FalseRule()
+    else:
+        unit, zero = FalseRule(), TrueRule()
+
+    rules = set()
+    for child in rule.rules:
+        child = simplify(child)
+        if isinstance(child, cls):
+            rules.update(child.rules)
+        else:
+            rules.add(child)
+    rules.discard(unit)
+    if zero in rules:
+        return zero
+    for child in rules:
+        if isinstance(child, NotRule) and child.rule in rules:
+            return zero
+
+    # a and (a or b) is a, (a or b) and (a or b or c) is a or b
+    composites = [child for child in rules if isinstance(child, dual(cls))]
+    for child in composites:
+        if child.rules & rules or any(
+                other is not child and other.rules < child.rules
+                for other in composites):
+            rules.discard(child)
+
+    if not rules:
+        return unit
+    if len(rules) == 1:
+        return rules.pop()
+    return cls(*rules)
+
+
+def factor(rule):
+    """
+    Groups the negated children of composite rules under a single NotRule.
+    """
+    if not isinstance(rule, (AllRule, AnyRule)):
+        return rule
+    cls = rule.__class__
+    negated, others = [], []
+    for child in rule.rules:
+        child = factor(child)
+        if isinstance(child, NotRule):
+            negated.append(child.rule)
+        else:
+            others.append(child)
+    if len(negated) < 2:
+        return cls(*(others + [NotRule(child) for child in negated]))
+    grouped = NotRule(dual(cls)(*negated))
+    if not others:
+        return grouped
+    return cls(grouped, *others)
+
+
+class Optimizer(object):
+    """
+    Optimizes rules, and shares their equal subtrees.
+
+    Subtrees are interned as long as some optimized rule holds them.
+    The ones held twice by a rule are marked as shared.
+    """
+
+    def __init__(self):
+        self.table = weakref.WeakValueDictionary()
+
+    def intern(self, rule):
+        if isinstance(rule, (AllRule, AnyRule)):
+            rule = rule.__class__(*[self.intern(child) for child in rule.rules])
+        elif isinstance(rule, NotRule):
+            rule = NotRule(self.intern(rule.rule))
+        return self.table.setdefault(rule, rule)
+
+    def __call__(self, rule):
+        rule = self.intern(factor(simplify(normalize(rule))))
+        mark_shared(rule)
+        return rule
+
+
+def mark_shared(rule):
+    """
+    Marks the composite subtrees of rule reached by several branches.
+    """
+    seen = set()
+    stack = [rule]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (AllRule, AnyRule)):
+            children = node.rules
+        elif isinstance(node, NotRule):
+            children = [node.rule]
+        else:
+            # leaves memoize nothing
+            continue
+        if id(node) in seen:
+            node.shared = True
+            continue
+        seen.add(id(node))
+        stack.extend(children)
+
+
+def optimize(rule):
+    """
+    Returns an equivalent rule, which is cheaper to evaluate.
+    """
+    return Optimizer()(rule)
@@ -0,0 +1,124 @@
+'''
+
+salt.targeting.parallel
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Checks rules over very large lists of subjects with a pool of processes.
+
+The rule is pickled once per worker, then each worker filters shards of
+subjects and only sends back their positions:
+
+.. code:: python
+
+    rule.check_parallel(minions, workers=8)
+
+Like Rule.check, subjects which cannot be decided are kept, and they are
+marked as doubtful.
+
+'''
+
+import multiprocessing
+from multiprocessing.pool import Pool
+
+from salt.targeting.rules import evaluation, mark_doubt
+from salt.targeting.snapshot import FleetSnapshot
+import logging
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'ParallelChecker',
+    'check_parallel',
+]
+
+#: below this count of subjects, rules are checked into the current process
+MIN_SUBJECTS = 1024
+
+#: state of workers, set by init_worker
+worker = {}
+
+
+def init_worker(rule):
+    worker['rule'] = rule
+
+
+def check_shard(shard):
+    """
+    Returns the positions of the matching and of the doubtful subjects of
+    shard.
+    """
+    start, objs = shard
+    positions = dict((id(obj), start + i) for i, obj in enumerate(objs))
+    with evaluation():
+        matched, unknown = worker['rule'].select(objs)
+    return [positions[id(obj)] for obj in matched], \
+        [positions[id(obj)] for obj in unknown]
+
+
+class ParallelChecker(object):
+    """
+    Pool of processes which checks a single rule.
+
+    The pool is kept until close() is called, so that the rule is only
+    shipped once for many checks.
+    """
+
+    def __init__(self, rule, workers=None):
+        self.rule = rule
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = Pool(self.workers, init_worker, (rule,))
+
+    def shards(self, objs, chunksize=None):
+        if chunksize is None:
+            # a few shards per worker balance the slowest ones
+            chunksize = max(1, -(-len(objs) // (self.workers * 4)))
+        for start in range(0, len(objs), chunksize):
+            yield start, objs[start:start + chunksize]
+
+    def select(self, objs, chunksize=None):
+        """
+        Returns the positions of the matching and of the doubtful subjects.
+        """
+        matched, doubtful = set(), set()
+        shards = self.shards(objs, chunksize)
+        for found, unsure in self.pool.imap_unordered(check_shard, shards):
+            matched.update(found)
+            doubtful.update(unsure)
+        return matched, doubtful
+
+    def check(self, objs, chunksize=None):
+        """
+        Same as Rule.check, doubtful subjects are marked as such.
+        """
+        objs = list(objs)
+        matched, doubtful = self.select(objs, chunksize)
+        results = set(objs[position] for position in matched)
+        results.update(mark_doubt(objs[position]) for position in doubtful)
+        return results
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def check_parallel(rule, objs, workers=None, chunksize=None):
+    """
+    Checks rule over objs, sharded across a pool of processes.
+
+    Snapshots are already evaluated column wise, and small lists are
+    not worth the pickling, they are both checked into this process.
+    """
+    if isinstance(objs, FleetSnapshot):
+        return rule.check_fleet(objs)
+    objs = list(objs)
+    if workers == 1 or len(objs) < MIN_SUBJECTS:
+        with evaluation():
+            matched, unknown = rule.select(objs)
+        return matched | set(mark_doubt(obj) for obj in unknown)
+    with ParallelChecker(rule, workers) as checker:
+        return checker.check(objs, chunksize)
@@ -3,156 +3,199 @@
 salt.targeting.parser
 ~~~~~~~~~~~~~~~~~~~~~
 
+Compound queries are scanned once into tokens, then a recursive descent
+parser builds the rule tree directly::
+
+    query   = any_stmt
+    any_stmt = all_stmt *("or" all_stmt)
+    all_stmt = not_stmt *("and" not_stmt)
+    not_stmt = "not" not_stmt / "(" any_stmt ")" / 1*expr
+
+Consecutive expressions are merged with a single space, so that
+``I@fullname:John Doe`` is handled as one rule.
 
 '''
 
-from functools import wraps
+from collections import namedtuple
 import re
+from salt.targeting.rules import AllRule, AnyRule
 import logging
 log = logging.getLogger(__name__)
 
 __all__ = [
-    'to_python',
     'parse',
     'tokenize',
 ]
 
-tokenize = re.compile(r'''
-    (?P<and_stmt> \band(?=[\s$]) ) |
-    (?P<or_stmt> \bor(?=[\s$]) ) |
-    (?P<not_stmt> \bnot(?=[\s$]) ) |
-    (?P<sub_query> \(.+\s.+\)(?!\S) ) |
-    (?P<expr> \S+ )
+#: token kinds
+AND, OR, NOT, OPEN, CLOSE, EXPR, END = \
+    'and', 'or', 'not', 'open', 'close', 'expr', 'end'
 
-''', flags=re.VERBOSE | re.MULTILINE | re.X).finditer
+KEYWORDS = {
+    'and': AND,
+    'or': OR,
+    'not': NOT,
+}
 
-def parse(query, parse_rule):
-    """
-    Parses a compound query to a python expression.
+Token = namedtuple('Token', 'kind value pos')
 
-    :query:
-        compound query. for example::
-
-            foo and bar and not baz
+words = re.compile(r'\S+').finditer
 
-    :parse_rule:
-        callable with an arity of 1, and must implements boolean operators.
-        For example::
-
-            def func(expr):
-                return set()
-
-    parse('foo and bar', func) --> func('foo') & func('bar')
-    """
-
-    python_stmt = to_python(query)
-    try:
-        return eval(python_stmt, {'parse_rule': parse_rule})
-    except SyntaxError as e:
-        log.exception(e)
-        log.error('Query {0} has been parsed has {1}'.format(repr(query), repr(python_stmt)))
-        raise SyntaxError('Unexpected error while parsing {0}'.format(repr(query)))
-
-def to_python(source):
-    parser = QueryState()
-    builder = []
-    for each in tokenize(source):
-        dispatch = getattr(parser, each.lastgroup)
-        dispatch(each.group(), builder)
-    if builder and builder[-1] in ('-', '|', '&'):
-        log.error('SyntaxError: {0} -> {1}'.format(repr(source), repr(builder)))
-        raise SyntaxError('Unexpected operator at the end of {0}'.format(repr(source)))
-    return ' '.join(builder)
 
 def normalize(value):
     return ' '.join(value.strip().split())
 
-def transition(method):
-    @wraps(method)
-    def trans(state, *args, **kwargs):
-        command = method(state, *args, **kwargs)
-        state.__class__ = command(state)
-    return trans
-
-
-def unchanged(state):
-    return state.__class__
-
-
-def shifting(identity):
-    def command(state):
-        return identity
-    return command
 
+def closing(word):
+    """
+    Returns the position of the parenthesis closing the first one of word,
+    or -1 if it is not closed into this word.
+    """
+    depth = 0
+    for i, char in enumerate(word):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if not depth:
+                return i
+    return -1
+
+
+def tokenize(query):
+    r"""
+    Scans query once and yields tokens.
+
+    A parenthesis opens a group when it starts a word, unless it is closed
+    before the end of this same word (``(web|back)\w+`` is an expression).
+    A parenthesis ending a word closes a group only if one is opened,
+    otherwise it belongs to the expression.
+    """
+    depth = 0
+    for match in words(query):
+        word, pos = match.group(), match.start()
+        if word in KEYWORDS:
+            yield Token(KEYWORDS[word], word, pos)
+            continue
 
-def pushing(identity, afterwards=None):
-    def command(state):
-        state._identities.append(afterwards or state.__class__)
-        return identity
-    return command
+        while word.startswith('(') and closing(word) in (-1, len(word) - 1):
+            yield Token(OPEN, '(', pos)
+            depth += 1
+            word, pos = word[1:], pos + 1
 
+        closes = 0
+        while word.endswith(')') and closes < depth:
+            word = word[:-1]
+            closes += 1
 
-def popped(state):
-    return state._identities.pop()
+        if word:
+            yield Token(EXPR, word, pos)
+        for i in range(closes):
+            yield Token(CLOSE, ')', pos + len(word) + i)
+        depth -= closes
 
+    yield Token(END, '', len(query))
 
-class State(object):
-    def __new__(cls):
-        state = object.__new__(cls)
-        state._identities = []
-        return state
 
+def syntax_error(query, token, msg):
+    """
+    Builds a SyntaxError pointing into query.
+    """
+    log.error('SyntaxError: {0} at position {1} of {2}'.format(
+        msg, token.pos, repr(query)
+    ))
+    return SyntaxError('{0} at position {1} of {2}'.format(
+        msg, token.pos, repr(query)
+    ), ('<query>', 1, token.pos + 1, query))
 
-class ParsingState(State):
-    def __getattr__(self, name):
-        def raiser(token, *args):
-            raise ValueError(
-                'parsing state %s does not understand token "%s" of type %s' %
-                (self.__class__.__name__, token, name)
-            )
-        return raiser
 
+class Parser(object):
+    """
+    Recursive descent parser over the tokens of a single query.
+    """
 
-class QueryState(ParsingState):
-    @transition
-    def sub_query(self, data, builder):
-        builder.append('(' + to_python(data[1:-1]) + ')')
-        return pushing(GroupState)
+    def __init__(self, query, parse_rule):
+        self.query = query
+        self.parse_rule = parse_rule
+        self.tokens = tokenize(query)
+        self.current = next(self.tokens)
+
+    def advance(self):
+        token = self.current
+        if token.kind != END:
+            self.current = next(self.tokens)
+        return token
+
+    def expect(self, kind):
+        if self.current.kind != kind:
+            raise self.unexpected()
+        return self.advance()
+
+    def unexpected(self):
+        token = self.current
+        if token.kind == END:
+            return syntax_error(self.query, token, 'Unexpected end of query')
+        return syntax_error(self.query, token,
+                            'Unexpected {0}'.format(repr(token.value)))
+
+    def parse(self):
+        rule = self.any_stmt()
+        self.expect(END)
+        return rule
+
+    def any_stmt(self):
+        rules = [self.all_stmt()]
+        while self.current.kind == OR:
+            self.advance()
+            rules.append(self.all_stmt())
+        if len(rules) == 1:
+            return rules[0]
+        return AnyRule(*rules)
+
+    def all_stmt(self):
+        rules = [self.not_stmt()]
+        while self.current.kind == AND:
+            self.advance()
+            rules.append(self.not_stmt())
+        if len(rules) == 1:
+            return rules[0]
+        return AllRule(*rules)
+
+    def not_stmt(self):
+        kind = self.current.kind
+        if kind == NOT:
+            self.advance()
+            return - self.not_stmt()
+        if kind == OPEN:
+            self.advance()
+            rule = self.any_stmt()
+            self.expect(CLOSE)
+            return rule
+        if kind == EXPR:
+            values = [self.advance().value]
+            while self.current.kind == EXPR:
+                values.append(self.advance().value)
+            return self.parse_rule(' '.join(values))
+        raise self.unexpected()
 
-    @transition
-    def expr(self, data, builder):
-        builder.append('parse_rule(' + repr(data) + ')')
-        return pushing(ExprState)
 
-    @transition
-    def not_stmt(self, data, builder):
-        builder.append('-')
-        return unchanged
+def parse(query, parse_rule):
+    """
+    Parses a compound query to a rule tree.
 
+    :query:
+        compound query. for example::
 
-class GroupState(ParsingState):
-    @transition
-    def and_stmt(self, data, builder):
-        builder.append('&')
-        return shifting(QueryState)
+            foo and bar and not baz
 
-    @transition
-    def or_stmt(self, data, builder):
-        builder.append('|')
-        return shifting(QueryState)
+    :parse_rule:
+        callable with an arity of 1, which returns a rule. For example::
 
-    def expr(self, data, builder):
-        raise ValueError(
-            'Statement is missing before {0} expr'.format(repr(data))
-        )
+            def func(expr):
+                return GlobRule(expr)
 
+    parse('foo and bar', func) --> AllRule(func('foo'), func('bar'))
 
-class ExprState(GroupState):
-    def expr(self, data, builder):
-        # normalize space between 2 expr
-        last = builder.pop()
-        if last.startswith('parse_rule(') and last.endswith(')'):
-            log.warning('Merging 2 following tokens')
-            builder.append(last[:-1] + repr(' ') + repr(data) + last[-1])
-            return unchanged
-        return GroupState.expr(self, data, builder)
+    Raises a SyntaxError which offset points into query.
+    """
+    return Parser(query, parse_rule).parse()
@@ -6,9 +6,14 @@ salt.targeting.query
 
 '''
 
-import inspect
-from salt.targeting import rules
+from timeit import default_timer
+
+from salt._compat import getargspec
+from salt.targeting import metrics, rules
+from salt.targeting.explain import Plan
+from salt.targeting.optimizer import Optimizer
 from salt.targeting.parser import parse, normalize
+from salt.utils.cache import LRUCache, freeze
 
 import logging
 log = logging.getLogger(__name__)
@@ -60,7 +65,7 @@ class RuleEvaluator(Evaluator):
         self.rule = rule
         self.arguments = ()
 
-        arg_spec = inspect.getargspec(rule.__init__)
+        arg_spec = getargspec(rule.__init__)
         if arg_spec.args:
             self.arguments = tuple(arg_spec.args[1:])
         self.varargs = arg_spec.varargs
@@ -117,9 +122,23 @@ def make_evaluator(obj, query):
 
 
 class Query(object):
-    def __init__(self, default_rule, **opts):
+    """
+    Parses compound queries into rules.
+
+    Parsed rules are immutable, so they are kept into an LRU cache of
+    cache_size entries, keyed by the normalized query and the effective
+    opts. The cache is cleared when a new rule is registered.
+
+    With the optimize opt, rules are simplified once parsed, and their
+    equal subtrees are shared, see salt.targeting.optimizer.
+    """
+
+    def __init__(self, default_rule, cache_size=256, **opts):
         self.registry = {}
         self.evaluators = {}
+        self.default_evaluators = {}
+        self.cache = LRUCache(cache_size)
+        self.optimizer = Optimizer()
         self.opts = {
             'default_rule': default_rule,
             'delim': ':',
@@ -159,22 +178,80 @@ class Query(object):
         if prefix:
             self.evaluators[prefix] = evaluator
             self.registry[prefix] = obj
+        self.cache.clear()
+
+    def cache_key(self, query, opts):
+        """
+        Returns the cache key of query, or None if opts are not hashable.
+        Macros are part of the key, so that changing them misses the cache.
+        """
+        try:
+            return normalize(query), freeze(opts)
+        except TypeError:
+            return None
+
+    def aparse(self, query, **opts):
+        """
+        Coroutine version of parse, see salt.targeting.aio.
+        """
+        from salt.targeting.aio import aparse
+        return aparse(self, query, **opts)
 
     def parse(self, query, **opts):
         parser_opts = self.opts.copy()
         if opts:
             parser_opts.update(opts)
-        default_evaluator = RuleEvaluator(self, parser_opts['default_rule'])
+
+        key = self.cache_key(query, parser_opts)
+        if key is not None:
+            rule = self.cache.get(key)
+            if rule is not None:
+                metrics.incr('parse.cache.hits')
+                return rule
+            metrics.incr('parse.cache.misses')
+
+        started = default_timer()
+
+        default_rule = parser_opts['default_rule']
+        try:
+            default_evaluator = self.default_evaluators[default_rule]
+        except KeyError:
+            default_evaluator = RuleEvaluator(self, default_rule)
+            self.default_evaluators[default_rule] = default_evaluator
+
         def parse_rule(value):
             prefix, sep, raw_value = value.partition('@')
             if prefix and raw_value and prefix in self.evaluators:
                 return self.evaluators[prefix](raw_value, parser_opts)
             return default_evaluator(value, parser_opts)
 
-        return parse(query, parse_rule)
+        rule = parse(query, parse_rule)
+        if parser_opts.get('optimize'):
+            rule = self.optimizer(rule)
+        metrics.observe('parse.seconds', default_timer() - started)
+        if key is not None:
+            self.cache.set(key, rule)
+        return rule
 
     parse_compound = parse
 
+    def explain(self, query, objs=None, analyze=False, **opts):
+        """
+        Returns the Plan of query, optimized unless opts tell otherwise.
+
+        Leaves tell the index they use over objs, which defaults to a
+        Fleet. With analyze, the rule is checked over objs, and each node
+        of the plan is annotated with what it did.
+        """
+        opts.setdefault('optimize', True)
+        rule = self.parse(query, **opts)
+        plan = Plan.build(self, rule, objs)
+        if analyze:
+            if objs is None:
+                raise ValueError('analyze requires subjects')
+            plan.analyze(objs)
+        return plan
+
     def querify(self, obj, **opts):
         parser_opts = self.opts.copy()
         if opts:
@@ -186,6 +263,10 @@ class Query(object):
                 else:
                     yield self.querify(obj)
 
+        if isinstance(obj, rules.TrueRule):
+            return self.querify(rules.GlobRule('*'))
+        if isinstance(obj, rules.FalseRule):
+            return 'not ' + self.querify(rules.GlobRule('*'))
         if isinstance(obj, rules.NotRule):
             return 'not ' + ''.join(parenthize([obj.rule]))
         if isinstance(obj, rules.AnyRule):
@@ -7,12 +7,27 @@ salt.targeting.rules
 '''
 
 from abc import abstractmethod
+from contextlib import contextmanager
+from functools import partial, wraps
+from timeit import default_timer
+import re
+import threading
 import logging
 log = logging.getLogger(__name__)
 
-from salt.utils.matching import glob_match, pcre_match, pcre_compile, ipcidr_match
+from salt.utils import lazy_property
+from salt.utils.matching import glob_compile, pcre_compile, is_literal
+from salt.utils.matching import AlternationMatcher, CIDRMatcher, PathMatcher
+from salt.utils.bitmap import count, from_positions
+from salt.utils.pool import TIMEOUT, call_all
+from salt.targeting import metrics
+from salt.targeting.fleet import Fleet, narrow
+from salt.targeting.snapshot import FleetSnapshot
+from salt.targeting.stats import RuleStats, adaptive_order, all_rank, any_rank
+from salt.targeting.stats import measured_bitmap, measured_select
 
 __all__ = [
+    'evaluation',
     'Rule',
     'AllRule',
     'AnyRule',
@@ -26,19 +41,182 @@ __all__ = [
     'ExselRule',
     'LocalStoreRule',
     'YahooRangeRule',
+    'TrueRule',
+    'FalseRule',
 ]
 
-class Doubtful(object):
-    def __init__(self, obj, doubt=None):
-        self.__dict__.update({
-            'obj': obj,
-            'doubt': doubt
-        })
+#: memo of the current evaluation, per thread
+local = threading.local()
 
-    def __getattr__(self, name):
-        if name in self.__dict__.keys():
-            return object.__getattr__(self, name)
-        return getattr(self.obj, name)
+
+@contextmanager
+def evaluation(memo=None):
+    """
+    Shares a memo between all the rules evaluated into this context, so
+    that results of costly leaves (like ExselRule) are computed once per
+    subject. Nested contexts reuse the outer memo, unless they are given
+    their own memo, which is then used until they exit.
+    """
+    previous = getattr(local, 'memo', None)
+    if memo is None:
+        if previous is not None:
+            yield previous
+            return
+        memo = {}
+    local.memo = memo
+    try:
+        yield memo
+    finally:
+        local.memo = previous
+
+
+def current_memo():
+    """
+    Returns the memo of the current evaluation, or None.
+    """
+    return getattr(local, 'memo', None)
+
+
+def keep(memo, obj):
+    """
+    Keeps obj alive as long as memo, so that its id cannot be reused by
+    another subject while it keys entries of memo.
+    """
+    memo['object', id(obj)] = obj
+
+
+def memoized(method):
+    """
+    Memoizes method(self, arg) into the current evaluation, so that equal
+    rules shared by several branches are evaluated once per argument.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, arg):
+        with evaluation() as memo:
+            key = name, self, id(arg)
+            try:
+                return memo[key]
+            except KeyError:
+                keep(memo, arg)
+                result = memo[key] = method(self, arg)
+                return result
+    return wrapper
+
+
+def drive(steps, evaluate):
+    """
+    Runs a walk of a composite rule.
+
+    Walks are generators, which yield the (child, arg) couples they need
+    in evaluation order, and receive evaluate(child, arg) back. They
+    finally yield None and their own result. Coroutines drive the same
+    walks, see salt.targeting.aio.
+    """
+    rule, arg = next(steps)
+    while rule is not None:
+        rule, arg = steps.send(evaluate(rule, arg))
+    return arg
+
+
+def memoized_walk(walk):
+    """
+    Memoizes the result of walk(self, arg) into the current evaluation,
+    so that equal rules shared by several branches are evaluated once per
+    argument.
+    """
+    name = walk.__name__
+
+    @wraps(walk)
+    def wrapper(self, arg):
+        memo = current_memo()
+        key = name, self, id(arg)
+        if memo is not None and key in memo:
+            yield None, memo[key]
+            return
+        steps = walk(self, arg)
+        step = next(steps)
+        while step[0] is not None:
+            step = steps.send((yield step))
+        if memo is not None:
+            keep(memo, arg)
+            memo[key] = step[1]
+        yield step
+    return wrapper
+
+
+def memoized_select(walk):
+    """
+    Memoizes walk(self, objs) into the current evaluation, per subject,
+    so that rules shared by several branches evaluate each subject once,
+    whatever the candidates left to them by each branch. Only the rules
+    marked as shared by the optimizer pay for it.
+    """
+
+    @wraps(walk)
+    def wrapper(self, objs):
+        memo = current_memo()
+        if not self.shared or memo is None:
+            steps = walk(self, objs)
+            step = next(steps)
+            while step[0] is not None:
+                step = steps.send((yield step))
+            yield step
+            return
+        known = memo.get(('select', self))
+        if known is None:
+            known = memo['select', self] = {}
+        if not isinstance(objs, Fleet):
+            objs = set(objs)
+        pending = [obj for obj in objs if id(obj) not in known]
+        matched, unknown = set(), set()
+        if pending:
+            if len(pending) < len(objs):
+                steps = walk(self, narrow(objs, pending))
+            else:
+                steps = walk(self, objs)
+            step = next(steps)
+            while step[0] is not None:
+                step = steps.send((yield step))
+            matched, unknown = step[1]
+        # subjects are kept by their entry, so their ids stay theirs
+        for obj in pending:
+            known[id(obj)] = obj, obj in matched, obj in unknown
+        if len(pending) < len(objs):
+            for obj in objs:
+                obj, is_matched, is_unknown = known[id(obj)]
+                if is_matched:
+                    matched.add(obj)
+                elif is_unknown:
+                    unknown.add(obj)
+        yield None, (matched, unknown)
+    return wrapper
+
+
+def walk_select(rule, objs):
+    """
+    Evaluates a composite rule over objs, and its children with
+    measured_select.
+    """
+    if current_memo() is not None:
+        return drive(rule.select_walk(objs), measured_select)
+    with evaluation():
+        return drive(rule.select_walk(objs), measured_select)
+
+
+def match_child(rule, obj):
+    return rule.match(obj)
+
+
+def walk_match(rule, obj):
+    """
+    Evaluates a composite rule by obj, and its children with match.
+    """
+    if current_memo() is not None:
+        return drive(rule.match_walk(obj), match_child)
+    with evaluation():
+        return drive(rule.match_walk(obj), match_child)
 
 
 def mark_doubt(obj):
@@ -48,16 +226,17 @@ def mark_doubt(obj):
     return obj
 
 
-def is_deceipt(obj):
-    return getattr(obj, 'doubt', False)
-
-
 def rule_cmp(rule, other, *attrs):
     return isinstance(other, rule.__class__) \
        and all(getattr(rule, attr) == getattr(other, attr) for attr in attrs) \
        and Rule.__eq__(rule, other)
 
 
+def rule_hash(rule, *attrs):
+    return hash((rule.__class__, rule.priority) +
+                tuple(getattr(rule, attr) for attr in attrs))
+
+
 def rule_flatten(container, rules):
     merged = set()
     for rule in rules:
@@ -69,6 +248,76 @@ def rule_flatten(container, rules):
         yield rule
 
 
+def attr_select(objs, attr, matcher, resolve=None):
+    """
+    Returns the set of objs which attr is accepted by matcher, and the set
+    of the ones which miss attr.
+
+    When objs is a Fleet, resolve(fleet) may return the ids which match,
+    the ids which must be verified by matcher, and the ids which miss
+    attr. It returns None when the fleet indexes cannot help.
+    """
+    resolved = None
+    if resolve is not None and isinstance(objs, Fleet):
+        resolved = resolve(objs)
+
+    matched, unknown = set(), set()
+    if resolved is None:
+        for obj in objs:
+            data = getattr(obj, attr)
+            if data is None:
+                unknown.add(obj)
+            elif matcher(data):
+                matched.add(obj)
+    else:
+        certain, unsure, missing = resolved
+        unknown.update(objs.pick(missing))
+        matched.update(objs.pick(certain))
+        for obj in objs.pick(unsure):
+            if matcher(getattr(obj, attr)):
+                matched.add(obj)
+    return matched, unknown
+
+
+def attr_bitmap(fleet, attr, matcher, resolve=None):
+    """
+    Bitmap version of attr_select. Returns the bitmaps of the positions
+    which attr is accepted by matcher, and of the ones which miss attr.
+    """
+    members, positions = fleet.members, fleet.positions
+    resolved = resolve(fleet) if resolve is not None else None
+    matched, doubtful = [], []
+    if resolved is None:
+        for id, obj in members.items():
+            data = getattr(obj, attr)
+            if data is None:
+                doubtful.append(positions[id])
+            elif matcher(data):
+                matched.append(positions[id])
+    else:
+        certain, unsure, missing = resolved
+        doubtful = [positions[id] for id in missing if id in members]
+        matched = [positions[id] for id in certain if id in members]
+        for id in unsure:
+            if id in members and matcher(getattr(members[id], attr)):
+                matched.append(positions[id])
+    return from_positions(matched), from_positions(doubtful)
+
+
+def index_resolver(attr, expr, delim):
+    """
+    Returns a resolver of glob expr by the FleetIndex, for attr_select.
+    """
+    def resolve(fleet):
+        index = fleet.index
+        if attr in index.attrs:
+            resolved = index.lookup(attr, expr, delim)
+            if resolved is not None:
+                matched, unsure = resolved
+                return matched, unsure, index.missing[attr]
+    return resolve
+
+
 def rule_str(rule, *attrs):
     name = rule.__class__.__name__
     args = [repr(getattr(rule, attr)) for attr in attrs]
@@ -85,16 +334,96 @@ class Rule(object):
     #: used for sorting in order to avoid doing some heavy computations
     priority = None
 
+    #: set by the optimizer on rules held by several branches
+    shared = False
+
     def check(self, objs):
         """
         Optimistic check by master.
         """
-        results = self.filter(objs)
-        return set(results)
+        started = default_timer()
+        if not hasattr(objs, '__len__'):
+            objs = list(objs)
+        with evaluation():
+            matched, unknown = measured_select(self, objs)
+        results = matched | set(mark_doubt(obj) for obj in unknown)
+        metrics.checked(started, len(results), len(unknown))
+        return results
+
+    def acheck(self, objs):
+        """
+        Coroutine version of check, see salt.targeting.aio.
+        """
+        from salt.targeting.aio import acheck
+        return acheck(self, objs)
+
+    def amatch(self, obj):
+        """
+        Coroutine version of match, see salt.targeting.aio.
+        """
+        from salt.targeting.aio import amatch
+        return amatch(self, obj)
+
+    def check_parallel(self, objs, workers=None, chunksize=None):
+        """
+        Optimistic check, sharded across a pool of processes.
+        """
+        from salt.targeting.parallel import check_parallel
+        return check_parallel(self, objs, workers, chunksize)
+
+    def check_fleet(self, fleet):
+        """
+        Optimistic check of a whole Fleet or FleetSnapshot, evaluated with
+        bitmaps.
+        """
+        started = default_timer()
+        with evaluation():
+            matched, doubtful = measured_bitmap(self, fleet,
+                                                count(fleet.everything))
+        results = fleet.subjects(matched | doubtful)
+        if doubtful and not isinstance(fleet, FleetSnapshot):
+            # snapshots return ids, which cannot be marked
+            for obj in fleet.subjects(doubtful):
+                mark_doubt(obj)
+        metrics.checked(started, len(results), count(doubtful))
+        return results
+
+    def bitmap(self, fleet):
+        """
+        Evaluates rule over all the positions of fleet at once.
+
+        Returns the bitmap of the matching positions, and the bitmap of the
+        positions which cannot be decided, because of missing data.
+        """
+        if isinstance(fleet, FleetSnapshot):
+            # snapshots only hold targeting data, nothing can be decided
+            return 0, fleet.everything
+        positions = fleet.positions
+        matched, unknown = self.select(fleet)
+        return from_positions(positions[obj.id] for obj in matched), \
+            from_positions(positions[obj.id] for obj in unknown)
 
     @abstractmethod
+    def select(self, objs):
+        """
+        Evaluates rule over objs, with three-valued logic.
+
+        Returns the set of the matching objs, and the set of the ones
+        which cannot be decided, because of missing data. Other objs do
+        not match.
+        """
+        return set(objs), set()
+
     def filter(self, objs):
-        return objs
+        """
+        Yields the matching objs, then the undecided ones, which are marked
+        as doubtful.
+        """
+        matched, unknown = self.select(objs)
+        for obj in matched:
+            yield obj
+        for obj in unknown:
+            yield mark_doubt(obj)
 
     @abstractmethod
     def match(self, obj):
@@ -103,6 +432,16 @@ class Rule(object):
         """
         return obj
 
+    @property
+    def stats(self):
+        """
+        Statistics of the evaluations of rule, see salt.targeting.stats.
+        """
+        try:
+            return self.__dict__['stats']
+        except KeyError:
+            return self.__dict__.setdefault('stats', RuleStats())
+
     def __and__(self, other):
         return AllRule(self, other)
 
@@ -116,6 +455,9 @@ class Rule(object):
         return isinstance(other, self.__class__) \
            and self.priority == other.priority
 
+    def __hash__(self):
+        return rule_hash(self)
+
     def __lt__(self, other):
         """
         Ordering is 10, 20, 30 ... None.
@@ -133,31 +475,66 @@ class AllRule(Rule):
     priority = 70
 
     def __init__(self, *rules):
-        self.rules = set(rule_flatten(self, rules))
-
-    def filter(self, objs):
-        for rule in self:
-            results, objs = rule.filter(objs), set()
-            for obj in results:
-                if is_deceipt(obj):
-                    yield obj
-                else:
-                    objs.add(obj)
-            if not objs:
-                raise StopIteration
-        for obj in objs:
-            yield obj
+        self.rules = frozenset(rule_flatten(self, rules))
+
+    def select(self, objs):
+        return walk_select(self, objs)
+
+    @memoized_select
+    def select_walk(self, objs):
+        if not isinstance(objs, Fleet):
+            objs = set(objs)
+        fleet = objs
+        matched, unknown = set(objs), set()
+        for rule in self.ordered():
+            if not matched and not unknown:
+                break
+            # rules only see the candidates left by the previous ones
+            rule_matched, rule_unknown = yield rule, objs
+            matched &= rule_matched
+            unknown = (rule_matched | rule_unknown) - matched
+            objs = narrow(fleet, matched | unknown)
+        yield None, (matched, unknown)
+
+    @memoized
+    def bitmap(self, fleet):
+        matched, doubtful = fleet.everything, 0
+        size = count(matched)
+        for rule in self.ordered():
+            if not matched | doubtful:
+                break
+            rule_matched, rule_doubtful = measured_bitmap(rule, fleet, size)
+            candidates = (matched | doubtful) & (rule_matched | rule_doubtful)
+            matched &= rule_matched
+            doubtful = candidates & ~matched
+        return matched, doubtful
 
     def match(self, obj):
-        return all(obj for rule in self if rule.match(obj))
+        return walk_match(self, obj)
+
+    @memoized_walk
+    def match_walk(self, obj):
+        for rule in self.ordered():
+            if not (yield rule, obj):
+                yield None, False
+                return
+        yield None, True
+
+    def ordered(self):
+        """
+        Returns rules in evaluation order, cheap and selective ones first.
+        """
+        return adaptive_order(self.rules, all_rank)
 
     def __and__(self, rule):
-        self.rules.update(rule_flatten(self, [rule]))
-        return self
+        return AllRule(self, rule)
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'rules')
 
+    def __hash__(self):
+        return rule_hash(self, 'rules')
+
     def __iter__(self):
         """
         Iterate rules by priority.
@@ -174,35 +551,108 @@ class AnyRule(Rule):
     priority = 80
 
     def __init__(self, *rules):
-        self.rules = set(rule_flatten(self, rules))
+        self.rules = frozenset(rule_flatten(self, rules))
 
-    def filter(self, objs):
+    @lazy_property
+    def merged(self):
+        """
+        Merges GlobRule and PCRERule children into a single matcher on id.
+
+        Returns the matcher (or None) and the remaining rules.
+        """
+        globs, pcres, others = [], [], []
+        for rule in self.rules:
+            if type(rule) is GlobRule:
+                globs.append(rule.expr)
+            elif type(rule) is PCRERule and AlternationMatcher.mergeable(rule.expr):
+                pcres.append(rule.expr)
+            else:
+                others.append(rule)
+        if len(globs) + len(pcres) < 2:
+            return None, sorted(self.rules)
+        try:
+            matcher = AlternationMatcher(globs, pcres)
+        except (re.error, AssertionError, OverflowError) as e:
+            log.debug('Cannot merge rules of {0}: {1}'.format(self, e))
+            return None, sorted(self.rules)
+        return matcher, sorted(others)
+
+    def select(self, objs):
+        return walk_select(self, objs)
+
+    @memoized_select
+    def select_walk(self, objs):
+        matched, unknown = set(), set()
         if not objs:
-            raise StopIteration
+            yield None, (matched, unknown)
+            return
 
-        remaining = set(objs)
-        for rule in self:
-            try:
-                found = rule.filter(remaining)
-                for obj in found:
-                    yield obj
-            except Exception as e:
-                log.exception('Exception thrown %s . current rule %s', e, rule)
-                raise e
-            remaining -= set(found)
+        remaining = narrow(objs, objs)
+        matcher, rules = self.merged
+        if matcher:
+            matched.update(obj for obj in remaining if matcher(obj.id))
+            remaining.difference_update(matched)
+
+        for rule in self.ordered(rules):
             if not remaining:
-                raise StopIteration
+                break
+            rule_matched, rule_unknown = yield rule, remaining
+            matched |= rule_matched
+            unknown = (unknown | rule_unknown) - matched
+            remaining.difference_update(rule_matched)
+        yield None, (matched, unknown)
+
+    @memoized
+    def bitmap(self, fleet):
+        matched, doubtful = 0, 0
+        matcher, rules = self.merged
+        if matcher and isinstance(fleet, FleetSnapshot):
+            matched = fleet.id_bitmap(matcher)
+        elif matcher:
+            matched, doubtful = attr_bitmap(fleet, 'id', matcher)
+        everything = fleet.everything
+        size = count(everything)
+        for rule in self.ordered(rules):
+            if matched == everything:
+                break
+            rule_matched, rule_doubtful = measured_bitmap(rule, fleet, size)
+            matched |= rule_matched
+            doubtful = (doubtful | rule_doubtful) & ~matched
+        return matched, doubtful
 
     def match(self, obj):
-        return any(obj for rule in self if rule.match(obj))
+        return walk_match(self, obj)
+
+    @memoized_walk
+    def match_walk(self, obj):
+        matcher, rules = self.merged
+        if matcher and matcher(obj.id):
+            yield None, True
+            return
+        for rule in self.ordered(rules):
+            if (yield rule, obj):
+                yield None, True
+                return
+        yield None, False
+
+    def ordered(self, rules=None):
+        """
+        Returns rules (by default all of them) in evaluation order, cheap
+        and matching ones first.
+        """
+        if rules is None:
+            rules = self.rules
+        return adaptive_order(rules, any_rank)
 
     def __or__(self, rule):
-        self.rules.update(rule_flatten(self, [rule]))
-        return self
+        return AnyRule(self, rule)
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'rules')
 
+    def __hash__(self):
+        return rule_hash(self, 'rules')
+
     def __iter__(self):
         """
         Iterate rules by priority.
@@ -220,16 +670,30 @@ class NotRule(Rule):
     def __init__(self, rule):
         self.rule = rule
 
-    def filter(self, objs):
-        # do not discard misleading objs
-        # they don't always implements required attrs
-        doubtful_objs = [Doubtful(obj) for obj in objs]
-        found = self.rule.filter(doubtful_objs)
-        removable = set([d.obj for d in found if not d.doubt])
-        return set(objs) - removable
+    def select(self, objs):
+        return walk_select(self, objs)
+
+    @memoized_select
+    def select_walk(self, objs):
+        if not isinstance(objs, Fleet):
+            objs = set(objs)
+        # undecided objs stay undecided once negated
+        matched, unknown = yield self.rule, objs
+        yield None, (set(objs) - matched - unknown, unknown)
+
+    @memoized
+    def bitmap(self, fleet):
+        everything = fleet.everything
+        matched, doubtful = measured_bitmap(self.rule, fleet,
+                                            count(everything))
+        return everything & ~(matched | doubtful), doubtful
 
     def match(self, obj):
-        return not self.rule.match(obj)
+        return walk_match(self, obj)
+
+    @memoized_walk
+    def match_walk(self, obj):
+        yield None, not (yield self.rule, obj)
 
     def __neg__(self):
         return self.rule
@@ -237,6 +701,9 @@ class NotRule(Rule):
     def __eq__(self, other):
         return rule_cmp(self, other, 'rule')
 
+    def __hash__(self):
+        return rule_hash(self, 'rule')
+
     def __str__(self):
         name = self.__class__.__name__
         args = [str(self.rule)]
@@ -249,17 +716,41 @@ class GlobRule(Rule):
     def __init__(self, expr):
         self.expr = expr
 
-    def filter(self, objs):
-        for obj in objs:
-            if glob_match(self.expr, obj.id):
-                yield obj
+    @lazy_property
+    def pattern(self):
+        return glob_compile(self.expr)
+
+    def select(self, objs):
+        if isinstance(objs, Fleet):
+            return attr_select(objs, 'id', self.pattern.match, self.resolve)
+        return self.scan(objs), set()
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return fleet.id_bitmap(self.pattern.match), 0
+        return attr_bitmap(fleet, 'id', self.pattern.match, self.resolve)
+
+    def scan(self, objs):
+        match = self.pattern.match
+        return set(obj for obj in objs if match(obj.id))
+
+    def resolve(self, fleet):
+        candidates = fleet.names.lookup(self.expr)
+        if candidates is None:
+            return None
+        if is_literal(self.expr):
+            return candidates, (), ()
+        return (), candidates, ()
 
     def match(self, obj):
-        return glob_match(self.expr, obj.id)
+        return bool(self.pattern.match(obj.id))
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'expr')
 
+    def __hash__(self):
+        return rule_hash(self, 'expr')
+
     def __str__(self):
         return rule_str(self, 'expr')
 
@@ -270,19 +761,28 @@ class PCRERule(Rule):
     def __init__(self, expr):
         self.expr = expr
 
-    def filter(self, objs):
-        pattern = pcre_compile(self.expr)
-        for obj in objs:
-            if pattern.match(obj.id):
-                yield obj
+    @lazy_property
+    def pattern(self):
+        return pcre_compile(self.expr)
+
+    def select(self, objs):
+        match = self.pattern.match
+        return set(obj for obj in objs if match(obj.id)), set()
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return fleet.id_bitmap(self.pattern.match), 0
+        return attr_bitmap(fleet, 'id', self.pattern.match)
 
     def match(self, obj):
-        pattern = pcre_compile(self.expr)
-        return pattern.match(obj.id)
+        return bool(self.pattern.match(obj.id))
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'expr')
 
+    def __hash__(self):
+        return rule_hash(self, 'expr')
+
     def __str__(self):
         return rule_str(self, 'expr')
 
@@ -294,22 +794,33 @@ class GrainRule(Rule):
         self.expr = expr
         self.delim = delim
 
-    def filter(self, objs):
-        for obj in objs:
-            if obj.grains is None:
-                yield mark_doubt(obj)
-            elif self.match(obj):
-                yield obj
+    @lazy_property
+    def matcher(self):
+        return PathMatcher(self.expr, self.delim)
+
+    def select(self, objs):
+        return attr_select(objs, 'grains', self.matcher,
+                           index_resolver('grains', self.expr, self.delim))
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return fleet.path_bitmap('grains', self.expr, self.delim)
+        return attr_bitmap(fleet, 'grains', self.matcher,
+                           index_resolver('grains', self.expr, self.delim))
 
     def match(self, obj):
         if obj.grains is None:
-            log.warning('grains are missing {0}'.format(obj.id))
+            metrics.incr('missing.grains')
+            log.debug('grains are missing %s', obj.id)
             return False
-        return glob_match(self.expr, obj.grains, self.delim)
+        return self.matcher(obj.grains)
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'expr', 'delim')
 
+    def __hash__(self):
+        return rule_hash(self, 'expr', 'delim')
+
     def __str__(self):
         return rule_str(self, 'expr', 'delim')
 
@@ -321,22 +832,33 @@ class PillarRule(Rule):
         self.expr = expr
         self.delim = delim
 
-    def filter(self, objs):
-        for obj in objs:
-            if obj.pillar is None:
-                yield mark_doubt(obj)
-            elif self.match(obj):
-                yield obj
+    @lazy_property
+    def matcher(self):
+        return PathMatcher(self.expr, self.delim)
+
+    def select(self, objs):
+        return attr_select(objs, 'pillar', self.matcher,
+                           index_resolver('pillar', self.expr, self.delim))
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return fleet.path_bitmap('pillar', self.expr, self.delim)
+        return attr_bitmap(fleet, 'pillar', self.matcher,
+                           index_resolver('pillar', self.expr, self.delim))
 
     def match(self, obj):
         if obj.pillar is None:
-            log.warning('pillar is missing {0}'.format(obj.id))
+            metrics.incr('missing.pillar')
+            log.debug('pillar is missing %s', obj.id)
             return False
-        return glob_match(self.expr, obj.pillar, self.delim)
+        return self.matcher(obj.pillar)
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'expr', 'delim')
 
+    def __hash__(self):
+        return rule_hash(self, 'expr', 'delim')
+
     def __str__(self):
         return rule_str(self, 'expr', 'delim')
 
@@ -348,22 +870,32 @@ class GrainPCRERule(Rule):
         self.expr = expr
         self.delim = delim
 
-    def filter(self, objs):
-        for obj in objs:
-            if obj.grains is None:
-                yield mark_doubt(obj)
-            elif self.match(obj):
-                yield obj
+    @lazy_property
+    def matcher(self):
+        return PathMatcher(self.expr, self.delim, pcre_compile)
+
+    def select(self, objs):
+        return attr_select(objs, 'grains', self.matcher)
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return fleet.path_bitmap('grains', self.expr, self.delim,
+                                     pcre_compile)
+        return attr_bitmap(fleet, 'grains', self.matcher)
 
     def match(self, obj):
         if obj.grains is None:
-            log.warning('grains are missing {0}'.format(obj.id))
+            metrics.incr('missing.grains')
+            log.debug('grains are missing %s', obj.id)
             return False
-        return pcre_match(self.expr, obj.grains, self.delim)
+        return self.matcher(obj.grains)
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'expr', 'delim')
 
+    def __hash__(self):
+        return rule_hash(self, 'expr', 'delim')
+
     def __str__(self):
         return rule_str(self, 'expr', 'delim')
 
@@ -374,50 +906,134 @@ class SubnetIPRule(Rule):
     def __init__(self, expr):
         self.expr = expr
 
-    def filter(self, objs):
-        for obj in objs:
-            if obj.ipv4 is None:
-                yield mark_doubt(obj)
-            elif self.match(obj):
-                yield obj
+    @lazy_property
+    def matcher(self):
+        return CIDRMatcher(self.expr)
+
+    def select(self, objs):
+        return attr_select(objs, 'ipv4', self.matcher, self.resolve)
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return fleet.ip_bitmap(self.expr)
+        return attr_bitmap(fleet, 'ipv4', self.matcher, self.resolve)
+
+    def resolve(self, fleet):
+        candidates = fleet.ips.lookup(self.expr)
+        if candidates is None:
+            return None
+        if '/' in self.expr:
+            return candidates, (), fleet.ips.missing
+        # a single address is compared as a string by the matcher
+        return (), candidates, fleet.ips.missing
 
     def match(self, obj):
         if obj.ipv4 is None:
-            log.warning('ipv4 is missing {0}'.format(obj.id))
+            metrics.incr('missing.ipv4')
+            log.debug('ipv4 is missing %s', obj.id)
             return False
-        return ipcidr_match(self.expr, obj.ipv4)
+        return self.matcher(obj.ipv4)
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'expr')
 
+    def __hash__(self):
+        return rule_hash(self, 'expr')
+
     def __str__(self):
         return rule_str(self, 'expr')
 
 
 class ExselRule(Rule):
+    """
+    Matches minions which function expr returns a truthy value.
+
+    When exsel_timeout is set, functions are called into a shared pool of
+    exsel_workers threads, and the ones which do not return in
+    exsel_timeout seconds are considered as doubtful.
+    """
     priority = 60
 
-    def __init__(self, expr):
+    def __init__(self, expr, exsel_workers=4, exsel_timeout=None):
         self.expr = expr
+        self.workers = exsel_workers
+        self.timeout = exsel_timeout
 
-    def filter(self, objs):
+    def select(self, objs):
+        matched, unknown, candidates = set(), set(), []
         for obj in objs:
             if obj.functions is None:
-                yield mark_doubt(obj)
-            elif self.match(obj):
-                yield obj
+                unknown.add(obj)
+            else:
+                candidates.append(obj)
+        timeouts = 0
+        for obj, result in zip(candidates, self.evaluate(candidates)):
+            if result is TIMEOUT:
+                timeouts += 1
+                unknown.add(obj)
+            elif result:
+                matched.add(obj)
+        if timeouts:
+            metrics.incr('exsel.timeouts', timeouts)
+            log.warning('%s timed out on %d minions', self.expr, timeouts)
+        return matched, unknown
 
     def match(self, obj):
+        result, = self.evaluate([obj])
+        if result is TIMEOUT:
+            metrics.incr('exsel.timeouts')
+            log.debug('%s timed out %s', self.expr, obj.id)
+            return False
+        return result
+
+    def evaluate(self, objs):
+        """
+        Returns the results of expr for objs. Results are shared with the
+        other leaves of the current evaluation.
+        """
+        memo = current_memo()
+        if memo is None:
+            memo = {}
+        keys = [self.key(obj) for obj in objs]
+        pending = []
+        for key, obj in zip(keys, objs):
+            if key not in memo:
+                keep(memo, obj)
+                memo[key] = None
+                pending.append((key, obj))
+        if self.timeout is None:
+            for key, obj in pending:
+                memo[key] = self.call(obj)
+        elif pending:
+            funcs = [partial(self.call, obj) for key, obj in pending]
+            results = call_all(funcs, self.workers, self.timeout)
+            for (key, obj), result in zip(pending, results):
+                memo[key] = result
+        return [memo[key] for key in keys]
+
+    def key(self, obj):
+        """
+        Returns the key of the result of obj into evaluation memos, which
+        must keep obj.
+        """
+        return id(obj), self.expr
+
+    def call(self, obj):
         if obj.functions is None:
-            log.warning('functions is None {0}'.format(obj.id))
+            metrics.incr('missing.functions')
+            log.debug('functions is None %s', obj.id)
             return False
         if self.expr not in obj.functions:
-            log.warning('functions is missing {0}'.format(obj.id))
+            metrics.incr('exsel.undefined')
+            log.debug('functions is missing %s', obj.id)
             return False
         return bool(obj.functions[self.expr]())
 
     def __eq__(self, other):
-        return rule_cmp(self, other, 'expr')
+        return rule_cmp(self, other, 'expr', 'workers', 'timeout')
+
+    def __hash__(self):
+        return rule_hash(self, 'expr', 'workers', 'timeout')
 
     def __str__(self):
         return rule_str(self, 'expr')
@@ -430,22 +1046,31 @@ class LocalStoreRule(Rule):
         self.expr = expr
         self.delim = delim
 
-    def filter(self, objs):
-        for obj in objs:
-            if obj.data is None:
-                yield mark_doubt(obj)
-            elif self.match(obj):
-                yield obj
+    @lazy_property
+    def matcher(self):
+        return PathMatcher(self.expr, self.delim)
+
+    def select(self, objs):
+        return attr_select(objs, 'data', self.matcher)
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return Rule.bitmap(self, fleet)
+        return attr_bitmap(fleet, 'data', self.matcher)
 
     def match(self, obj):
         if obj.data is None:
-            log.warning('data is None {0}'.format(obj.id))
+            metrics.incr('missing.data')
+            log.debug('data is None %s', obj.id)
             return False
-        return glob_match(self.expr, obj.data, self.delim)
+        return self.matcher(obj.data)
 
     def __eq__(self, other):
         return rule_cmp(self, other, 'expr', 'delim')
 
+    def __hash__(self):
+        return rule_hash(self, 'expr', 'delim')
+
     def __str__(self):
         return rule_str(self, 'expr', 'delim')
 
@@ -461,29 +1086,102 @@ class YahooRangeRule(Rule):
         self.expr = expr
         self.provider = provider
 
-    def filter(self, objs):
-        remains = {}
+    def hosts(self):
+        """
+        Returns the fqdns of expr, as a set. They are fetched once per
+        evaluation.
+        """
+        memo = current_memo()
+        if memo is None:
+            return self.fetch()
+        key = self.key()
+        if key not in memo:
+            memo[key] = self.fetch()
+        return memo[key]
+
+    def key(self):
+        return 'range', id(self.provider), self.expr
+
+    def fetch(self):
+        hosts = self.provider.get(self.expr)
+        if not isinstance(hosts, (set, frozenset)):
+            hosts = frozenset(hosts)
+        return hosts
+
+    def select(self, objs):
+        matched, unknown, hosts = set(), set(), None
         for obj in objs:
             if obj.fqdn is None:
-                yield mark_doubt(obj)
-            else:
-                remains[obj.fqdn] = obj
-        if remains:
-            for host in self.provider.get(self.expr):
-                if host in remains:
-                    yield remains.pop(host)
-                if not remains:
-                    raise StopIteration
+                unknown.add(obj)
+                continue
+            if hosts is None:
+                hosts = self.hosts()
+            if obj.fqdn in hosts:
+                matched.add(obj)
+        return matched, unknown
+
+    def bitmap(self, fleet):
+        if isinstance(fleet, FleetSnapshot):
+            return fleet.fqdn_bitmap(self.hosts())
+        return Rule.bitmap(self, fleet)
 
     def match(self, obj):
         if obj.fqdn is None:
-            log.warning('fqdn is None {0}'.format(obj.id))
+            metrics.incr('missing.fqdn')
+            log.debug('fqdn is None %s', obj.id)
             return False
-
-        return obj.fqdn in self.provider.get(self.expr)
+        return obj.fqdn in self.hosts()
 
     def __eq__(self, other):
-        return rule_cmp(self, other, 'expr')
+        return rule_cmp(self, other, 'expr', 'provider')
+
+    def __hash__(self):
+        # providers may not be hashable
+        return rule_hash(self, 'expr')
 
     def __str__(self):
         return rule_str(self, 'expr', 'provider')
+
+
+class TrueRule(Rule):
+    """
+    Matches everything, tautologies are simplified into it.
+    """
+    priority = 0
+
+    def select(self, objs):
+        return set(objs), set()
+
+    def bitmap(self, fleet):
+        return fleet.everything, 0
+
+    def match(self, obj):
+        return True
+
+    def __neg__(self):
+        return FalseRule()
+
+    def __str__(self):
+        return rule_str(self)
+
+
+class FalseRule(Rule):
+    """
+    Matches nothing, contradictions are simplified into it.
+    """
+    priority = 0
+
+    def select(self, objs):
+        return set(), set()
+
+    def bitmap(self, fleet):
+        return 0, 0
+
+    def match(self, obj):
+        return False
+
+    def __neg__(self):
+        return TrueRule()
+
+    def __str__(self):
+        return rule_str(self)
@@ -0,0 +1,496 @@
+'''
+
+salt.targeting.snapshot
+~~~~~~~~~~~~~~~~~~~~~~~
+
+A fleet snapshot stores the targeting data of all the minions column by
+column, instead of keeping a dict of grains and pillar per minion.
+
+- ids are kept in a list, which index is the position of the minion
+- fqdns are ids into a pool of interned strings
+- IPv4 addresses are packed integers, sorted with their owner position
+- grains and pillar are flattened into one column per key path, holding
+  the positions and the interned values found under this path
+
+Rules evaluate against it column wise, with bitmaps:
+
+.. code:: python
+
+    snapshot = FleetSnapshot(minions)
+    rule.check_fleet(snapshot)  # returns minion ids
+
+Snapshots can be dumped into a binary file, and loaded back with mmap, so
+that all the processes of a master share the same pages:
+
+.. code:: python
+
+    snapshot.dump('/var/cache/salt/master/fleet.snapshot')
+    snapshot = FleetSnapshot.load('/var/cache/salt/master/fleet.snapshot')
+
+The file starts with a magic string and the length of a JSON header, which
+lists the sections of the file: the id table, the string pool (offsets,
+utf-8 blob and sorted order), the fqdns, the sorted IPv4 addresses with
+their owners, the missing bitmaps, and the 2 arrays of each key path
+column. Under Python 3 arrays are memoryviews of the mapping, under
+Python 2 they are copied.
+
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+from salt._compat import PY3, string_types, bytes_, native_
+from salt.targeting.fleet import splits, token
+from salt.utils import lazy_property
+from salt.utils.bitmap import from_positions, to_positions, full
+from salt.utils.bitmap import from_bytes, to_bytes
+from salt.utils.matching import Mapping, cidr_range, ip_to_int, glob_compile
+import logging
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'FleetSnapshot',
+    'StringPool',
+]
+
+#: first bytes of a snapshot file
+MAGIC = b'SALTFLT1'
+
+#: sections are aligned on this count of bytes
+ALIGNMENT = 8
+
+
+class StringPool(object):
+    """
+    Interns strings, so that each distinct value is stored once.
+    """
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self.ids = {}
+        for string in strings:
+            self.intern(string)
+
+    def intern(self, string):
+        try:
+            return self.ids[string]
+        except KeyError:
+            self.ids[string] = id = len(self.strings)
+            self.strings.append(string)
+            return id
+
+    def get(self, string, default=None):
+        return self.ids.get(string, default)
+
+    def __getitem__(self, id):
+        return self.strings[id]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class Column(object):
+    """
+    Values found under one key path, as parallel arrays of positions and
+    interned values.
+    """
+
+    def __init__(self, positions=None, values=None):
+        self.positions = array('I') if positions is None else positions
+        self.values = array('I') if values is None else values
+        self._distinct = None
+
+    def append(self, position, value):
+        self.positions.append(position)
+        self.values.append(value)
+        self._distinct = None
+
+    def distinct(self):
+        """
+        Returns the distinct interned values of this column.
+        """
+        if self._distinct is None:
+            self._distinct = frozenset(self.values)
+        return self._distinct
+
+    def select(self, values):
+        """
+        Returns the positions which value is into values.
+        """
+        return [position for position, value
+                in zip(self.positions, self.values) if value in values]
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class FleetSnapshot(object):
+    """
+    Columnar snapshot of the targeting data of subjects.
+    """
+
+    def __init__(self, subjects=(), attrs=('grains', 'pillar')):
+        self.attrs = attrs
+        self.ids = []
+        self.strings = StringPool()
+        self.fqdns = array('i')
+        self.ipv4 = array('I')
+        self.ipv4_owners = array('I')
+        self.invalid_ipv4 = {}
+        self.columns = dict((attr, {}) for attr in attrs)
+        missing = dict((attr, []) for attr in attrs + ('fqdn', 'ipv4'))
+
+        addrs = []
+        for subject in subjects:
+            position = len(self.ids)
+            self.ids.append(subject.id)
+            self.strings.intern(subject.id)
+
+            fqdn = getattr(subject, 'fqdn', None)
+            if fqdn is None:
+                missing['fqdn'].append(position)
+                self.fqdns.append(-1)
+            else:
+                self.fqdns.append(self.strings.intern(fqdn))
+
+            ipv4 = getattr(subject, 'ipv4', None)
+            if ipv4 is None:
+                missing['ipv4'].append(position)
+            else:
+                if isinstance(ipv4, string_types):
+                    ipv4 = [ipv4]
+                for ipaddr in ipv4:
+                    try:
+                        addrs.append((ip_to_int(ipaddr), position))
+                    except (socket.error, TypeError):
+                        if isinstance(ipaddr, string_types):
+                            # still compared as a string by the rule
+                            self.invalid_ipv4.setdefault(ipaddr, []).append(
+                                position)
+                        log.debug('{0} is not an IPv4 of {1}'.format(
+                            repr(ipaddr), subject.id))
+
+            for attr in attrs:
+                data = getattr(subject, attr, None)
+                if data is None:
+                    missing[attr].append(position)
+                else:
+                    self.walk(self.columns[attr], position, data, ())
+
+        addrs.sort()
+        for addr, position in addrs:
+            self.ipv4.append(addr)
+            self.ipv4_owners.append(position)
+        self.missing = dict((key, from_positions(positions))
+                            for key, positions in missing.items())
+        self.everything = full(len(self.ids))
+
+    def walk(self, columns, position, data, path):
+        if isinstance(data, list):
+            for element in data:
+                self.walk(columns, position, element, path)
+        if isinstance(data, Mapping):
+            for key, value in data.items():
+                self.walk(columns, position, value, path + (key,))
+        elif path:
+            column = columns.get(path)
+            if column is None:
+                column = columns[path] = Column()
+            column.append(position, self.strings.intern(token(data)))
+
+    @lazy_property
+    def positions(self):
+        return dict((id, position) for position, id in enumerate(self.ids))
+
+    def subjects(self, bitmap):
+        """
+        Returns the ids of the minions set into bitmap.
+        """
+        ids = self.ids
+        return set(ids[position] for position in to_positions(bitmap))
+
+    def id_bitmap(self, match):
+        """
+        Returns the bitmap of the ids accepted by match.
+        """
+        return from_positions(position for position, id
+                              in enumerate(self.ids) if match(id))
+
+    def path_bitmap(self, attr, expr, delim, compile=glob_compile):
+        """
+        Returns the bitmaps of the minions which attr matches expr, and of
+        the ones which cannot be decided.
+
+        Patterns are tested once per distinct value of each column. Like
+        FleetIndex.lookup, minions which have a key equal to a whole part
+        of expr are unsure: matching stops at the first value it finds,
+        and columns do not tell which one. Snapshots do not hold the data
+        to verify them, so they are undecided, along with the minions
+        which miss attr.
+        """
+        columns, strings = self.columns[attr], self.strings
+        matched, unsure = [], []
+        for path, pattern in splits(expr, delim):
+            column = columns.get(path)
+            if column is None:
+                continue
+            if pattern is None:
+                unsure.extend(column.positions)
+                continue
+            match = compile(pattern).match
+            values = set(value for value in column.distinct()
+                         if match(strings[value]))
+            if values:
+                matched.extend(column.select(values))
+        unsure = from_positions(unsure)
+        return from_positions(matched) & ~unsure, self.missing[attr] | unsure
+
+    def ip_bitmap(self, expr):
+        """
+        Returns the bitmaps of the minions which have an address into
+        network expr, and of the ones without addresses.
+        """
+        try:
+            low, high = cidr_range(expr)
+        except ValueError:
+            positions = self.invalid_ipv4.get(expr, ())
+            return from_positions(positions), self.missing['ipv4']
+        start = bisect_left(self.ipv4, low)
+        stop = bisect_right(self.ipv4, high, start)
+        return from_positions(self.ipv4_owners[start:stop]), \
+            self.missing['ipv4']
+
+    def fqdn_bitmap(self, hosts):
+        """
+        Returns the bitmaps of the minions which fqdn is into hosts, and of
+        the ones without fqdn.
+        """
+        wanted = set(self.strings.get(host, -1) for host in hosts)
+        wanted.discard(-1)
+        return from_positions(position for position, fqdn
+                              in enumerate(self.fqdns) if fqdn in wanted), \
+            self.missing['fqdn']
+
+    def dump(self, path):
+        """
+        Writes the snapshot to path, atomically.
+        """
+        writer = SnapshotWriter()
+        strings = [bytes_(string, 'utf-8') for string in self.strings.strings]
+        offsets, offset = array('I', [0]), 0
+        for string in strings:
+            offset += len(string)
+            offsets.append(offset)
+        writer.add('strings.offsets', offsets)
+        writer.add('strings.blob', b''.join(strings))
+        order = sorted(range(len(strings)), key=strings.__getitem__)
+        writer.add('strings.order', array('I', order))
+        writer.add('ids', array('I', [self.strings.get(id)
+                                      for id in self.ids]))
+        writer.add('fqdns', self.fqdns)
+        writer.add('ipv4', self.ipv4)
+        writer.add('ipv4_owners', self.ipv4_owners)
+        for key, bitmap in self.missing.items():
+            writer.add('missing.' + key, to_bytes(bitmap))
+        columns = []
+        for attr, paths in self.columns.items():
+            for keys, column in paths.items():
+                if not all(isinstance(key, string_types) for key in keys):
+                    # dig only looks for string keys
+                    continue
+                name = 'column.{0}'.format(len(columns))
+                columns.append([attr, [native_(key, 'utf-8') for key in keys],
+                                name])
+                writer.add(name + '.positions', column.positions)
+                writer.add(name + '.values', column.values)
+        writer.write(path, {
+            'attrs': list(self.attrs),
+            'size': len(self.ids),
+            'columns': columns,
+            'invalid_ipv4': self.invalid_ipv4,
+        })
+
+    @classmethod
+    def load(cls, path):
+        """
+        Maps the snapshot file path.
+        """
+        reader = SnapshotReader(path)
+        header = reader.header
+        snapshot = cls.__new__(cls)
+        snapshot.attrs = tuple(native_(attr) for attr in header['attrs'])
+        snapshot.strings = MappedStringPool(reader.array('strings.offsets'),
+                                            reader.bytes('strings.blob'),
+                                            reader.array('strings.order'))
+        snapshot.ids = MappedStrings(snapshot.strings, reader.array('ids'))
+        snapshot.fqdns = reader.array('fqdns')
+        snapshot.ipv4 = reader.array('ipv4')
+        snapshot.ipv4_owners = reader.array('ipv4_owners')
+        snapshot.invalid_ipv4 = dict(
+            (native_(key, 'utf-8'), value)
+            for key, value in header['invalid_ipv4'].items())
+        snapshot.missing = dict(
+            (key, from_bytes(reader.bytes('missing.' + key)))
+            for key in snapshot.attrs + ('fqdn', 'ipv4'))
+        snapshot.columns = dict((attr, {}) for attr in snapshot.attrs)
+        for attr, path, name in header['columns']:
+            path = tuple(native_(key, 'utf-8') for key in path)
+            snapshot.columns[native_(attr)][path] = Column(
+                reader.array(name + '.positions'),
+                reader.array(name + '.values'))
+        snapshot.everything = full(header['size'])
+        snapshot.reader = reader
+        return snapshot
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return '<{0} of {1} minions, {2} strings>'.format(
+            self.__class__.__name__, len(self.ids), len(self.strings))
+
+
+
+class MappedStringPool(object):
+    """
+    Read only StringPool over a snapshot file.
+
+    Strings are decoded on access, and looked up by bisecting their sorted
+    order.
+    """
+
+    def __init__(self, offsets, blob, order):
+        self.offsets = offsets
+        self.blob = blob
+        self.order = order
+
+    def raw(self, id):
+        return bytes(self.blob[self.offsets[id]:self.offsets[id + 1]])
+
+    def get(self, string, default=None):
+        string = bytes_(string, 'utf-8')
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(self.order[middle]) < string:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.order) and self.raw(self.order[low]) == string:
+            return self.order[low]
+        return default
+
+    def __getitem__(self, id):
+        return native_(self.raw(id), 'utf-8')
+
+    def __len__(self):
+        return len(self.order)
+
+
+class MappedStrings(object):
+    """
+    Sequence of strings, stored as ids into a MappedStringPool.
+    """
+
+    def __init__(self, strings, ids):
+        self.strings = strings
+        self.ids = ids
+
+    def __getitem__(self, position):
+        return self.strings[self.ids[position]]
+
+    def __iter__(self):
+        strings = self.strings
+        for id in self.ids:
+            yield strings[id]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class SnapshotWriter(object):
+    def __init__(self):
+        self.sections = []
+
+    def add(self, name, data):
+        """
+        Adds a section, data is either an array or bytes.
+        """
+        typecode = getattr(data, 'typecode', None)
+        if typecode is not None:
+            data = data.tostring() if not PY3 else data.tobytes()
+        self.sections.append((name, typecode, data))
+
+    def write(self, path, header):
+        directory, offset = {}, 0
+        for name, typecode, data in self.sections:
+            directory[name] = [offset, len(data), typecode]
+            offset += padded(len(data))
+        header = dict(header, sections=directory, byteorder=sys.byteorder)
+        header = json.dumps(header, sort_keys=True).encode('utf-8')
+        start = padded(len(MAGIC) + 4 + len(header))
+
+        fd, tmp = tempfile.mkstemp(prefix='.snapshot-',
+                                   dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(MAGIC)
+                fh.write(struct.pack('<I', len(header)))
+                fh.write(header)
+                fh.write(b'\0' * (start - len(MAGIC) - 4 - len(header)))
+                for name, typecode, data in self.sections:
+                    fh.write(data)
+                    fh.write(b'\0' * (padded(len(data)) - len(data)))
+                fh.flush()
+                os.fsync(fh.fileno())
+            # readers keep their mapping of the replaced file
+            getattr(os, 'replace', os.rename)(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+
+class SnapshotReader(object):
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self.mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError('{0} is not a fleet snapshot'.format(path))
+        length, = struct.unpack_from('<I', self.mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(
+            self.mmap[start:start + length].decode('utf-8'))
+        if self.header['byteorder'] != sys.byteorder:
+            raise ValueError('{0} has another byte order'.format(path))
+        self.base = padded(start + length)
+
+    def section(self, name):
+        offset, length, typecode = self.header['sections'][name]
+        return self.base + offset, length, typecode
+
+    def bytes(self, name):
+        offset, length, typecode = self.section(name)
+        if PY3:
+            return memoryview(self.mmap)[offset:offset + length]
+        return self.mmap[offset:offset + length]
+
+    def array(self, name):
+        offset, length, typecode = self.section(name)
+        typecode = native_(typecode)
+        if PY3:
+            return memoryview(self.mmap)[offset:offset + length].cast(
+                typecode)
+        data = array(typecode)
+        data.fromstring(self.mmap[offset:offset + length])
+        return data
+
+
+def padded(length):
+    return (length + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
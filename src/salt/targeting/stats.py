@@ -0,0 +1,187 @@
+'''
+
+salt.targeting.stats
+~~~~~~~~~~~~~~~~~~~~
+
+Statistics of rule evaluations, which AllRule and AnyRule use to order
+their children.
+
+Children record how many subjects they evaluated, how long it took, and
+how many subjects matched or could not be decided. Statistics belong to
+rule instances, so they last as long as the rule is cached by its Query.
+
+AllRule evaluates first the children which are cheap and discard most
+subjects, AnyRule the ones which are cheap and match most subjects.
+Until every child has MIN_SAMPLES samples, children are ordered by
+priority.
+
+Measured evaluations of a single run can be collected with tracing, this
+is how Query.explain analyzes rules.
+
+'''
+
+from contextlib import contextmanager
+from timeit import default_timer
+import threading
+
+from salt.targeting import metrics
+from salt.utils.bitmap import count
+
+__all__ = [
+    'RuleStats',
+    'tracing',
+]
+
+#: samples needed by every child before they are reordered
+MIN_SAMPLES = 64
+
+#: past this count of samples, older ones are halved
+MAX_SAMPLES = 1 << 16
+
+#: lower bound of rates, so that ranks stay finite
+EPSILON = 1e-6
+
+#: traces of the current thread, see tracing
+local = threading.local()
+
+
+class RuleStats(object):
+    def __init__(self):
+        self.samples = 0
+        self.matched = 0
+        self.unknown = 0
+        self.elapsed = 0.0
+
+    def record(self, samples, matched, unknown, elapsed):
+        self.samples += samples
+        self.matched += matched
+        self.unknown += unknown
+        self.elapsed += elapsed
+        if self.samples > MAX_SAMPLES:
+            self.samples //= 2
+            self.matched //= 2
+            self.unknown //= 2
+            self.elapsed /= 2
+
+    @property
+    def cost(self):
+        """
+        Mean seconds spent per subject.
+        """
+        return self.elapsed / self.samples if self.samples else 0.0
+
+    @property
+    def selectivity(self):
+        """
+        Fraction of subjects which are kept, matching or undecided.
+        """
+        if not self.samples:
+            return 1.0
+        return float(self.matched + self.unknown) / self.samples
+
+    @property
+    def hit_rate(self):
+        """
+        Fraction of subjects which match.
+        """
+        if not self.samples:
+            return 0.0
+        return float(self.matched) / self.samples
+
+    def __repr__(self):
+        return '<RuleStats samples={0} cost={1:.3g} selectivity={2:.3f}>' \
+            .format(self.samples, self.cost, self.selectivity)
+
+
+class Trace(object):
+    """
+    Subjects evaluated by a rule during tracing, the ones it kept, the
+    ones it could not decide, and the time it took.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.objs_in = 0
+        self.objs_out = 0
+        self.doubtful = 0
+        self.elapsed = 0.0
+
+
+@contextmanager
+def tracing():
+    """
+    Collects the Trace of every rule measured into this context, by id of
+    rule.
+    """
+    traces = local.traces = {}
+    try:
+        yield traces
+    finally:
+        local.traces = None
+
+
+def trace(rule, samples, matched, unknown, elapsed):
+    metrics.evaluated(rule, samples, unknown)
+    traces = getattr(local, 'traces', None)
+    if traces is None:
+        return
+    current = traces.get(id(rule))
+    if current is None:
+        current = traces[id(rule)] = Trace()
+    current.calls += 1
+    current.objs_in += samples
+    current.objs_out += matched + unknown
+    current.doubtful += unknown
+    current.elapsed += elapsed
+
+
+def all_rank(stats):
+    return stats.cost / max(1 - stats.selectivity, EPSILON)
+
+
+def any_rank(stats):
+    return stats.cost / max(stats.hit_rate, EPSILON)
+
+
+def adaptive_order(rules, rank):
+    """
+    Returns rules sorted by the rank of their stats, or by priority while
+    some of them lack samples.
+    """
+    rules = sorted(rules)
+    if all(rule.stats.samples >= MIN_SAMPLES for rule in rules):
+        rules.sort(key=lambda rule: rank(rule.stats))
+    return rules
+
+
+def measured_select(rule, objs):
+    """
+    Returns rule.select(objs), and records it into the stats of rule.
+    """
+    started = default_timer()
+    matched, unknown = rule.select(objs)
+    measured(rule, len(objs), matched, unknown, default_timer() - started)
+    return matched, unknown
+
+
+def measured(rule, samples, matched, unknown, elapsed):
+    """
+    Records a selection of matched and unknown subjects out of samples,
+    which took elapsed seconds, into the stats of rule.
+    """
+    rule.stats.record(samples, len(matched), len(unknown), elapsed)
+    trace(rule, samples, len(matched), len(unknown), elapsed)
+
+
+def measured_bitmap(rule, fleet, size):
+    """
+    Returns rule.bitmap(fleet), and records it into the stats of rule.
+    Leaves always evaluate the size members of fleet.
+    """
+    started = default_timer()
+    matched, doubtful = rule.bitmap(fleet)
+    elapsed = default_timer() - started
+    matched_count, doubtful_count = count(matched), count(doubtful)
+    rule.stats.record(size, matched_count, doubtful_count, elapsed)
+    trace(rule, size, matched_count, doubtful_count, elapsed)
+    return matched, doubtful
@@ -6,7 +6,12 @@ salt.targeting.subjects
 
 '''
 
+from functools import partial
+
 from salt.utils import lazy_property
+from salt.utils.cache import MISSING, TTLCache
+from salt.utils.matching import Mapping
+from salt.targeting.loader import load_minion_data
 import logging
 log = logging.getLogger(__name__)
 
@@ -24,81 +29,120 @@ class Subject(object):
 
 
 class CheckableMinion(Subject):
-    def __init__(self, id):
+    """
+    Minion seen by the master, through its minion data cache.
+
+    cache may be given when the data were already loaded in bulk, see
+    salt.targeting.loader.MinionDataLoader.
+    """
+
+    def __init__(self, id, opts=None, cache=None):
         self.id = id
-        self.opts = opts
+        self.opts = opts or {}
+        if cache is not None:
+            self.cache = cache
 
-    @lazy_property
-    def fqdn(self):
+    def lookup(self, *keys):
         try:
-            self.cache['grains']['fqdn']
-        except KeyError:
+            data = self.cache
+            for key in keys:
+                data = data[key]
+            return data
+        except (KeyError, TypeError):
             return None
 
+    @lazy_property
+    def fqdn(self):
+        return self.lookup('grains', 'fqdn')
+
     @lazy_property
     def ipv4(self):
-        try:
-            self.cache['grains']['ipv4']
-        except KeyError:
-            return None
+        return self.lookup('grains', 'ipv4')
 
     @lazy_property
     def grains(self):
-        try:
-            self.cache['grains']
-        except KeyError:
-            return None
+        return self.lookup('grains')
 
     @lazy_property
     def pillar(self):
-        try:
-            self.cache['pillar']
-        except KeyError:
-            return None
+        return self.lookup('pillar')
 
     @lazy_property
     def cache(self):
         if self.opts.get('minion_data_cache', False):
             try:
-                serial = salt.payload.Serial(self.opts)
-                return serial.load(
-                    salt.utils.fopen(
-                        os.path.join(
-                            self.opts['cachedir'],
-                            'minions', self.id, 'data.p'
-                        )
-                    )
-                )
+                return load_minion_data(self.opts, self.id)
             except Exception as e:
                 log.exception(e)
         return None
 
 
+class CachedFunctions(Mapping):
+    """
+    Mapping of functions which results are kept for ttl seconds.
+    """
+
+    def __init__(self, funcs, ttl, maxsize=128):
+        self.funcs = funcs
+        self.results = TTLCache(maxsize, ttl)
+
+    def call(self, name):
+        result = self.results.get(name, MISSING)
+        if result is MISSING:
+            result = self.funcs[name]()
+            self.results.set(name, result)
+        return result
+
+    def __getitem__(self, name):
+        if name not in self.funcs:
+            raise KeyError(name)
+        return partial(self.call, name)
+
+    def __contains__(self, name):
+        return name in self.funcs
+
+    def __iter__(self):
+        return iter(self.funcs)
+
+    def __len__(self):
+        return len(self.funcs)
+
+
 class MatchableMinion(Subject):
-    def __init__(self, opts, funcs):
+    """
+    Minion matching itself, with its own opts and functions.
+
+    When exsel_ttl is set, results of functions are reused during
+    exsel_ttl seconds by the next matches.
+    """
+
+    def __init__(self, opts, funcs, exsel_ttl=None):
         self.opts = opts
+        self.funcs = funcs
         self.functions = funcs
+        if exsel_ttl:
+            self.functions = CachedFunctions(funcs, exsel_ttl)
 
     @property
     def id(self):
-        self.opts['grains']['id']
+        return self.opts['grains']['id']
 
     @property
     def fqdn(self):
-        self.opts['grains']['fqdn']
+        return self.opts['grains'].get('fqdn')
 
     @property
     def ipv4(self):
-        self.opts['grains']['ipv4']
+        return self.opts['grains'].get('ipv4')
 
     @property
     def grains(self):
-        self.opts['grains']
+        return self.opts['grains']
 
     @property
     def pillar(self):
-        self.opts['pillar']
+        return self.opts.get('pillar')
 
     @lazy_property
     def data(self):
-        self.funcs['data.load']()
+        return self.funcs['data.load']()
@@ -0,0 +1,92 @@
+'''
+
+salt.utils.bitmap
+~~~~~~~~~~~~~~~~~
+
+Bitmaps are plain integers, where bit n stands for position n. Boolean
+operators (``&``, ``|``, ``~``) then work on whole machine words.
+
+'''
+
+import binascii
+
+__all__ = [
+    'from_positions',
+    'to_positions',
+    'full',
+    'count',
+    'to_bytes',
+    'from_bytes',
+]
+
+
+def from_positions(positions):
+    """
+    Returns the bitmap with the bits of positions set.
+    """
+    positions = list(positions)
+    if not positions:
+        return 0
+    data = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    data.reverse()
+    return int(binascii.hexlify(bytes(data)), 16)
+
+
+def to_positions(bitmap):
+    """
+    Yields the positions of the bits set into bitmap, in ascending order.
+    """
+    if not bitmap:
+        return
+    hexa = '%x' % bitmap
+    if len(hexa) % 2:
+        hexa = '0' + hexa
+    data = bytearray(binascii.unhexlify(hexa))
+    data.reverse()
+    for index, byte in enumerate(data):
+        if byte:
+            base = index << 3
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield base + bit
+
+
+def full(size):
+    """
+    Returns the bitmap of positions 0 to size - 1.
+    """
+    return (1 << size) - 1
+
+
+def count(bitmap):
+    """
+    Returns the number of bits set into bitmap.
+    """
+    return bin(bitmap).count('1')
+
+
+def to_bytes(bitmap):
+    """
+    Returns bitmap as little endian bytes, where bit n is position n.
+    """
+    if not bitmap:
+        return b''
+    hexa = '%x' % bitmap
+    if len(hexa) % 2:
+        hexa = '0' + hexa
+    data = bytearray(binascii.unhexlify(hexa))
+    data.reverse()
+    return bytes(data)
+
+
+def from_bytes(data):
+    """
+    Reverse of to_bytes.
+    """
+    data = bytearray(data)
+    if not data:
+        return 0
+    data.reverse()
+    return int(binascii.hexlify(bytes(data)), 16)
@@ -0,0 +1,117 @@
+'''
+
+salt.utils.cache
+~~~~~~~~~~~~~~~~
+
+In-memory caches.
+
+'''
+
+from collections import OrderedDict
+import threading
+import time
+
+__all__ = [
+    'LRUCache',
+    'TTLCache',
+    'freeze',
+]
+
+#: sentinel for missing values
+MISSING = object()
+
+
+def freeze(obj):
+    """
+    Converts obj to a hashable value, usable as a cache key.
+
+    Raises TypeError if obj contains unhashable values.
+    """
+    if isinstance(obj, dict):
+        return frozenset((key, freeze(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(value) for value in obj)
+    if isinstance(obj, (set, frozenset)):
+        return frozenset(freeze(value) for value in obj)
+    hash(obj)
+    return obj
+
+
+class LRUCache(object):
+    """
+    Bounded mapping which evicts the least recently used entries.
+
+    It counts hits, misses and evictions.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.data.pop(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return '<{0} size={1}/{2} hits={3} misses={4} evictions={5}>'.format(
+            self.__class__.__name__, len(self.data), self.maxsize,
+            self.hits, self.misses, self.evictions)
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache which entries expire ttl seconds after they were set.
+    """
+
+    def __init__(self, maxsize=128, ttl=60, timer=time.time):
+        super(TTLCache, self).__init__(maxsize)
+        self.ttl = ttl
+        self.timer = timer
+
+    def get(self, key, default=None):
+        entry = super(TTLCache, self).get(key, MISSING)
+        if entry is MISSING:
+            return default
+        expires, value = entry
+        if expires <= self.timer():
+            with self.lock:
+                self.data.pop(key, None)
+                # expired entries were counted as hits
+                self.hits -= 1
+                self.misses += 1
+            return default
+        return value
+
+    def set(self, key, value):
+        super(TTLCache, self).set(key, (self.timer() + self.ttl, value))
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
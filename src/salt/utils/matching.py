@@ -7,12 +7,16 @@ Defines the most of matching.
 
 '''
 
-import collections
 import fnmatch
 import re
 import socket
 import struct
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 from salt._compat import string_types
 
 
@@ -34,7 +38,7 @@ def dig(data, expr, delim=':'):
             for element in data:
                 for k, v in explore(element, expr):
                     yield k, v
-        if isinstance(data, collections.Mapping):
+        if isinstance(data, Mapping):
             for key, value in decompose_expr(expr):
                 if key in data:
                     for k, v in explore(data[key], value):
@@ -82,10 +86,7 @@ def pcre_match(expr, value, delim=None):
 
 
 def ipcidr_match(expr, ipv4):
-    matcher = CIDRMatcher(expr)
-    if isinstance(ipv4, string_types):
-        return matcher.match(ipv4)
-    return any(matcher.match(ipaddr) for ipaddr in ipv4)
+    return CIDRMatcher(expr)(ipv4)
 
 
 def glob_filter(expr, values):
@@ -107,14 +108,217 @@ def pcre_compile(expr):
     """
     Forces exact matching.
     """
-    pattern = getattr(expr, 'patter', expr)
+    pattern = getattr(expr, 'pattern', expr)
     return re.compile('^({0})$'.format(pattern))
 
 
+def glob_compile(expr):
+    """
+    Compiles a glob into a case sensitive regex.
+    """
+    return re.compile(fnmatch.translate(expr))
+
+
+def glob_translate(expr):
+    """
+    Translates a glob to a regex which can be embedded into another one.
+    Its wildcards match newlines, whatever the flags of the other one.
+    """
+    pattern = fnmatch.translate(expr)
+    if pattern.endswith('(?ms)'):
+        # python 2 puts flags at the end, and cannot scope them
+        pattern = dotall(pattern[:-5])
+    return pattern
+
+
+def dotall(pattern):
+    """
+    Replaces the dots of pattern, outside of classes, by a class which
+    also matches newlines.
+    """
+    parts, i, n = [], 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        if char == '\\':
+            parts.append(pattern[i:i + 2])
+            i += 2
+        elif char == '[':
+            j = i + 1
+            if j < n and pattern[j] == '^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 2 if pattern[j] == '\\' else 1
+            parts.append(pattern[i:j + 1])
+            i = j + 1
+        elif char == '.':
+            parts.append('[\\s\\S]')
+            i += 1
+        else:
+            parts.append(char)
+            i += 1
+    return ''.join(parts)
+
+
+def is_literal(expr):
+    """
+    Tells if glob expr has no wildcards.
+    """
+    return not any(char in expr for char in '*?[')
+
+
+def literal_prefix(expr):
+    """
+    Returns the part of glob expr before its first wildcard.
+    """
+    for i, char in enumerate(expr):
+        if char in '*?[':
+            return expr[:i]
+    return expr
+
+
+def literal_suffix(expr):
+    """
+    Returns the part of glob expr after its last wildcard.
+    """
+    for i in range(len(expr) - 1, -1, -1):
+        if expr[i] in '*?[]':
+            return expr[i + 1:]
+    return expr
+
+
+#: pcre which cannot be embedded into an alternation (backrefs, flags...)
+UNMERGEABLE = re.compile(r'\\\d|\(\?[a-zA-Z]').search
+
+
+class AlternationMatcher(object):
+    """
+    Matches values against many globs and regexes at once.
+
+    Literal globs are looked up into a frozenset, the others are merged
+    into a single alternation regex.
+    """
+
+    def __init__(self, globs=(), pcres=()):
+        self.literals = frozenset(expr for expr in globs if is_literal(expr))
+        patterns = [glob_translate(expr) for expr in globs
+                    if not is_literal(expr)]
+        patterns.extend('(?:{0})$'.format(expr) for expr in pcres)
+        self.pattern = None
+        if patterns:
+            # only globs match newlines, like their own matchers do
+            self.pattern = re.compile('|'.join(
+                '(?:{0})'.format(pattern) for pattern in patterns
+            ))
+
+    @staticmethod
+    def mergeable(expr):
+        """
+        Tells if pcre expr can be merged with other regexes.
+        """
+        return not UNMERGEABLE(expr)
+
+    def __call__(self, value):
+        if value in self.literals:
+            return True
+        return self.pattern is not None and bool(self.pattern.match(value))
+
+
+def decompose(expr, delim):
+    """
+    Returns all (key, remaining) couples of expr, like dig does.
+    """
+    results = [(expr, None)]
+    key, value = expr, ''
+    while delim in key:
+        key, sep, tail = key.rpartition(delim)
+        value = tail + sep + value if value else tail
+        results.append((key, value))
+    return tuple(results)
+
+
+class PathMatcher(object):
+    """
+    Precompiled version of glob_match and pcre_match for digged values.
+
+    All the decompositions of expr and their patterns are computed once,
+    so that matching a subject only explores its data.
+    """
+
+    def __init__(self, expr, delim, compile=glob_compile):
+        if delim not in expr:
+            raise Exception('expr {0} expect to have delim {1}'.format(
+                repr(expr), repr(delim)
+            ))
+        self.expr = expr
+        self.splits = {}
+        self.patterns = {}
+        pending = [expr]
+        while pending:
+            current = pending.pop()
+            if current in self.splits:
+                continue
+            self.splits[current] = decompose(current, delim)
+            for key, value in self.splits[current]:
+                if value is not None:
+                    self.patterns[value] = compile(value)
+                    pending.append(value)
+
+    def explore(self, data, expr):
+        if isinstance(data, list):
+            for element in data:
+                for k, v in self.explore(element, expr):
+                    yield k, v
+        if isinstance(data, Mapping):
+            if expr is None:
+                return
+            for key, value in self.splits[expr]:
+                if key in data:
+                    for k, v in self.explore(data[key], value):
+                        yield k, v
+        else:
+            yield data, expr
+
+    def __call__(self, data):
+        for value, expr in self.explore(data, self.expr):
+            if expr is None:
+                return bool(value)
+            if self.patterns[expr].match(str(value)):
+                return True
+        return False
+
+
+def ip_to_int(ipaddr):
+    """
+    Converts a dotted IPv4 address to an integer, in network order.
+    """
+    return struct.unpack('!L', socket.inet_aton(ipaddr))[0]
+
+
+def cidr_range(expr):
+    """
+    Returns the lowest and highest IPv4 integers of expr, which is either
+    an address or a network. Raises ValueError if expr is invalid.
+    """
+    netaddr, sep, bits = expr.partition('/')
+    try:
+        network = ip_to_int(netaddr)
+        bits = int(bits) if sep else 32
+    except (socket.error, ValueError):
+        raise ValueError('{0} is not an IPv4 network'.format(repr(expr)))
+    if not 0 <= bits <= 32:
+        raise ValueError('{0} is not an IPv4 network'.format(repr(expr)))
+    hostmask = (1 << 32 - bits) - 1
+    low = network & ~hostmask & 0xffffffff
+    return low, low | hostmask
+
+
 class CIDRMatcher(object):
     def __init__(self, expr):
         self.expr = expr
         self.subnet = '/' in self.expr
+        self.network = self.netmask = None
         if self.subnet:
             netaddr, sep, bits = expr.partition('/')
             netmask = self.to_long(self.dotted_netmask(bits))
@@ -129,7 +333,15 @@ class CIDRMatcher(object):
         if not self.subnet:
             return False
 
-        return self.to_long(ipaddr) & self.netmask == self.network & self.netmask
+        try:
+            return self.to_long(ipaddr) & self.netmask == self.network & self.netmask
+        except socket.error:
+            return False
+
+    def __call__(self, ipv4):
+        if isinstance(ipv4, string_types):
+            return self.match(ipv4)
+        return any(self.match(ipaddr) for ipaddr in ipv4)
 
     @staticmethod
     def to_long(ipaddr):
@@ -0,0 +1,101 @@
+'''
+
+salt.utils.pool
+~~~~~~~~~~~~~~~
+
+Shared thread pools, for calls which must not block their caller longer
+than a deadline.
+
+'''
+
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+__all__ = [
+    'TIMEOUT',
+    'call_all',
+    'shared_pool',
+]
+
+#: returned instead of the result of a call which missed its deadline
+TIMEOUT = object()
+
+pools = {}
+lock = threading.Lock()
+
+
+def shared_pool(size, name=None):
+    """
+    Returns the thread pool of size workers, which is created once.
+    Pools with another name do not share their threads.
+    """
+    with lock:
+        pool = pools.get((name, size))
+        if pool is None:
+            pool = pools[name, size] = ThreadPool(size)
+        return pool
+
+
+class Call(object):
+    """
+    Call of func, which can be cancelled until it starts.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.started = None
+        self.cancelled = False
+        self.running = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            if self.cancelled:
+                return TIMEOUT
+            self.started = time.time()
+        self.running.set()
+        return self.func()
+
+    def cancel(self):
+        """
+        Cancels the call unless it started, and tells if it is cancelled.
+        """
+        with self.lock:
+            if self.started is None:
+                self.cancelled = True
+            return self.cancelled
+
+
+def call_all(funcs, size, timeout):
+    """
+    Calls funcs into a shared pool of size threads, and returns their
+    results in order.
+
+    Each call has timeout seconds from its start to complete, otherwise
+    TIMEOUT is returned in place of its result. Late calls are not
+    interrupted, they keep their thread until they return. Queued calls
+    which do not start within timeout, because every thread is held by
+    late calls, are cancelled along with the ones queued after them.
+    Exceptions of calls are raised again.
+    """
+    pool = shared_pool(size)
+    calls = [Call(func) for func in funcs]
+    pending = [pool.apply_async(call) for call in calls]
+    results, stalled = [], False
+    for call, async_result in zip(calls, pending):
+        if not stalled:
+            # previous calls returned or missed their deadline, a thread
+            # frees up within timeout unless they all hang
+            call.running.wait(timeout)
+        if call.cancel():
+            stalled = True
+            results.append(TIMEOUT)
+            continue
+        remaining = max(0, call.started + timeout - time.time())
+        try:
+            results.append(async_result.get(remaining))
+        except TimeoutError:
+            results.append(TIMEOUT)
+    return results
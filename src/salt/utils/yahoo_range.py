@@ -3,59 +3,361 @@
 salt.utils.yahoo_range
 ~~~~~~~~~~~~~~~~~~~~~~
 
-Defines the most of matching.
+Client of range servers, see https://github.com/ytoolshed/range
+
+Queries longer than batch_size are split on commas into chunks, which are
+fetched concurrently over a pool of keep-alive HTTP connections. Hosts are
+yielded chunk by chunk, as soon as they arrive.
+
+Wrap servers into a CachedProvider to reuse results between rules:
+
+.. code:: python
+
+    provider = CachedProvider(Server('range.example.com'), ttl=60)
+    query = Query(default_rule=GlobRule, provider=provider)
+
+Without a range server, a LocalProvider evaluates expressions over the
+YAML cluster files of range:
+
+.. code:: python
+
+    provider = LocalProvider(path='/etc/range')
 
 '''
 
-from salt._compat import PY3
-import contextlib
+from salt._compat import PY3, Queue, native_, string_types, url_quote
+import os
+import socket
+import threading
+import time
 
-if PY3:
-    from urllib import quote, Request, URLError, urlopen
+from salt.utils.cache import MISSING, LRUCache
+from salt.utils.pool import shared_pool
 
-    request_context = urlopen
+if PY3:
+    import http.client as httplib
 else:
-    from urllib2 import quote, Request, URLError, urlopen
-    import contextlib
+    import httplib
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
-    def request_context(request):
-        return contextlib.closing(urlopen(request))
+import logging
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'CachedProvider',
+    'ConnectionPool',
+    'LocalProvider',
+    'RangeException',
+    'Server',
+    'batch',
+]
 
 
 class RangeException(RuntimeError): pass
 
 
+class ConnectionPool(object):
+    """
+    Keeps up to size idle keep-alive connections to host.
+
+    The most recently used connections are reused first, so that the
+    others may be closed by the server.
+    """
+
+    def __init__(self, host, size=4, timeout=None):
+        self.host = host
+        self.size = size
+        self.timeout = timeout
+        self.idle = Queue.LifoQueue(size)
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            self.created += 1
+        if self.timeout is None:
+            return httplib.HTTPConnection(self.host)
+        return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+    def acquire(self):
+        """
+        Returns an idle connection, or a new one, and tells which.
+        """
+        try:
+            return self.idle.get_nowait(), True
+        except Queue.Empty:
+            return self.connect(), False
+
+    def release(self, conn):
+        try:
+            self.idle.put_nowait(conn)
+        except Queue.Full:
+            conn.close()
+
+    def request(self, path, headers=None):
+        """
+        Sends a GET request, and returns the status, the headers and the
+        body of the response.
+
+        Requests failing on a reused connection are sent again over a new
+        one, because servers may close idle connections at any time.
+        """
+        conn, reused = self.acquire()
+        while True:
+            try:
+                conn.request('GET', path, headers=headers or {})
+                response = conn.getresponse()
+                body = response.read()
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                if not reused:
+                    raise
+                conn, reused = self.connect(), False
+                continue
+            if response.will_close:
+                conn.close()
+            else:
+                self.release(conn)
+            return response.status, response, body
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                return
+
+
 class Server(object):
-    def __init__(self, host, batch_size=None):
+    def __init__(self, host, batch_size=None, workers=4, timeout=None):
         self.host = host
         self.batch_size = batch_size or 500
+        self.workers = workers
+        self.pool = ConnectionPool(host, workers, timeout)
 
-    def get(self, query):
+    def chunks(self, query):
+        """
+        Splits query on commas, into chunks of at most batch_size
+        characters, unless a single element is longer.
+        """
         while len(query) > self.batch_size:
-            for i in range(self.batch_size, 0, -1):
-                if expr[i] == ',':
-                    subquery, query = query[0:i], query[i+1:]
-                    for fqdn in batch(host, subquery):
-                        yield fqdn
+            i = query.rfind(',', 0, self.batch_size + 1)
+            if i <= 0:
+                i = query.find(',', self.batch_size)
+                if i == -1:
+                    break
+            yield query[:i]
+            query = query[i + 1:]
+        if query:
+            yield query
 
-        for fqdn in batch(host, query):
-            yield fqdn
+    def fetch(self, query):
+        """
+        Returns the hosts of a single chunk.
+        """
+        path = '/range/list?{0}'.format(url_quote(query))
+        try:
+            status, response, body = self.pool.request(
+                path, {'User-Agent': 'salt'})
+        except (socket.error, httplib.HTTPException) as exception:
+            raise RangeException(exception)
+        if status != 200:
+            raise RangeException('Got {0} response code from {1}{2}'.format(
+                status, self.host, path))
+        exception = response.getheader('RangeException')
+        if exception:
+            raise RangeException(exception)
+        return [native_(line, 'utf-8') for line in body.splitlines()
+                if line.strip()]
 
+    def get(self, query):
+        chunks = list(self.chunks(query))
+        if len(chunks) == 1:
+            results = [self.fetch(chunks[0])]
+        else:
+            pool = shared_pool(self.workers, 'yahoo_range')
+            results = pool.imap_unordered(self.fetch, chunks)
+        for hosts in results:
+            for fqdn in hosts:
+                yield fqdn
 
-def batch(host, query):
-    url = 'http://{0}/range/list?{1}'.format(host, quote(query))
-    request = Request(url, None, {'User-Agent': "salt" })
-    try:
-        with request_context(request) as response:
-            code = response.getcode()
-            if code != 200:
-                raise RangeException("Got {0} response code from {1}".format(code, url))
-            exception = response.info().getheader('RangeException')
-            if exception:
-                raise RangeException(exception)
-            for line in response.readlines():
-                yield line.rstrip()
-    except URLError as exception:
-        raise RangeException(exception)
+    def close(self):
+        self.pool.close()
+
+    def __repr__(self):
+        return 'Server({0})'.format(repr(self.host))
+
+
+class CachedProvider(object):
+    """
+    Caches the hosts of range expressions, as frozensets.
+
+    Results are fresh for ttl seconds. Then, for stale seconds more, they
+    are still served while a background thread refreshes them. Older
+    results are fetched again before being returned. At most maxsize
+    expressions are kept, the least recently used ones are evicted.
+    """
+
+    def __init__(self, provider, ttl=60, stale=300, maxsize=256,
+                 timer=time.time):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale = stale
+        self.timer = timer
+        self.cache = LRUCache(maxsize)
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def fetch(self, expr):
+        hosts = frozenset(self.provider.get(expr))
+        self.cache.set(expr, (self.timer(), hosts))
+        return hosts
+
+    def refresh(self, expr):
+        try:
+            self.fetch(expr)
+        except Exception as e:
+            log.warning('cannot refresh range {0}: {1}'.format(expr, e))
+        finally:
+            with self.lock:
+                self.refreshing.discard(expr)
+
+    def get(self, expr):
+        entry = self.cache.get(expr, MISSING)
+        if entry is MISSING:
+            return self.fetch(expr)
+        fetched, hosts = entry
+        age = self.timer() - fetched
+        if age < self.ttl:
+            return hosts
+        if age >= self.ttl + self.stale:
+            return self.fetch(expr)
+        with self.lock:
+            if expr in self.refreshing:
+                return hosts
+            self.refreshing.add(expr)
+        shared_pool(1, 'yahoo_range.refresh').apply_async(self.refresh,
+                                                          (expr,))
+        return hosts
+
+    def __repr__(self):
+        return 'CachedProvider({0})'.format(repr(self.provider))
+
+
+class LocalProvider(object):
+    """
+    Evaluates range expressions over cluster definitions, in memory.
+
+    Clusters are mappings of keys to lists of expressions. They are given
+    directly, or loaded from the <cluster>.yaml files of path. Supported
+    expressions are:
 
+    - ``host`` itself
+    - ``%cluster``, the CLUSTER key of cluster
+    - ``%cluster:KEY``, the KEY key of cluster
+    - ``a,b`` the union of a and b
+    - ``a,&b`` or ``a&b`` the intersection of a and b
+    - ``a,-b`` the difference of a and b
 
+    Terms are evaluated from left to right. Expanded clusters are
+    memoized until reload.
+    """
+
+    def __init__(self, clusters=None, path=None):
+        self.path = path
+        self.clusters = clusters or {}
+        self.memo = {}
+        self.lock = threading.Lock()
+        if path is not None:
+            self.reload()
+
+    def reload(self):
+        """
+        Loads the cluster files of path again.
+        """
+        if yaml is None:
+            raise RangeException('PyYAML is required to load {0}'.format(
+                self.path))
+        clusters = {}
+        for filename in os.listdir(self.path):
+            name, ext = os.path.splitext(filename)
+            if ext not in ('.yaml', '.yml'):
+                continue
+            with open(os.path.join(self.path, filename)) as fh:
+                clusters[name] = yaml.safe_load(fh) or {}
+        with self.lock:
+            self.clusters = clusters
+            self.memo = {}
+
+    def get(self, expr):
+        return self.evaluate(expr, ())
+
+    def evaluate(self, expr, parents):
+        hosts = set()
+        for term in expr.split(','):
+            term = term.strip()
+            if not term:
+                continue
+            if term.startswith('-'):
+                hosts.difference_update(self.term(term[1:], parents))
+            elif term.startswith('&'):
+                hosts.intersection_update(self.term(term[1:], parents))
+            else:
+                hosts.update(self.term(term, parents))
+        return frozenset(hosts)
+
+    def term(self, term, parents):
+        operands = [operand.strip() for operand in term.split('&')]
+        hosts = self.operand(operands[0], parents)
+        for operand in operands[1:]:
+            hosts = hosts & self.operand(operand, parents)
+        return hosts
+
+    def operand(self, operand, parents):
+        if not operand.startswith('%'):
+            return frozenset([operand]) if operand else frozenset()
+        name, sep, key = operand[1:].partition(':')
+        return self.cluster(name, key or 'CLUSTER', parents)
+
+    def cluster(self, name, key, parents):
+        with self.lock:
+            memo, clusters = self.memo, self.clusters
+        hosts = memo.get((name, key))
+        if hosts is not None:
+            return hosts
+        if (name, key) in parents:
+            raise RangeException('%{0}:{1} includes itself'.format(name, key))
+        try:
+            values = clusters[name][key]
+        except (KeyError, TypeError):
+            raise RangeException('NO_CLUSTER %{0}:{1}'.format(name, key))
+        if isinstance(values, string_types) or not isinstance(values, list):
+            values = [values]
+        hosts, parents = set(), parents + ((name, key),)
+        for value in values:
+            if value is None:
+                continue
+            if not isinstance(value, string_types):
+                value = str(value)
+            hosts.update(self.evaluate(value, parents))
+        hosts = memo[name, key] = frozenset(hosts)
+        return hosts
+
+    def __repr__(self):
+        return 'LocalProvider(path={0})'.format(repr(self.path))
+
+
+def batch(host, query):
+    """
+    Fetches hosts of query from the range server host.
+    """
+    server = Server(host)
+    try:
+        for fqdn in server.fetch(query):
+            yield fqdn
+    finally:
+        server.close()
@@ -0,0 +1,121 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import time
+
+from salt._compat import PY3
+from salt.targeting import *
+from salt.targeting.stats import tracing
+
+from mocks import MinionMock
+
+if PY3:
+    import asyncio
+
+
+class SlowProvider(object):
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    def get(self, expr):
+        self.calls += 1
+        time.sleep(self.delay)
+        return ['{0}.example.com'.format(expr.strip('%'))]
+
+
+def slow(value, delay=0.3):
+    def func():
+        time.sleep(delay)
+        return value
+    return func
+
+
+@unittest.skipIf(not PY3, 'asyncio requires python 3')
+class AsyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.provider = SlowProvider(0.3)
+        self.query = Query(default_rule=GlobRule, provider=self.provider)
+        self.query.register(GrainRule, 'G')
+        self.query.register(ExselRule, 'X')
+        self.query.register(YahooRangeRule, 'R')
+        self.minions = [
+            MinionMock(id='a', fqdn='web.example.com', grains={'os': 'Ubuntu'},
+                       functions={'foo.check': slow(True)}),
+            MinionMock(id='b', fqdn='db.example.com', grains={'os': 'Redhat'},
+                       functions={'foo.check': slow(False)}),
+            MinionMock(id='c', fqdn='db.example.com', grains=None,
+                       functions={'foo.check': slow(True)}),
+        ]
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_acheck(self):
+        rule = self.run_async(self.query.aparse(
+            'R@%web or (R@%db and X@foo.check) or G@os:Ubuntu'))
+        started = time.time()
+        found = self.run_async(rule.acheck(self.minions))
+        assert time.time() - started < 0.8
+        assert found == rule.check(self.minions)
+        assert found == set([self.minions[0], self.minions[2]])
+
+    def test_amatch(self):
+        rule = self.query.parse('R@%db and X@foo.check and not R@%web')
+        started = time.time()
+        assert not self.run_async(rule.amatch(self.minions[1]))
+        assert self.run_async(rule.amatch(self.minions[2]))
+        # exsel is called once the ranges it depends on are fetched
+        assert time.time() - started < 1.5
+        assert self.provider.calls == 4
+
+    def test_short_circuit(self):
+        calls = []
+
+        def check():
+            calls.append(1)
+            return True
+
+        rule = self.query.parse('web* and X@foo.check')
+        minions = [MinionMock(id='db{0}'.format(i), functions={
+            'foo.check': check}) for i in range(5)]
+        assert self.run_async(rule.acheck(minions)) == set()
+        assert not self.run_async(rule.amatch(minions[0]))
+        assert not calls
+
+        rule = self.query.parse('db1 or not X@foo.check')
+        assert self.run_async(rule.acheck(minions)) == set([minions[1]])
+        assert self.run_async(rule.amatch(minions[1]))
+        assert len(calls) == 4
+
+    def test_shared(self):
+        rule = self.query.parse('((X@foo.check or G@os:Ubuntu) and a) or '
+                                '((X@foo.check or G@os:Ubuntu) and *)',
+                                optimize=True)
+        with tracing() as traces:
+            found = self.run_async(rule.acheck(self.minions))
+        assert found == rule.check(self.minions)
+        # composite rules are measured, and the shared subtree evaluates
+        # every subject once
+        assert traces[id(rule)].calls == 1
+        shared, = set(child for branch in rule.rules
+                      for child in branch.rules if child.shared)
+        assert traces[id(shared)].calls == 2
+        for child in shared.rules:
+            assert traces[id(child)].objs_in <= len(self.minions)
+
+    def test_timeout(self):
+        rule = ExselRule('foo.check', exsel_timeout=0.1)
+        for minion in self.minions:
+            minion.doubt = False
+        found = self.run_async(rule.acheck(self.minions))
+        assert found == set(self.minions)
+        assert all(minion.doubt for minion in self.minions)
+        assert not self.run_async(rule.amatch(self.minions[0]))
+
+    def test_snapshot(self):
+        rule = self.query.parse('R@%db and not G@os:Redhat')
+        snapshot = FleetSnapshot(self.minions)
+        assert self.run_async(rule.acheck(snapshot)) == set(['c'])
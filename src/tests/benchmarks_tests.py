@@ -0,0 +1,47 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from benchmarks.corpus import QUERIES, prefixes
+from benchmarks.fleet import make_clusters, make_minions
+from benchmarks.runner import compare, run
+from salt.targeting import minion_targeting
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    def test_fleet(self):
+        first, second = make_minions(50, seed=1), make_minions(50, seed=1)
+        assert [m.grains for m in first] == [m.grains for m in second]
+        assert [m.pillar for m in first] != \
+            [m.pillar for m in make_minions(50, seed=2)]
+        assert len(set(m.id for m in first)) == 50
+        clusters = make_clusters(first)
+        assert first[0].id in clusters['web']['CLUSTER']
+
+    def test_corpus(self):
+        assert set(minion_targeting.registry) <= prefixes(minion_targeting)
+        assert None in prefixes(minion_targeting)
+        assert len(set(name for name, text in QUERIES)) == len(QUERIES)
+
+    def test_run(self):
+        results = run(size=60, repeat=1, sample=10,
+                      names=['grain', 'compound_redundant'])
+        assert results['meta']['size'] == 60
+        timings = results['timings']
+        for name in ['parse.cold.grain', 'parse.warm.grain',
+                     'check.cold.grain', 'check.warm.grain',
+                     'check.fleet.grain', 'check.snapshot.grain',
+                     'match.compound_redundant', 'fleet.index']:
+            assert timings[name]['runs'] >= 1, name
+        assert 'check.warm.pcre' not in timings
+
+    def test_compare(self):
+        baseline = {'timings': {'a': {'best': 1.0}, 'b': {'best': 1.0},
+                                'c': {'best': 1e-5}},
+                    'memory': {'fleet.index': 100}}
+        results = {'timings': {'a': {'best': 1.1}, 'b': {'best': 2.0},
+                               'c': {'best': 1e-4}, 'd': {'best': 5.0}},
+                   'memory': {'fleet.index': 200}}
+        assert compare(results, baseline, tolerance=0.25) == \
+            [('b', 1.0, 2.0), ('memory.fleet.index', 100, 200)]
@@ -0,0 +1,36 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.utils.cache import LRUCache, TTLCache
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class CacheTestCase(unittest.TestCase):
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert 'b' not in cache
+        assert (cache.hits, cache.misses, cache.evictions) == (1, 0, 1)
+
+    def test_ttl(self):
+        clock = Clock()
+        cache = TTLCache(2, ttl=10, timer=clock)
+        cache.set('a', 1)
+        clock.now = 9
+        assert cache.get('a') == 1
+        clock.now = 10
+        assert cache.get('a') is None
+        assert 'a' not in cache
+        assert (cache.hits, cache.misses) == (1, 2)
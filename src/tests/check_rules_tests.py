@@ -3,6 +3,10 @@ try:
 except ImportError:
     import unittest
 
+import threading
+import time
+
+from salt.targeting.fleet import Fleet
 from salt.targeting.rules import *
 
 
@@ -129,6 +133,119 @@ class CheckRulesTestCase(unittest.TestCase):
         assert minion_b in checked
         assert minion_c in checked
 
+    def test_exsel_timeout(self):
+        event = threading.Event()
+        matcher = ExselRule('foo.bar', exsel_workers=2, exsel_timeout=0.2)
+        minion_a = MinionMock(id="a", functions={'foo.bar': lambda: True})
+        minion_b = MinionMock(id="b", functions={'foo.bar': event.wait})
+        minion_c = MinionMock(id="c", functions={'foo.bar': lambda: False})
+        try:
+            started = time.time()
+            checked = matcher.check([minion_a, minion_b, minion_c])
+            assert time.time() - started < 2
+            assert checked == set([minion_a, minion_b])
+            assert matcher.match(minion_a)
+            assert not matcher.match(minion_c)
+            assert not matcher.match(minion_b)
+        finally:
+            event.set()
+
+    def test_exsel_deadline(self):
+        # every call has the timeout from its start, not from the batch
+        matcher = ExselRule('foo.bar', exsel_workers=2, exsel_timeout=0.5)
+        minions = [MinionMock(id=str(i),
+                              functions={'foo.bar': lambda: time.sleep(0.1)
+                                         or True})
+                   for i in range(20)]
+        assert matcher.select(minions) == (set(minions), set())
+
+    def test_exsel_stalled(self):
+        event = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(1)
+            return True
+
+        matcher = ExselRule('foo.bar', exsel_workers=3, exsel_timeout=0.2)
+        minions = [MinionMock(id=str(i), functions={'foo.bar': event.wait})
+                   for i in range(3)]
+        minions.extend(MinionMock(id=str(i), functions={'foo.bar': call})
+                       for i in range(3, 10))
+        try:
+            started = time.time()
+            matched, unknown = matcher.select(minions)
+            assert time.time() - started < 2
+            assert unknown == set(minions)
+        finally:
+            event.set()
+        time.sleep(0.1)
+        # queued calls which missed their deadline are not run later
+        assert not calls
+
+    def test_exsel_memo(self):
+        calls = []
+
+        def check():
+            calls.append(1)
+            return False
+
+        minion = MinionMock(id="a", grains={'a': 'b'},
+                            functions={'foo.check': check})
+        exsel = ExselRule('foo.check')
+        rule = exsel | (GrainRule('a:b', ':') & -exsel)
+        assert rule.check([minion]) == set([minion])
+        assert len(calls) == 1
+        assert rule.match(minion)
+        assert len(calls) == 2
+
+        # memo does not outlive the evaluation
+        with evaluation():
+            assert not exsel.match(minion)
+            assert not exsel.match(minion)
+        assert len(calls) == 3
+
+        # subjects die right away, their ids are reused by the next ones
+        with evaluation():
+            results = [exsel.match(MinionMock(id=str(i), functions={
+                'foo.check': lambda i=i: i % 2})) for i in range(4)]
+        assert results == [False, True, False, True]
+
+    def test_select(self):
+        grain = GrainRule('os:Ubuntu', ':')
+        glob = GlobRule('web*')
+        minion_a = MinionMock(id='web1', grains={'os': 'Ubuntu'})
+        minion_b = MinionMock(id='web2', grains=None)
+        minion_c = MinionMock(id='db1', grains=None)
+        minion_d = MinionMock(id='web3', grains={'os': 'Redhat'})
+        minions = [minion_a, minion_b, minion_c, minion_d]
+
+        assert grain.select(minions) == (set([minion_a]),
+                                         set([minion_b, minion_c]))
+        assert (-grain).select(minions) == (set([minion_d]),
+                                            set([minion_b, minion_c]))
+        # undecided and not matching is not matching
+        assert (grain & glob).select(minions) == (set([minion_a]),
+                                                  set([minion_b]))
+        # undecided or matching is matching
+        assert (grain | glob).select(minions) == (
+            set([minion_a, minion_b, minion_d]), set([minion_c]))
+        assert (-(grain & glob)).select(minions) == (
+            set([minion_c, minion_d]), set([minion_b]))
+
+    def test_doubt(self):
+        rule = GrainRule('os:Ubuntu', ':') & GlobRule('web*')
+        minions = [MinionMock(id='web1', grains={'os': 'Ubuntu'}, doubt=False),
+                   MinionMock(id='web2', grains=None, doubt=False),
+                   MinionMock(id='db1', grains=None, doubt=False)]
+        assert rule.check(minions) == set(minions[:2])
+        assert [minion.doubt for minion in minions] == [False, True, False]
+
+        for minion in minions:
+            minion.doubt = False
+        assert rule.check_fleet(Fleet(minions)) == set(minions[:2])
+        assert [minion.doubt for minion in minions] == [False, True, False]
+
     def test_local_store(self):
         matcher = LocalStoreRule('foo:bar', ':')
         assert "LocalStoreRule('foo:bar', ':')" == str(matcher)
@@ -169,3 +286,23 @@ class CheckRulesTestCase(unittest.TestCase):
         assert minion_a not in checked
         assert minion_b in checked
         assert minion_c in checked
+
+    def test_merged_any(self):
+        matcher = AnyRule(GlobRule('web1'), GlobRule('web2'), GlobRule('db*'),
+                          PCRERule('cache\\d+'), GrainRule('os:Ubuntu', ':'))
+        merged, others = matcher.merged
+        assert merged.literals == frozenset(['web1', 'web2'])
+        assert others == [GrainRule('os:Ubuntu', ':')]
+
+        minion_a = MinionMock(id='web1', grains={})
+        minion_b = MinionMock(id='db42', grains={})
+        minion_c = MinionMock(id='cache1', grains={})
+        minion_d = MinionMock(id='web3', grains={'os': 'Ubuntu'})
+        minion_e = MinionMock(id='web3', grains={'os': 'Redhat'})
+        minion_f = MinionMock(id='cache', grains=None)
+        minions = [minion_a, minion_b, minion_c, minion_d, minion_e, minion_f]
+
+        checked = matcher.check(minions)
+        assert checked == set([minion_a, minion_b, minion_c, minion_d, minion_f])
+        assert [matcher.match(m) for m in minions[:-1]] == \
+            [True, True, True, True, False]
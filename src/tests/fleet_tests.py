@@ -0,0 +1,163 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.targeting import *
+from salt.utils.bitmap import from_positions, to_positions, count
+
+from mocks import MinionMock, make_minions
+
+
+class FleetIndexTestCase(unittest.TestCase):
+    def test_lookup(self):
+        index = FleetIndex(make_minions())
+        assert index.lookup('grains', 'os:Ubuntu', ':') == \
+            (set(['web1']), set(['misc']))
+        assert index.lookup('grains', 'os:Ubu*', ':') == \
+            (set(['web1', 'web2']), set())
+        assert index.lookup('grains', 'roles:db', ':') == \
+            (set(['web1', 'db1']), set())
+        assert index.lookup('grains', 'cpus:4', ':') == (set(['web2']), set())
+        assert index.lookup('grains', 'os:*tu', ':') == (set(['web1']), set())
+        assert index.lookup('grains', 'a:b:c:d:e:f:g:h:i', ':') is None
+        assert index.lookup('pillar', 'user:name:admin', ':') == \
+            (set(['web1', 'misc']), set())
+        assert index.missing == {'grains': set(['db2']),
+                                 'pillar': set(['db1'])}
+
+    def test_check(self):
+        minions = make_minions()
+        fleet = Fleet(minions)
+        for query in ['G@os:Ubuntu',
+                      'G@os:Ubu*',
+                      'G@os:*tu',
+                      'G@roles:db and not G@os:Redhat',
+                      'I@user:name:admin or G@cpus:8',
+                      'not (G@os:Ubuntu* and I@user:name:root)',
+                      'web* and not G@roles:web']:
+            rule = minion_targeting.parse(query)
+            assert rule.check(fleet) == rule.check(minions), query
+
+
+class IPv4IndexTestCase(unittest.TestCase):
+    def test_lookup(self):
+        minions = [
+            MinionMock(id='a', ipv4=['127.0.0.1', '10.2.0.1']),
+            MinionMock(id='b', ipv4='10.2.255.255'),
+            MinionMock(id='c', ipv4=['10.3.0.1', 'garbage']),
+            MinionMock(id='d', ipv4=None),
+        ]
+        index = IPv4Index(minions)
+        assert index.lookup('10.2.0.0/16') == set(['a', 'b'])
+        assert index.lookup('10.0.0.0/8') == set(['a', 'b', 'c'])
+        assert index.lookup('10.3.0.1') == set(['c'])
+        assert index.lookup('0.0.0.0/0') == set(['a', 'b', 'c'])
+        assert index.lookup('garbage') is None
+        assert index.missing == set(['d'])
+
+        fleet = Fleet(minions)
+        for query in ['S@10.2.0.0/16', 'S@garbage', 'not S@10.3.0.0/24']:
+            rule = minion_targeting.parse(query)
+            assert rule.check(fleet) == rule.check(minions), query
+
+
+class IdIndexTestCase(unittest.TestCase):
+    ids = ['web-1.dc1.example.com', 'web-2.dc1.example.com',
+           'web-1.dc2.example.com', 'db-1.dc1.example.com', 'web', 'we']
+
+    def test_trie(self):
+        trie = RadixTrie()
+        for id in self.ids:
+            trie.add(id, id)
+        assert trie.prefixed('web-') == set(self.ids[:3])
+        assert trie.prefixed('we') == set(self.ids[:3] + ['web', 'we'])
+        assert trie.prefixed('x') == set()
+        assert trie.get('web') == set(['web'])
+        trie.discard('web', 'web')
+        assert trie.get('web') == set()
+        assert trie.prefixed('') == set(self.ids) - set(['web'])
+
+    def test_lookup(self):
+        minions = [MinionMock(id=id) for id in self.ids]
+        index = IdIndex(minions)
+        assert index.lookup('*.dc1.example.com') == \
+            set(['web-1.dc1.example.com', 'web-2.dc1.example.com',
+                 'db-1.dc1.example.com'])
+        assert index.lookup('web-*.dc2.example.com') == \
+            set(['web-1.dc2.example.com'])
+        assert index.lookup('web') == set(['web'])
+        assert index.lookup('*-1*') is None
+
+        fleet = Fleet(minions)
+        for query in ['*.dc1.example.com', 'web-?.dc1.*', 'w[a-e]*',
+                      '*-1*', 'we', 'not web-* and *.com']:
+            rule = minion_targeting.parse(query)
+            assert rule.check(fleet) == rule.check(minions), query
+
+
+class BitmapTestCase(unittest.TestCase):
+    def test_positions(self):
+        positions = [0, 3, 8, 63, 64, 1000]
+        bitmap = from_positions(positions)
+        assert bitmap == sum(1 << p for p in positions)
+        assert list(to_positions(bitmap)) == positions
+        assert count(bitmap) == 6
+        assert from_positions([]) == 0
+        assert list(to_positions(0)) == []
+
+    def test_bitmap(self):
+        minions = make_minions()
+        for minion in minions:
+            minion.ipv4 = ['10.0.0.%d' % minions.index(minion)]
+        fleet = Fleet(minions)
+        for query in ['G@os:Ubuntu',
+                      'G@os:*tu',
+                      'L@web1,db*,E@mi.c',
+                      'G@roles:db and not G@os:Redhat',
+                      'I@user:name:admin or G@cpus:8',
+                      'not (G@os:Ubuntu* and I@user:name:root)',
+                      'S@10.0.0.0/30 and not web*']:
+            rule = minion_targeting.parse(query)
+            assert rule.check_fleet(fleet) == rule.check(minions), query
+
+    def test_doubt(self):
+        minions = make_minions()
+        fleet = Fleet(minions)
+        db2 = fleet.get('db2')
+
+        rule = minion_targeting.parse('G@os:Ubuntu')
+        matched, doubtful = rule.bitmap(fleet)
+        assert fleet.subjects(doubtful) == set([db2])
+
+        # an unknown value is not discarded by a negation
+        rule = minion_targeting.parse('not (G@cpus:4 and not G@os:Redhat)')
+        assert db2 in rule.check_fleet(fleet)
+
+
+class FleetUpdateTestCase(unittest.TestCase):
+    def test_add_discard(self):
+        minions = make_minions()
+        for i, minion in enumerate(minions):
+            minion.ipv4 = ['10.0.0.%d' % i, '10.0.1.%d' % i]
+        fleet = Fleet(minions[:3])
+        fleet.discard('web2')
+        fleet.discard('unknown')
+        for minion in minions[1:]:
+            fleet.add(minion)
+        fleet.add(minions[0])
+        expected = Fleet(minions)
+        assert fleet.index.values == expected.index.values
+        assert fleet.index.missing == expected.index.missing
+        assert fleet.ips.addrs == expected.ips.addrs
+        assert sorted(fleet.ips.owners) == sorted(expected.ips.owners)
+        assert fleet.names.lookup('web*') == set(['web1', 'web2'])
+        assert len(fleet.order) == 5
+
+        fleet.discard('db1')
+        assert 'db1' not in fleet.index.missing['pillar']
+        assert fleet.names.lookup('db*') == set(['db2'])
+        for query in ['G@roles:db', 'S@10.0.0.0/24', 'not G@os:Ubuntu']:
+            rule = minion_targeting.parse(query)
+            assert rule.check(fleet) == rule.check(minions[:2] + minions[3:])
+            assert rule.check_fleet(fleet) == rule.check(fleet), query
@@ -0,0 +1,109 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import json
+import os
+import shutil
+import tempfile
+
+from salt.targeting import *
+
+
+def json_load(fh):
+    return json.loads(fh.read().decode('utf-8'))
+
+
+class MinionDataLoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.cachedir, 'minion_data_cache': True}
+        for i in range(20):
+            self.write('web{0}'.format(i), json.dumps({
+                'grains': {'id': 'web{0}'.format(i),
+                           'fqdn': 'web{0}.example.com'.format(i),
+                           'ipv4': ['10.0.0.{0}'.format(i)],
+                           'os': 'Ubuntu' if i % 2 else 'Redhat'},
+                'pillar': {'role': 'web'},
+            }))
+        self.write('broken', '{not json')
+        os.makedirs(os.path.join(self.cachedir, 'minions', 'empty'))
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def write(self, id, content):
+        path = os.path.join(self.cachedir, 'minions', id)
+        os.makedirs(path)
+        with open(os.path.join(path, 'data.p'), 'w') as fh:
+            fh.write(content)
+
+    def test_load(self):
+        loader = MinionDataLoader(self.opts, workers=4,
+                                  deserializer=json_load)
+        assert len(loader.minion_ids()) == 21
+        report = loader.load()
+        assert len(report.data) == 20
+        assert list(report.errors) == ['broken']
+
+        minion = report.subjects[0]
+        assert minion.fqdn == '{0}.example.com'.format(minion.id)
+        assert minion.pillar == {'role': 'web'}
+
+        rule = minion_targeting.parse('G@os:Ubuntu and S@10.0.0.0/29')
+        expected = set(['web1', 'web3', 'web5', 'web7'])
+        assert set(obj.id for obj in rule.check(report.subjects)) == expected
+        assert rule.check_fleet(report.snapshot()) == expected
+
+    def test_lazy(self):
+        minion = CheckableMinion('web3', {'cachedir': self.cachedir})
+        assert minion.grains is None
+        minion = CheckableMinion('web3', {}, cache={'grains': {}})
+        assert minion.grains == {}
+        assert minion.fqdn is None
+        assert minion.pillar is None
+
+    def test_refresh(self):
+        loader = MinionDataLoader(self.opts, deserializer=json_load)
+        cache = MinionCache(self.opts, loader)
+        report = cache.refresh()
+        assert len(report.data) == 20
+        assert list(report.errors) == ['broken']
+        assert len(cache.fleet) == 20
+
+        report = cache.refresh()
+        assert not report.data
+        # failed files are retried until they load
+        assert list(report.errors) == ['broken']
+
+        shutil.rmtree(os.path.join(self.cachedir, 'minions', 'web0'))
+        path = os.path.join(self.cachedir, 'minions', 'web1', 'data.p')
+        with open(path, 'w') as fh:
+            fh.write(json.dumps({'grains': {'os': 'Debian',
+                                            'ipv4': ['10.1.0.1']},
+                                 'pillar': {'role': 'db'}}))
+        self.write('db1', json.dumps({'grains': {'os': 'Ubuntu'}}))
+        report = cache.refresh()
+        assert sorted(report.data) == ['db1', 'web1']
+        assert report.removed == ['web0']
+        assert list(report.errors) == ['broken']
+        assert len(cache.fleet) == 20
+
+        rule = minion_targeting.parse('G@os:Ubuntu or I@role:db')
+        expected = set(['web3', 'web5', 'web7', 'web9', 'web11', 'web13',
+                        'web15', 'web17', 'web19', 'db1', 'web1'])
+        found = set(obj.id for obj in rule.check(cache.fleet))
+        assert found == expected
+        assert set(obj.id for obj in rule.check_fleet(cache.fleet)) == \
+            expected
+        assert cache.fleet.ips.lookup('10.0.0.0/8') == \
+            set('web{0}'.format(i) for i in range(1, 20))
+
+        path = os.path.join(self.cachedir, 'minions', 'broken', 'data.p')
+        with open(path, 'w') as fh:
+            fh.write(json.dumps({'grains': {'os': 'Ubuntu'}}))
+        report = cache.refresh()
+        assert list(report.data) == ['broken'] and not report.errors
+        assert len(cache.fleet) == 21
+        assert not cache.refresh().data
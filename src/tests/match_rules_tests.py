@@ -4,6 +4,7 @@ except ImportError:
     import unittest
 
 from salt.targeting.rules import *
+from salt.targeting.subjects import MatchableMinion
 
 
 class MinionMock(object):
@@ -71,6 +72,15 @@ class MatchRulesTestCase(unittest.TestCase):
         evaluated = eval(str(k))
         assert isinstance(evaluated, AnyRule)
 
+    def test_merged_newlines(self):
+        minion = MinionMock(id='a\nb')
+        pcre = PCRERule('a.b')
+        assert not pcre.match(minion)
+        for rule in [pcre | GlobRule('db1'), pcre | GlobRule('db*')]:
+            assert not rule.match(minion)
+            assert not rule.check([minion])
+        assert (pcre | GlobRule('a*')).check([minion]) == set([minion])
+
     def test_exsel(self):
         matcher = ExselRule('foo.bar')
         assert "ExselRule('foo.bar')" == str(matcher)
@@ -80,6 +90,26 @@ class MatchRulesTestCase(unittest.TestCase):
         assert matcher.match(minion)
         assert not (- matcher).match(minion)
 
+    def test_exsel_ttl(self):
+        calls = []
+
+        def ping():
+            calls.append(1)
+            return True
+
+        opts = {'grains': {'id': 'foo'}}
+        matcher = ExselRule('test.ping')
+        minion = MatchableMinion(opts, {'test.ping': ping})
+        assert matcher.match(minion) and matcher.match(minion)
+        assert len(calls) == 2
+
+        minion = MatchableMinion(opts, {'test.ping': ping}, exsel_ttl=60)
+        assert matcher.match(minion) and matcher.match(minion)
+        assert len(calls) == 3
+        assert minion.id == 'foo'
+        assert 'test.ping' in minion.functions
+        assert 'test.echo' not in minion.functions
+
     def test_local_store(self):
         matcher = LocalStoreRule('foo:bar', ':')
         assert "LocalStoreRule('foo:bar', ':')" == str(matcher)
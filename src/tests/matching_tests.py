@@ -0,0 +1,58 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.utils.matching import *
+
+
+class MatchingTestCase(unittest.TestCase):
+    samples = [
+        {'os': 'Ubuntu'},
+        {'os': ['Ubuntu', 'Debian']},
+        {'os:Ubuntu': 'yes'},
+        {'os': {'Ubuntu': 0}},
+        {'os': [{'Ubuntu': 'lts'}]},
+        {'foo': {'bar': 'baz'}},
+        {'foo:bar': 'baz', 'foo': 'bar:baz'},
+        {'cpus': 4},
+        {},
+    ]
+
+    def test_decompose(self):
+        assert decompose('a:b:c', ':') == (
+            ('a:b:c', None),
+            ('a:b', 'c'),
+            ('a', 'b:c'),
+        )
+
+    def test_glob_path_matcher(self):
+        for expr in ['os:Ubuntu', 'os:Ubu*', 'foo:bar:baz', 'foo:bar*',
+                     'cpus:4', 'os:?ebian']:
+            matcher = PathMatcher(expr, ':')
+            for data in self.samples:
+                assert matcher(data) == glob_match(expr, data, ':'), \
+                    (expr, data)
+
+    def test_pcre_path_matcher(self):
+        for expr in ['os:Ub.*', 'foo:bar:b.z', 'cpus:\\d+']:
+            matcher = PathMatcher(expr, ':', pcre_compile)
+            for data in self.samples:
+                assert matcher(data) == pcre_match(expr, data, ':'), \
+                    (expr, data)
+
+    def test_alternation(self):
+        matcher = AlternationMatcher(['web1', 'db*', 'ca[!x]he?'],
+                                     ['a.b', 'c[.]d'])
+        for value in ['web1', 'db\n1', 'cache\n', 'ca\nhe1', 'a-b', 'c.d']:
+            assert matcher(value), value
+        # merged regexes match newlines like pcre_compile does
+        for value in ['a\nb', 'c\nd', 'cxhe1', 'web12']:
+            assert not matcher(value), value
+        assert dotall(r'a.*\.[.]b') == r'a[\s\S]*\.[.]b'
+
+    def test_cidr(self):
+        matcher = CIDRMatcher('10.2.0.0/16')
+        assert matcher('10.2.3.4')
+        assert matcher(['127.0.0.1', '10.2.255.1'])
+        assert not matcher(['10.3.0.1'])
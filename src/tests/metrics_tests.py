@@ -0,0 +1,70 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.targeting import *
+from salt.targeting import metrics
+
+from mocks import MinionMock
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+
+    def test_histogram(self):
+        histogram = Histogram(bounds=(1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.add(value)
+        snapshot = histogram.snapshot()
+        assert snapshot['count'] == 4
+        assert snapshot['sum'] == 56.5
+        assert (snapshot['min'], snapshot['max']) == (0.5, 50)
+        assert snapshot['buckets'] == [(1, 2), (10, 1), (None, 1)]
+
+    def test_disabled(self):
+        metrics.disable()
+        metrics.incr('foo')
+        metrics.observe('bar', 1.0)
+        GrainRule('os:Ubuntu', ':').check([MinionMock(grains=None)])
+        assert self.registry.snapshot() == {'counters': {}, 'histograms': {}}
+
+    def test_hooks(self):
+        recorded = []
+        self.registry.hook(lambda name, value: recorded.append((name, value)))
+        metrics.incr('foo', 2)
+        metrics.observe('bar', 0.5)
+        assert recorded == [('foo', 2), ('bar', 0.5)]
+
+    def test_check(self):
+        query = Query(default_rule=GlobRule)
+        query.register(GrainRule, 'G')
+        minions = [MinionMock(id='web1', grains={'os': 'Ubuntu'}),
+                   MinionMock(id='web2', grains=None),
+                   MinionMock(id='web3', grains={'os': 'Redhat'})]
+        rule = query.parse('web* and G@os:Ubuntu')
+        assert query.parse('web* and G@os:Ubuntu') is rule
+        assert rule.check(minions) == set(minions[:2])
+        assert rule.check_fleet(Fleet(minions)) == set(minions[:2])
+
+        snapshot = self.registry.snapshot()
+        counters = snapshot['counters']
+        assert counters['parse.cache.misses'] == 1
+        assert counters['parse.cache.hits'] == 1
+        assert snapshot['histograms']['parse.seconds']['count'] == 1
+        assert snapshot['histograms']['check.seconds']['count'] == 2
+        assert counters['check.targeted'] == 4
+        assert counters['check.doubtful'] == 2
+        assert counters['rules.AllRule.evaluations'] == 2
+        assert counters['rules.GrainRule.evaluations'] == 2
+        assert counters['rules.GrainRule.doubtful'] == 2
+
+    def test_missing(self):
+        rule = GrainRule('os:Ubuntu', ':')
+        for i in range(3):
+            assert not rule.match(MinionMock(id=str(i), grains=None))
+        assert self.registry.snapshot()['counters'] == {'missing.grains': 3}
@@ -0,0 +1,38 @@
+class MinionMock(object):
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return 'MinionMock({0})'.format(getattr(self, 'id', None))
+
+
+def make_minions():
+    return [
+        MinionMock(id='web1', fqdn='web1.example.com',
+                   ipv4=['127.0.0.1', '10.0.0.1'],
+                   grains={'os': 'Ubuntu', 'roles': ['web', 'db']},
+                   pillar={'user': {'name': 'admin'}}),
+        MinionMock(id='web2', fqdn='web2.example.com', ipv4='10.0.1.1',
+                   grains={'os': 'Ubuntu14', 'cpus': 4},
+                   pillar={'user': {'name': 'root'}}),
+        MinionMock(id='db1', fqdn='db1.example.com', ipv4=['10.1.0.1'],
+                   grains={'os': 'Redhat', 'roles': ['db']},
+                   pillar=None),
+        MinionMock(id='db2', fqdn=None, ipv4=None, grains=None, pillar={}),
+        MinionMock(id='misc', fqdn='misc.example.com', ipv4=['garbage'],
+                   grains={'os:Ubuntu': 'yes', 'cpus': 8},
+                   pillar={'user:name': 'admin'}),
+    ]
+
+
+def make_fleet(count):
+    minions = []
+    for i in range(count):
+        grains = {'os': ['Ubuntu', 'Redhat', 'Debian'][i % 3], 'num': i}
+        minions.append(MinionMock(
+            id='{0}{1}'.format(['web', 'db', 'cache'][i % 3], i),
+            grains=grains if i % 7 else None,
+            pillar={'role': ['web', 'db'][i % 2]},
+            ipv4=['10.0.{0}.{1}'.format(i // 256, i % 256)]))
+    return minions
@@ -0,0 +1,118 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.targeting import *
+from salt.targeting.rules import evaluation
+from salt.targeting.stats import tracing
+from salt.utils.yahoo_range import LocalProvider
+
+from mocks import MinionMock, make_fleet
+
+
+class OptimizerTestCase(unittest.TestCase):
+    def test_de_morgan(self):
+        a, b = GlobRule('a'), GrainRule('os:Ubuntu', ':')
+        assert optimize(-(a | b)) == -(a | b)
+        assert optimize(-(-a & -b)) == a | b
+        assert optimize(-(a & -b)) == -a | b
+        assert optimize(-(-a)) == a
+
+    def test_absorption(self):
+        a, b, c = GlobRule('a'), GlobRule('b'), GrainRule('os:Ubuntu', ':')
+        assert optimize(a | (a & c)) == a
+        assert optimize(a & (a | c)) == a
+        assert optimize((a & b) | (a & b & c)) == a & b
+        assert optimize(a & (b | -(-a & c))) == a
+        assert optimize(a & a & b) == a & b
+
+    def test_contradiction(self):
+        a, b = GlobRule('a'), GrainRule('os:Ubuntu', ':')
+        assert optimize(a & -a) == FalseRule()
+        assert optimize(a | -a) == TrueRule()
+        assert optimize(b | (a & -a)) == b
+        assert optimize(b & (a | -a)) == b
+        assert optimize(-(b & (a & -a))) == TrueRule()
+
+    def test_factor(self):
+        a, b, c = GlobRule('a'), GlobRule('b'), GrainRule('os:Ubuntu', ':')
+        rule = optimize(-a & -b & c)
+        assert rule == AllRule(NotRule(AnyRule(a, b)), c)
+        # globs are still merged into a single matcher
+        negated, = [child for child in rule.rules if isinstance(child, NotRule)]
+        matcher, others = negated.rule.merged
+        assert matcher is not None and others == []
+
+    def test_interned(self):
+        optimizer = Optimizer()
+        a = GrainRule('os:Ubuntu', ':')
+        first = optimizer((a | GlobRule('web*')) & GlobRule('db*'))
+        second = optimizer(GlobRule('x') & (GlobRule('web*') | a))
+        shared = [rule for rule in first.rules if isinstance(rule, AnyRule)]
+        assert shared[0] in second.rules
+        assert [rule for rule in second.rules if rule == shared[0]][0] \
+            is shared[0]
+
+    def test_interned_opts(self):
+        query = minion_targeting
+        first, second = LocalProvider({}), LocalProvider({})
+        query.parse('R@%web and web*', optimize=True, provider=first)
+        rule = query.parse('R@%web and web*', optimize=True, provider=second)
+        leaf, = [child for child in rule if isinstance(child, YahooRangeRule)]
+        assert leaf.provider is second
+
+        query.parse('X@foo and web*', optimize=True, exsel_timeout=1)
+        rule = query.parse('X@foo and web*', optimize=True)
+        leaf, = [child for child in rule if isinstance(child, ExselRule)]
+        assert leaf.timeout is None
+
+    def test_shared_select(self):
+        rule = minion_targeting.parse(
+            '((G@os:Ubuntu or G@os:Debian) and web*) or '
+            '((G@os:Ubuntu or G@os:Debian) and I@role:web)', optimize=True)
+        shared = set(child for branch in rule.rules for child in branch.rules
+                     if child.shared)
+        assert len(shared) == 1
+        shared = shared.pop()
+        assert isinstance(shared, AnyRule)
+        minions = make_fleet(40)
+        with tracing() as traces:
+            found = rule.check(minions)
+        # both branches reach the shared subtree, which evaluates every
+        # subject once
+        assert traces[id(shared)].calls == 2
+        for child in shared.rules:
+            assert traces[id(child)].objs_in <= len(minions)
+        assert rule.check(Fleet(minions)) == found
+        assert found == minion_targeting.parse(
+            '(G@os:Ubuntu or G@os:Debian) and (web* or I@role:web)'
+        ).check(minions)
+
+    def test_transient_subjects(self):
+        rule = GlobRule('a*') & GlobRule('*1')
+        with evaluation():
+            # subjects die right away, their ids are reused by the next ones
+            results = [rule.match(MinionMock(id=id))
+                       for id in ['a1', 'b2', 'a1', 'b2']]
+        assert results == [True, False, True, False]
+
+    def test_query(self):
+        query = 'web* or (web* and G@os:Ubuntu)'
+        assert minion_targeting.parse(query, optimize=True) == GlobRule('web*')
+        assert isinstance(minion_targeting.parse(query), AnyRule)
+
+    def test_equivalence(self):
+        minions = make_fleet(40)
+        fleet = Fleet(minions)
+        for query in ['not (G@os:Ubuntu or web*) and I@role:web',
+                      'db* or (db* and G@os:Redhat) or not not I@role:db',
+                      'not (web* and not G@os:Ubuntu) and (cache* or web*)',
+                      '(G@os:Ubuntu and I@role:web) or '
+                      '(I@role:web and G@os:Ubuntu and db*)']:
+            rule = minion_targeting.parse(query)
+            optimized = minion_targeting.parse(query, optimize=True)
+            assert optimized.check(minions) == rule.check(minions), query
+            assert optimized.check_fleet(fleet) == rule.check(minions), query
+            for minion in minions:
+                assert optimized.match(minion) == rule.match(minion), query
@@ -0,0 +1,45 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.targeting import *
+
+from mocks import make_fleet
+
+
+class CheckParallelTestCase(unittest.TestCase):
+    queries = ['G@os:Ubuntu',
+               'E@(web|db)1[0-9]+ and not G@os:Debian',
+               'P@os:(Red|Deb).* or I@role:db',
+               'not (G@os:Ubuntu and S@10.0.1.0/24)']
+
+    def expected(self, rule, minions):
+        return rule.check(minions)
+
+    def test_parallel(self):
+        minions = make_fleet(300)
+        for query in self.queries:
+            rule = minion_targeting.parse(query)
+            with ParallelChecker(rule, workers=2) as checker:
+                assert checker.check(minions, chunksize=50) == \
+                    self.expected(rule, minions), query
+
+    def test_serial(self):
+        minions = make_fleet(100)
+        for query in self.queries:
+            rule = minion_targeting.parse(query)
+            assert rule.check_parallel(minions) == \
+                self.expected(rule, minions), query
+
+    def test_doubt(self):
+        minions = make_fleet(30)
+        for minion in minions:
+            minion.doubt = False
+        rule = minion_targeting.parse('G@os:Ubuntu')
+        with ParallelChecker(rule, workers=2) as checker:
+            results = checker.check(minions)
+        assert minions[0] in results
+        assert minions[0].doubt
+        assert not minions[3].doubt
+        assert minions[1] not in results
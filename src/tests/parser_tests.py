@@ -0,0 +1,65 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.targeting.parser import parse, tokenize
+from salt.targeting.rules import *
+
+
+class ParserTestCase(unittest.TestCase):
+    def test_tokenize(self):
+        tokens = [(t.kind, t.value, t.pos) for t in tokenize('not (a b) or c')]
+        assert tokens == [
+            ('not', 'not', 0),
+            ('open', '(', 4),
+            ('expr', 'a', 5),
+            ('expr', 'b', 7),
+            ('close', ')', 8),
+            ('or', 'or', 10),
+            ('expr', 'c', 13),
+            ('end', '', 14),
+        ]
+
+    def test_parenthesis_in_expr(self):
+        assert parse('(web|back)\\w+', GlobRule) == GlobRule('(web|back)\\w+')
+        assert parse('foo)', GlobRule) == GlobRule('foo)')
+        assert parse('(foo)', GlobRule) == GlobRule('foo')
+
+    def test_groups(self):
+        rule = parse('(a or b) and (c or d)', GlobRule)
+        assert rule == AllRule(
+            AnyRule(GlobRule('a'), GlobRule('b')),
+            AnyRule(GlobRule('c'), GlobRule('d')),
+        )
+
+    def test_precedence(self):
+        assert parse('a or b and c', GlobRule) == \
+            AnyRule(GlobRule('a'), AllRule(GlobRule('b'), GlobRule('c')))
+        assert parse('not a and b', GlobRule) == \
+            AllRule(NotRule(GlobRule('a')), GlobRule('b'))
+        assert parse('not not a', GlobRule) == GlobRule('a')
+
+    def test_merge_exprs(self):
+        assert parse('a   b and c', GlobRule) == \
+            AllRule(GlobRule('a b'), GlobRule('c'))
+
+    def test_error_position(self):
+        for query, offset in [('a and', 6),
+                              ('a or or b', 6),
+                              ('(a or b', 8),
+                              ('a b not c', 5)]:
+            try:
+                parse(query, GlobRule)
+            except SyntaxError as e:
+                assert e.offset == offset, (query, e.offset)
+                assert e.text == query
+            else:
+                self.fail('{0} must not be parsed'.format(repr(query)))
+
+    def test_immutable(self):
+        a, b = GlobRule('a'), GlobRule('b')
+        rule = a & b
+        other = rule & GlobRule('c')
+        assert len(rule.rules) == 2
+        assert len(other.rules) == 3
@@ -6,6 +6,12 @@ except ImportError:
 from salt.targeting import *
 
 
+class MinionMock(object):
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
 class QueryTestCase(unittest.TestCase):
     def test_glob(self):
         matcher = minion_targeting.parse_glob('foo and bar')
@@ -53,3 +59,69 @@ class QueryTestCase(unittest.TestCase):
 
         with self.assertRaises(SyntaxError):
             matcher = minion_targeting.parse('G@foo:   bar baz) and ')
+
+    def test_cache(self):
+        query = Query(default_rule=GlobRule, cache_size=2)
+        query.register(GrainRule, 'G')
+
+        first = query.parse('G@os:Ubuntu and web*')
+        assert query.parse('G@os:Ubuntu   and web*') is first
+        assert (query.cache.hits, query.cache.misses) == (1, 1)
+
+        # opts are part of the key
+        assert query.parse('G@os:Ubuntu and web*', delim='/') is not first
+        query.parse('foo')
+        assert query.cache.evictions == 1
+
+        # registering clears the cache
+        query.register(PillarRule, 'I')
+        assert len(query.cache) == 0
+        assert query.parse('G@os:Ubuntu and web*') == first
+
+    def test_exsel_opts(self):
+        query = Query(default_rule=GlobRule, exsel_timeout=5)
+        query.register(ExselRule, 'X')
+        rule = query.parse('X@test.ping')
+        assert (rule.workers, rule.timeout) == (4, 5)
+        rule = query.parse('X@test.ping', exsel_workers=16)
+        assert (rule.workers, rule.timeout) == (16, 5)
+
+    def test_cache_macros(self):
+        query = Query(default_rule=GlobRule)
+        query.register(NodeGroupEvaluator, 'N')
+        assert query.parse('N@foo', macros={'foo': 'bar'}) == GlobRule('bar')
+        assert query.parse('N@foo', macros={'foo': 'baz'}) == GlobRule('baz')
+
+    def test_explain(self):
+        query = Query(default_rule=GlobRule)
+        query.register(GrainRule, 'G')
+        query.register(PCRERule, 'E')
+        minions = [MinionMock(id='web{0}'.format(i),
+                              grains={'os': 'Ubuntu'} if i % 3 else None)
+                   for i in range(6)]
+        text = 'web* and not (E@db.* or db1 or G@os:Redhat) and G@os:Ubuntu'
+
+        plan = query.explain(text)
+        assert plan.label == 'and'
+        assert [child.label for child in plan.children] == \
+            ['web*', 'G@os:Ubuntu', 'not']
+        assert [child.order for child in plan.children] == [1, 2, 3]
+        assert [child.index for child in plan.children] == \
+            ['ids', 'paths', None]
+        assert plan.children[0].cost is None
+        merged = plan.children[2].children[0]
+        assert [(child.label, child.index) for child in merged.children] == \
+            [('db1', 'merged'), ('E@db.*', 'merged'), ('G@os:Redhat', 'paths')]
+        assert [child.index for child in
+                query.explain('web*', minions).walk()] == ['scan']
+
+        plan = query.explain(text, Fleet(minions), analyze=True)
+        assert plan.trace.objs_in == 6
+        assert plan.trace.objs_out == 6
+        assert plan.trace.doubtful == 2
+        grain = plan.children[1]
+        assert (grain.trace.objs_in, grain.trace.objs_out) == (6, 6)
+        assert 'in=6 out=6 doubtful=2' in str(plan).splitlines()[0]
+
+        with self.assertRaises(ValueError):
+            query.explain(text, analyze=True)
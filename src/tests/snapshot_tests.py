@@ -0,0 +1,121 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import os
+import shutil
+import tempfile
+
+from salt.targeting import *
+from salt.targeting.rules import evaluation
+
+from mocks import MinionMock, make_minions
+
+
+class ProviderMock(object):
+    def get(self, expr):
+        return ['web1.example.com', 'unknown.example.com']
+
+
+class FleetSnapshotTestCase(unittest.TestCase):
+    def test_columns(self):
+        snapshot = FleetSnapshot(make_minions())
+        assert len(snapshot) == 5
+        assert snapshot.ids == ['web1', 'web2', 'db1', 'db2', 'misc']
+        assert list(snapshot.ipv4_owners) == [0, 1, 2, 0]
+        column = snapshot.columns['grains'][('roles',)]
+        assert list(column.positions) == [0, 0, 0, 2, 2]
+        assert len(snapshot.strings) == len(set(snapshot.strings.strings))
+        assert snapshot.subjects(snapshot.missing['grains']) == set(['db2'])
+
+    queries = ['G@os:Ubuntu',
+               'G@os:Ubu*',
+               'G@roles:db and not G@os:Redhat',
+               'I@user:name:admin or G@cpus:8',
+               'not (G@os:Ubuntu* and I@user:name:root)',
+               'P@os:(Red|Ubu).*',
+               'L@web1,db*,E@mi.c',
+               'S@10.0.0.0/16 and not web1',
+               'S@10.1.0.1 or S@garbage',
+               'R@%web and *1',
+               'web* and not G@roles:web']
+
+    def targeting(self):
+        targeting = Query(default_rule=GlobRule, provider=ProviderMock())
+        targeting.register(GlobRule, None, 'glob')
+        targeting.register(GrainRule, 'G', 'grain')
+        targeting.register(PillarRule, 'I', 'pillar')
+        targeting.register(PCRERule, 'E', 'pcre')
+        targeting.register(GrainPCRERule, 'P', 'grain_pcre')
+        targeting.register(SubnetIPRule, 'S')
+        targeting.register(YahooRangeRule, 'R')
+        targeting.register(ListEvaluator, 'L', 'list')
+        return targeting
+
+    def test_check(self):
+        minions = make_minions()
+        snapshot = FleetSnapshot(minions)
+        targeting = self.targeting()
+        for query in self.queries:
+            rule = targeting.parse(query)
+            expected = set(obj.id for obj in rule.check(minions))
+            assert rule.check_fleet(snapshot) == expected, query
+
+    def test_ambiguous(self):
+        minions = make_minions() + [
+            MinionMock(id='empty', fqdn=None, ipv4=None,
+                       grains={'os:Ubuntu': '', 'os': 'Ubuntu'}, pillar={}),
+            MinionMock(id='nested', fqdn=None, ipv4=None,
+                       grains={'a': {'b': [0, 1]}, 'os': ['Ubuntu']},
+                       pillar={'user': {'name:admin': 0}}),
+        ]
+        snapshot = FleetSnapshot(minions)
+        targeting = self.targeting()
+        for query in self.queries + ['G@a:b', 'not G@a:b', 'G@a:b:1',
+                                     'not G@os:Ubuntu', 'not I@user:name:*']:
+            rule = targeting.parse(query)
+            with evaluation():
+                expected, unknown = rule.select(minions)
+                matched, doubtful = rule.bitmap(snapshot)
+            expected = set(obj.id for obj in expected)
+            unknown = set(obj.id for obj in unknown)
+            # the snapshot may be unsure, but never wrong
+            assert snapshot.subjects(matched) <= expected, query
+            assert expected | unknown <= \
+                snapshot.subjects(matched | doubtful), query
+
+    def test_dump(self):
+        minions = make_minions()
+        snapshot = FleetSnapshot(minions)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'fleet.snapshot')
+            snapshot.dump(path)
+            snapshot.dump(path)
+            assert os.listdir(tmpdir) == ['fleet.snapshot']
+            mapped = FleetSnapshot.load(path)
+            assert list(mapped.ids) == snapshot.ids
+            assert mapped.missing == snapshot.missing
+            assert mapped.strings.get('web1.example.com') == \
+                snapshot.strings.get('web1.example.com')
+            assert mapped.strings.get('unknown') is None
+
+            targeting = self.targeting()
+            for query in self.queries:
+                rule = targeting.parse(query)
+                expected = set(obj.id for obj in rule.check(minions))
+                assert rule.check_fleet(mapped) == expected, query
+
+            with open(path, 'wb') as fh:
+                fh.write(b'garbage')
+            self.assertRaises(ValueError, FleetSnapshot.load, path)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_undecidable(self):
+        snapshot = FleetSnapshot(make_minions())
+        rule = minion_targeting.parse('X@test.ping and web1')
+        assert rule.check_fleet(snapshot) == set(['web1'])
+        rule = minion_targeting.parse('not D@foo:bar')
+        assert len(rule.check_fleet(snapshot)) == 5
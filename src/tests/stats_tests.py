@@ -0,0 +1,63 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from salt.targeting import *
+from salt.targeting.stats import MAX_SAMPLES, MIN_SAMPLES, RuleStats
+
+from mocks import make_fleet
+
+
+class RuleStatsTestCase(unittest.TestCase):
+    def test_record(self):
+        stats = RuleStats()
+        assert stats.cost == 0.0 and stats.selectivity == 1.0
+        stats.record(10, 2, 3, 0.5)
+        assert stats.cost == 0.05
+        assert stats.selectivity == 0.5
+        assert stats.hit_rate == 0.2
+
+        stats.record(MAX_SAMPLES, 0, 0, 0.0)
+        assert stats.samples == (MAX_SAMPLES + 10) // 2
+        assert stats.matched == 1
+
+    def test_all_order(self):
+        common = PillarRule('role:*', ':')
+        rare = PillarRule('role:db', ':')
+        rule = common & rare
+        static = list(rule)
+        assert rule.ordered() == static
+
+        minions = make_fleet(2 * MIN_SAMPLES)
+        assert len(rule.check(minions)) == MIN_SAMPLES
+        assert rare.stats.samples >= MIN_SAMPLES
+        assert rare.stats.selectivity == 0.5
+        # the rule which discards subjects is now evaluated first
+        assert rule.ordered() == [rare, common]
+        # ordering does not change the rendering of rules
+        assert list(rule) == static
+
+    def test_any_order(self):
+        rare = PillarRule('role:admin', ':')
+        common = PillarRule('role:web', ':')
+        rule = rare | common
+        minions = make_fleet(2 * MIN_SAMPLES)
+        assert len(rule.check(minions)) == MIN_SAMPLES
+        assert rule.ordered() == [common, rare]
+
+    def test_fleet_order(self):
+        common = PillarRule('role:*', ':')
+        rare = PillarRule('role:db', ':')
+        rule = common & rare
+        fleet = Fleet(make_fleet(2 * MIN_SAMPLES))
+        assert len(rule.check_fleet(fleet)) == MIN_SAMPLES
+        assert rule.ordered() == [rare, common]
+
+    def test_generator(self):
+        minions = make_fleet(3)
+        rule = PillarRule('role:web', ':') & -GlobRule('db*')
+        assert rule.check(minion for minion in minions) == \
+            set(minions[::2])
+        assert (-rule).check(minion for minion in minions) == \
+            set(minions[1::2])
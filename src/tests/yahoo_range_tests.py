@@ -0,0 +1,221 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+try:
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from SocketServer import ThreadingMixIn
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from salt._compat import BaseHTTPServer, url_unquote
+from salt.targeting.rules import YahooRangeRule
+from salt.utils.yahoo_range import CachedProvider, LocalProvider
+from salt.utils.yahoo_range import RangeException, Server
+
+
+class MinionMock(object):
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+CLUSTERS = {
+    '%web': ['web1.example.com', 'web2.example.com', 'web3.example.com'],
+    '%db': ['db1.example.com'],
+}
+
+
+class RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        query = url_unquote(self.path.partition('?')[2])
+        time.sleep(self.server.delay)
+        hosts = []
+        for expr in query.split(','):
+            hosts.extend(CLUSTERS.get(expr, [expr]))
+        body = ''.join(host + '\n' for host in hosts).encode('utf-8')
+        self.send_response(200)
+        if 'error' in query:
+            self.send_header('RangeException', 'NO_CLUSTER')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RangeServer(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    delay = 0
+    connections = 0
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.httpd = RangeServer(('127.0.0.1', 0), RangeHandler)
+        self.httpd.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.host = '127.0.0.1:{0}'.format(self.httpd.server_address[1])
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def test_chunks(self):
+        server = Server(self.host, batch_size=10)
+        assert list(server.chunks('a,b,c')) == ['a,b,c']
+        assert list(server.chunks('aaaa,bbbb,cccc,dd')) == \
+            ['aaaa,bbbb', 'cccc,dd']
+        assert list(server.chunks('aaaaaaaaaaaa,b')) == ['aaaaaaaaaaaa', 'b']
+        assert list(server.chunks('aaaaaaaaaaaa')) == ['aaaaaaaaaaaa']
+
+    def test_get(self):
+        server = Server(self.host, batch_size=10, workers=2)
+        for i in range(3):
+            hosts = list(server.get('%web,%db,foo.example.com'))
+            assert sorted(hosts) == sorted(CLUSTERS['%web'] +
+                                           CLUSTERS['%db'] +
+                                           ['foo.example.com'])
+        # connections are kept alive between requests
+        assert self.httpd.connections <= 2
+        assert server.pool.created == self.httpd.connections
+        server.close()
+
+    def test_concurrency(self):
+        self.httpd.delay = 0.3
+        server = Server(self.host, batch_size=4, workers=4)
+        started = time.time()
+        hosts = list(server.get('%web,%db,host,%web'))
+        assert time.time() - started < 0.9
+        assert len(hosts) == 8
+        server.close()
+
+    def test_errors(self):
+        server = Server(self.host)
+        self.assertRaises(RangeException, list, server.get('%error'))
+        server = Server('127.0.0.1:1')
+        self.assertRaises(RangeException, list, server.get('%web'))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class ProviderMock(object):
+    def __init__(self):
+        self.calls = []
+        self.hosts = ['web1.example.com', 'web2.example.com']
+        self.refreshed = threading.Event()
+
+    def get(self, expr):
+        self.calls.append(expr)
+        self.refreshed.set()
+        return iter(self.hosts)
+
+
+class CachedProviderTestCase(unittest.TestCase):
+    def test_get(self):
+        clock, provider = Clock(), ProviderMock()
+        cache = CachedProvider(provider, ttl=10, stale=20, maxsize=2,
+                               timer=clock)
+        hosts = cache.get('%web')
+        assert hosts == frozenset(provider.hosts)
+        assert cache.get('%web') is hosts
+        assert provider.calls == ['%web']
+
+        # stale results are served while they are refreshed
+        clock.now = 15
+        provider.hosts = ['web3.example.com']
+        provider.refreshed.clear()
+        assert cache.get('%web') is hosts
+        provider.refreshed.wait(5)
+        for i in range(50):
+            if cache.get('%web') != hosts:
+                break
+            time.sleep(0.01)
+        assert cache.get('%web') == frozenset(['web3.example.com'])
+        assert len(provider.calls) == 2
+
+        # expired results are fetched again
+        clock.now = 100
+        provider.hosts = ['web4.example.com']
+        assert cache.get('%web') == frozenset(['web4.example.com'])
+
+        cache.get('%db')
+        cache.get('%other')
+        assert '%web' not in cache.cache
+
+    def test_rule(self):
+        provider = ProviderMock()
+        rule = YahooRangeRule('%web', CachedProvider(provider))
+        minions = [MinionMock(id=str(i), fqdn='web{0}.example.com'.format(i))
+                   for i in range(5)]
+        assert rule.check(minions) == set(minions[1:3])
+        assert all(rule.match(minion) for minion in minions[1:3])
+        assert provider.calls == ['%web']
+
+
+class LocalProviderTestCase(unittest.TestCase):
+    clusters = {
+        'web': {'CLUSTER': ['web1.example.com', 'web2.example.com',
+                            'web-3.example.com'],
+                'DOWN': 'web2.example.com'},
+        'db': {'CLUSTER': ['db1.example.com', '%web:DOWN']},
+        'all': {'CLUSTER': ['%web', '%db']},
+        'loop': {'CLUSTER': ['%loop:OTHER'], 'OTHER': ['%loop']},
+    }
+
+    def test_get(self):
+        provider = LocalProvider(self.clusters)
+        assert provider.get('%db') == \
+            frozenset(['db1.example.com', 'web2.example.com'])
+        assert provider.get('%all') == \
+            frozenset(['db1.example.com', 'web1.example.com',
+                       'web2.example.com', 'web-3.example.com'])
+        assert provider.get('%web,-%web:DOWN') == \
+            frozenset(['web1.example.com', 'web-3.example.com'])
+        assert provider.get('%web&%db') == frozenset(['web2.example.com'])
+        assert provider.get('%all,&%db,foo') == \
+            frozenset(['db1.example.com', 'web2.example.com', 'foo'])
+        assert ('all', 'CLUSTER') in provider.memo
+        self.assertRaises(RangeException, provider.get, '%unknown')
+        self.assertRaises(RangeException, provider.get, '%loop')
+
+    def test_yaml(self):
+        try:
+            import yaml
+        except ImportError:
+            return
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name, cluster in self.clusters.items():
+                path = os.path.join(tmpdir, name + '.yaml')
+                with open(path, 'w') as fh:
+                    yaml.safe_dump(cluster, fh)
+            provider = LocalProvider(path=tmpdir)
+            rule = YahooRangeRule('%web,-%db', provider)
+            minions = [MinionMock(id='a', fqdn='web1.example.com'),
+                       MinionMock(id='b', fqdn='web2.example.com')]
+            assert rule.check(minions) == set(minions[:1])
+        finally:
+            shutil.rmtree(tmpdir)